@@ -1,6 +1,18 @@
+import argparse
+import heapq
+import math
 import re
 from collections import defaultdict, Counter
+from concurrent.futures import ProcessPoolExecutor
 import os
+import sys
+
+# 可选：耗时统计复用仓库中与本脚本同级的 logcheck/latency.py，单独使用本脚本时不统计耗时
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logcheck'))
+try:
+    from latency import QUANTILES, LatencyAnalyzer, format_seconds, latency_rows, request_timings
+except ImportError:
+    LatencyAnalyzer = None
 
 # 定义日志文件路径和报告输出路径
 LOG_FILE_PATH = ''
@@ -9,6 +21,7 @@ REPORT_FILE_PATH = ''
 # 定义正则表达式用于解析日志
 LOG_PATTERN = re.compile(
     r'(?P<ip>\S+) \S+ \S+ \[(?P<time>.*?)\] "(?P<method>\S+) (?P<url>\S+) \S+" (?P<status>\d{3}) (?P<size>\d+|-) "(?P<referer>.*?)" "(?P<user_agent>.*?)"'
+    r'(?P<tail>.*)'  # 用户代理之后的自定义字段，如 rt=$request_time urt="$upstream_response_time"
 )
 
 # 初始化统计数据结构
@@ -19,9 +32,18 @@ resource_type_counter = Counter()
 status_code_counter = Counter()
 user_agent_counter = Counter()
 response_size = []
-url_counter = Counter()
+url_counter = Counter()    # 按路由模板计数
+route_bytes = Counter()    # 各路由模板的响应字节数
+route_errors = Counter()   # 各路由模板的 4xx/5xx 次数
 error_urls = []
 crawler_ips = set()
+# 日志中有 $request_time 等字段时按路由模板、上游统计耗时；没有 latency 模块时为 None
+latency = LatencyAnalyzer() if LatencyAnalyzer else None
+
+# 近似模式（--approx）的默认参数
+TOP_CAPACITY = 10000      # IP、路由、User-Agent 各自最多跟踪的条目数
+ERROR_URL_LIMIT = 1000    # 最多记录的不同错误URL数
+SIZE_ACCURACY = 0.01      # 响应大小分位数的相对误差
 
 # 定义搜索引擎爬虫的User-Agent关键字
 SEARCH_BOTS = {
@@ -40,6 +62,196 @@ RESOURCE_TYPES = {
     '/statics/img/': '静态资源'
 }
 
+# URL 路由模板：路径段（按 . 拆开的每一部分）的识别规则，按顺序匹配
+ROUTE_PART_PATTERNS = [
+    (re.compile(r'(?=[-_]*\d)[\d_-]+'), '{id}'),                                # 123、5-1-3、1-----2---
+    (re.compile(r'(?=[a-fA-F]*\d)[0-9a-fA-F]{8,}'), '{hash}'),                   # 长的十六进制串
+    (re.compile(r'(?=[\w-]*\d)(?=[\w-]*[A-Za-z])[\w-]{20,}'), '{token}'),       # 字母数字混合的长串
+]
+# 按条目上传的图片、视频分片：子目录中只保留扩展名（{file}.jpg）
+PER_ITEM_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp', 'svg', 'm3u8', 'ts', 'mp4', 'flv'}
+# 路径 -> 路由模板缓存的条目上限，缓存满后清空重来
+ROUTE_CACHE_SIZE = 65536
+route_cache = {}
+
+class SpaceSaving:
+    """
+    Space-Saving 高频项统计，最多跟踪 capacity 个键，内存与输入规模无关。
+    用法与 Counter 相同（c[key] += n）：新键在已满时替换当前计数最小的键，
+    继承其计数作为误差。每个键的计数只会高估，真实次数在 [计数 - 误差, 计数] 之间，
+    误差不超过 total / capacity；真实次数超过 total / capacity 的键一定会被保留。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+        # (计数, 键) 最小堆，每个键一项；计数只增不减，堆中的值可能偏小，取最小值时再修正
+        self.heap = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __getitem__(self, key):
+        return self.counts.get(key, 0)
+
+    def __setitem__(self, key, value):
+        counts = self.counts
+        current = counts.get(key)
+        if current is not None:
+            self.total += value - current
+            counts[key] = value
+            return
+        self.total += value
+        floor = 0
+        if len(counts) >= self.capacity:
+            floor = self.floor()
+            _, victim = heapq.heappop(self.heap)
+            del counts[victim]
+            del self.errors[victim]
+        counts[key] = floor + value
+        self.errors[key] = floor
+        heapq.heappush(self.heap, (floor + value, key))
+
+    def floor(self):
+        """未被跟踪的键可能达到的最大次数：未满时为 0，已满时为当前最小计数"""
+        if len(self.counts) < self.capacity:
+            return 0
+        heap = self.heap
+        while True:
+            stored, key = heap[0]
+            current = self.counts[key]
+            if stored == current:
+                return current
+            heapq.heapreplace(heap, (current, key))
+
+    def error(self, key):
+        return self.errors.get(key, self.floor())
+
+    def most_common(self, n=None):
+        if n is None:
+            return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])
+
+    def update(self, other):
+        """合并另一段日志的统计结果，合并后误差上界仍为 total / capacity"""
+        floor, other_floor = self.floor(), other.floor()
+        merged = {}
+        for key in {**self.counts, **other.counts}:
+            merged[key] = (self.counts.get(key, floor) + other.counts.get(key, other_floor),
+                           self.errors.get(key, floor) + other.errors.get(key, other_floor))
+        kept = heapq.nlargest(self.capacity, merged.items(), key=lambda item: item[1][0])
+        self.counts = {key: count for key, (count, _) in kept}
+        self.errors = {key: error for key, (_, error) in kept}
+        self.heap = [(count, key) for key, count in self.counts.items()]
+        heapq.heapify(self.heap)
+        self.total += other.total
+
+    def clear(self):
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+        self.heap = []
+
+class SizeHistogram:
+    """
+    响应大小的对数分桶直方图（DDSketch 式）：桶边界按 gamma = (1+a)/(1-a) 的幂增长，
+    分位数的相对误差不超过 accuracy，桶数只与数值范围有关（1 字节到 1TB 约 1400 个桶）。
+    次数、总和、最小值、最大值是精确的。用法与列表相同（append）。
+    """
+
+    def __init__(self, accuracy=SIZE_ACCURACY):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = Counter()
+        self.clear()
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if value <= 0:
+            self.zeros += 1
+        else:
+            self.buckets[math.ceil(math.log(value) / self.log_gamma)] += 1
+
+    def quantile(self, q):
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                estimate = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def update(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.zeros += other.zeros
+        self.buckets.update(other.buckets)
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def clear(self):
+        self.count = 0
+        self.total = 0
+        self.zeros = 0
+        self.min = None
+        self.max = None
+        self.buckets.clear()
+
+class BoundedSet:
+    """按首次出现顺序最多保留 limit 个不同的值，之后新出现的值只计数不保存。用法与列表相同（append）"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.items = {}
+        self.dropped = 0
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def append(self, item):
+        if item in self.items:
+            return
+        if len(self.items) < self.limit:
+            self.items[item] = None
+        else:
+            self.dropped += 1
+
+    def update(self, other):
+        for item in other.items:
+            self.append(item)
+        self.dropped += other.dropped
+
+    def clear(self):
+        self.items = {}
+        self.dropped = 0
+
+def use_approx_stats(capacity=TOP_CAPACITY, error_url_limit=ERROR_URL_LIMIT):
+    """近似模式：IP、路由、User-Agent、响应大小和错误URL改用内存有界的统计结构"""
+    global ip_counter, user_agent_counter, url_counter, route_bytes, route_errors, response_size, error_urls
+    ip_counter = SpaceSaving(capacity)
+    user_agent_counter = SpaceSaving(capacity)
+    url_counter = SpaceSaving(capacity)
+    route_bytes = SpaceSaving(capacity)
+    route_errors = SpaceSaving(capacity)
+    response_size = SizeHistogram()
+    error_urls = BoundedSet(error_url_limit)
+
 def classify_visitor(user_agent):
     for bot, identifier in SEARCH_BOTS.items():
         if identifier.lower() in user_agent.lower():
@@ -52,69 +264,207 @@ def classify_resource(url):
             return resource_type
     return '其他资源'
 
+def template_part(part):
+    for pattern, placeholder in ROUTE_PART_PATTERNS:
+        if pattern.fullmatch(part):
+            return placeholder
+    return part
+
+def template_segment(segment):
+    return '.'.join(map(template_part, segment.split('.')))
+
+def route_template(url):
+    """
+    /video/123.html?from=1 -> /video/{id}.html：去掉查询串，RESOURCE_TYPES 的路径前缀保持原样，
+    其余路径段中的编号、哈希等按 ROUTE_PART_PATTERNS 替换
+    """
+    path = url.split('?', 1)[0].split('#', 1)[0]
+    route = route_cache.get(path)
+    if route is not None:
+        return route
+    if len(route_cache) >= ROUTE_CACHE_SIZE:
+        route_cache.clear()
+    prefix = next((prefix for prefix in RESOURCE_TYPES if path.startswith(prefix)), '')
+    *directories, name = path[len(prefix):].split('/')
+    stem, dot, extension = name.rpartition('.')
+    if not dot:
+        name = template_segment(name)
+    elif extension.lower() in PER_ITEM_EXTENSIONS and path.count('/') > 1:
+        name = '{file}.' + extension
+    else:
+        name = template_segment(stem) + '.' + extension  # 扩展名保留原样
+    segments = [template_segment(directory) for directory in directories] + [name]
+    route = route_cache[path] = prefix + '/'.join(segments) or '/'
+    return route
+
 def parse_log_line(line):
     match = LOG_PATTERN.match(line)
     if match:
         return match.groupdict()
     return None
 
-def analyze_log():
-    with open(LOG_FILE_PATH, 'r', encoding='utf-8') as f:
-        for line in f:
-            parsed = parse_log_line(line)
+def record_line(parsed):
+    ip = parsed['ip']
+    method = parsed['method']
+    url = parsed['url']
+    status = parsed['status']
+    size = parsed['size']
+    user_agent = parsed['user_agent']
+    
+    # 更新IP计数
+    ip_counter[ip] += 1
+    
+    # 分类访问者类型
+    visitor_type = classify_visitor(user_agent)
+    visitor_type_counter[visitor_type] += 1
+    
+    # 如果是爬虫，添加到爬虫IP集合
+    if visitor_type in SEARCH_BOTS:
+        crawler_ips.add(ip)
+    
+    # 更新请求方法计数
+    method_counter[method] += 1
+    
+    # 分类请求资源类型
+    resource_type = classify_resource(url)
+    resource_type_counter[resource_type] += 1
+    
+    # 更新状态码计数
+    status_code_counter[status] += 1
+    
+    # 更新User-Agent计数
+    user_agent_counter[user_agent] += 1
+    
+    # 按路由模板更新URL计数、流量和错误次数
+    route = route_template(url)
+    url_counter[route] += 1
+    if status[0] in '45':
+        route_errors[route] += 1
+    
+    # 检查错误状态码
+    if status.startswith('5'):
+        error_urls.append(url)
+    
+    # 处理响应大小
+    if size != '-':
+        size = int(size)
+        response_size.append(size)
+        route_bytes[route] += size
+    
+    # 统计响应耗时
+    if latency is not None:
+        timings = request_timings(parsed['tail'])
+        if timings is not None:
+            latency.add(route, timings)
+
+def split_ranges(path, parts):
+    """把日志文件按字节切分成最多 parts 段，每段边界都对齐到行首"""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            pos = size * i // parts
+            if pos <= bounds[-1]:
+                continue
+            f.seek(pos)
+            f.readline()  # 跳到下一行行首
+            pos = f.tell()
+            if pos >= size:
+                break
+            bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+def stats_snapshot():
+    # latency 为 None 时各进程都是 None，合并时跳过
+    return (ip_counter, visitor_type_counter, method_counter, resource_type_counter,
+            status_code_counter, user_agent_counter, url_counter, route_bytes, route_errors,
+            response_size, error_urls, crawler_ips, latency)
+
+def analyze_range(path, start, end, approx=None):
+    """工作进程入口：统计 [start, end) 范围内的日志，返回可合并的部分统计结果"""
+    if approx and not isinstance(ip_counter, SpaceSaving):
+        use_approx_stats(*approx)
+    # 进程池会复用工作进程，每段开始前先清空上一段的统计
+    for stats in stats_snapshot():
+        if stats is not None:
+            stats.clear()
+    offset = start
+    with open(path, 'rb') as f:
+        f.seek(start)
+        for raw_line in f:
+            if offset >= end:
+                break
+            offset += len(raw_line)
+            parsed = parse_log_line(raw_line.decode('utf-8'))
             if parsed:
-                ip = parsed['ip']
-                method = parsed['method']
-                url = parsed['url']
-                status = parsed['status']
-                size = parsed['size']
-                user_agent = parsed['user_agent']
-                
-                # 更新IP计数
-                ip_counter[ip] += 1
-                
-                # 分类访问者类型
-                visitor_type = classify_visitor(user_agent)
-                visitor_type_counter[visitor_type] += 1
-                
-                # 如果是爬虫，添加到爬虫IP集合
-                if visitor_type in SEARCH_BOTS:
-                    crawler_ips.add(ip)
-                
-                # 更新请求方法计数
-                method_counter[method] += 1
-                
-                # 分类请求资源类型
-                resource_type = classify_resource(url)
-                resource_type_counter[resource_type] += 1
-                
-                # 更新状态码计数
-                status_code_counter[status] += 1
-                
-                # 更新User-Agent计数
-                user_agent_counter[user_agent] += 1
-                
-                # 更新URL计数
-                url_counter[url] += 1
-                
-                # 检查错误状态码
-                if status.startswith('5'):
-                    error_urls.append(url)
-                
-                # 处理响应大小
-                if size != '-':
-                    response_size.append(int(size))
+                record_line(parsed)
+    return stats_snapshot()
+
+def merge_stats(partial):
+    """按日志顺序合并部分统计结果，Counter 的键顺序与单进程统计一致"""
+    for stats, part in zip(stats_snapshot(), partial):
+        if isinstance(stats, list):
+            stats.extend(part)
+        elif stats is None:
+            continue
+        elif stats is latency:
+            stats.merge(part)
+        else:
+            stats.update(part)
+
+def analyze_log(jobs=1, approx=None):
+    if jobs <= 1:
+        with open(LOG_FILE_PATH, 'r', encoding='utf-8') as f:
+            for line in f:
+                parsed = parse_log_line(line)
+                if parsed:
+                    record_line(parsed)
+        return
+
+    ranges = split_ranges(LOG_FILE_PATH, jobs * 2)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(analyze_range, LOG_FILE_PATH, start, end, approx) for start, end in ranges]
+        for future in futures:
+            merge_stats(future.result())
+
+def with_lower_bound(counter, key, count):
+    """近似模式下在计数后注明真实次数的保证下限"""
+    if isinstance(counter, SpaceSaving):
+        return f"{count}（至少 {count - counter.error(key)}）"
+    return count
+
+def write_approx_notes(report):
+    """说明近似模式下各项统计的误差上界"""
+    report.write("## 近似统计说明\n\n")
+    report.write("本报告使用近似模式（--approx）生成，内存占用与日志规模无关：\n\n")
+    for name, counter in (("IP", ip_counter), ("路由", url_counter), ("User-Agent", user_agent_counter)):
+        bound = counter.total / counter.capacity
+        report.write(f"- {name}：Space-Saving 最多跟踪 {counter.capacity} 项，共 {counter.total} 次；"
+                     f"每项计数最多高估 {max(counter.errors.values(), default=0)} 次（理论上界 总次数/跟踪项数 = {bound:.1f}），"
+                     f"真实次数超过该上界的项一定会列出\n")
+    report.write("- 路由的流量、错误次数：按字节数、错误次数各用一个 Space-Saving 统计，"
+                 "未被跟踪的路由记为 0，已跟踪的最多高估其误差\n")
+    report.write(f"- 响应大小：对数分桶直方图，平均值、最大值、最小值精确，"
+                 f"分位数相对误差不超过 {response_size.accuracy:.0%}\n")
+    report.write(f"- 错误URL：最多列出 {error_urls.limit} 个不同的URL\n")
+    if latency is not None and latency.routes:
+        report.write("- 响应耗时：对数分桶直方图，分位数相对误差不超过 5%\n")
+    report.write("\n")
 
 def generate_report():
+    approx = isinstance(ip_counter, SpaceSaving)
     with open(REPORT_FILE_PATH, 'w', encoding='utf-8') as report:
         report.write("# 服务器日志分析报告\n\n")
+        if approx:
+            write_approx_notes(report)
         
         # 访问来源分析
         report.write("## 一、访问来源分析\n\n")
         report.write("### 1. IP地址分布\n\n")
         for ip, count in ip_counter.most_common(10):
             crawler_flag = "（爬虫IP）" if ip in crawler_ips else ""
-            report.write(f"- {ip}: {count} 次访问 {crawler_flag}\n")
+            report.write(f"- {ip}: {with_lower_bound(ip_counter, ip, count)} 次访问 {crawler_flag}\n")
         report.write("\n")
         
         report.write("### 2. 访问者类型\n\n")
@@ -143,12 +493,18 @@ def generate_report():
         # User-Agent分析
         report.write("## 四、User-Agent分析\n\n")
         for agent, count in user_agent_counter.most_common(10):
-            report.write(f"- {agent}: {count} 次\n")
+            report.write(f"- {agent}: {with_lower_bound(user_agent_counter, agent, count)} 次\n")
         report.write("\n")
         
         # 响应大小分布
         report.write("## 五、响应大小分布\n\n")
-        if response_size:
+        if response_size and approx:
+            report.write(f"- 平均响应大小: {response_size.total / response_size.count:.2f} 字节\n")
+            report.write(f"- 最大响应大小: {response_size.max} 字节\n")
+            report.write(f"- 最小响应大小: {response_size.min} 字节\n")
+            for q in (0.5, 0.9, 0.99):
+                report.write(f"- P{q * 100:g} 响应大小: 约 {response_size.quantile(q):.0f} 字节\n")
+        elif response_size:
             avg_size = sum(response_size) / len(response_size)
             max_size = max(response_size)
             min_size = min(response_size)
@@ -161,19 +517,62 @@ def generate_report():
         
         # URL分析
         report.write("## 六、URL分析\n\n")
-        report.write("### 1. 高频访问URL\n\n")
-        for url, count in url_counter.most_common(10):
-            report.write(f"- {url}: {count} 次访问\n")
+        report.write("### 1. 高频访问路由\n\n")
+        report.write("| 路由 | 访问次数 | 流量（字节） | 4xx/5xx |\n")
+        report.write("|------|----------|--------------|---------|\n")
+        for route, count in url_counter.most_common(10):
+            report.write(f"| {route} | {with_lower_bound(url_counter, route, count)} | "
+                         f"{route_bytes[route]} | {route_errors[route]} |\n")
         report.write("\n")
         
         report.write("### 2. 错误状态码的URL\n\n")
-        for url in set(error_urls):
+        for url in (error_urls if approx else set(error_urls)):
             report.write(f"- {url}\n")
+        if approx and error_urls.dropped:
+            report.write(f"- ……另有 {error_urls.dropped} 次错误请求的URL超出上限未列出\n")
+        report.write("\n")
+        
+        # 响应耗时分析（没有 latency 模块或日志中没有耗时字段时不输出）
+        if latency is not None and latency.routes:
+            write_latency_section(report)
+
+def write_latency_section(report, limit=10):
+    """总耗时最多的路由（优先缓存的候选）和各上游的耗时分布"""
+    quantile_headers = ' | '.join(f"p{q * 100:g}" for q in QUANTILES)
+    sections = (("### 1. 耗时最多的路由（$request_time）", "路由", latency.routes),
+                ("### 2. 各上游耗时（$upstream_response_time）", "上游", latency.upstreams))
+    report.write("## 七、响应耗时分析\n\n")
+    for title, name, histograms in sections:
+        if not histograms:
+            continue
+        report.write(f"{title}\n\n")
+        report.write(f"| {name} | 请求次数 | {quantile_headers} | 总耗时 | 占比 |\n")
+        report.write("|------|----------|" + "-----|" * len(QUANTILES) + "--------|------|\n")
+        for key, histogram, share in latency_rows(histograms, limit):
+            label = key[1] if isinstance(key, tuple) else (key if key != '-' else '（未记录地址）')
+            quantiles = ' | '.join(format_seconds(histogram.quantile(q)) for q in QUANTILES)
+            report.write(f"| {label} | {histogram.count} | {quantiles} | {histogram.total:.1f}s | {share:.1%} |\n")
         report.write("\n")
         
 def main():
+    parser = argparse.ArgumentParser(description="服务器日志分析")
+    parser.add_argument("--jobs", type=int, default=1, help="并行解析的进程数，0 表示使用全部CPU核心")
+    parser.add_argument("--approx", action="store_true",
+                        help="近似模式：高频IP/路由/User-Agent、响应大小和错误URL使用内存有界的统计，适合超大日志")
+    parser.add_argument("--top-capacity", type=int, default=TOP_CAPACITY,
+                        help=f"近似模式下IP、路由、User-Agent各自跟踪的条目数（默认 {TOP_CAPACITY}）")
+    parser.add_argument("--error-url-limit", type=int, default=ERROR_URL_LIMIT,
+                        help=f"近似模式下最多记录的不同错误URL数（默认 {ERROR_URL_LIMIT}）")
+    args = parser.parse_args()
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    approx = None
+    if args.approx:
+        approx = (args.top_capacity, args.error_url_limit)
+        use_approx_stats(*approx)
+
     print("开始分析日志...")
-    analyze_log()
+    analyze_log(jobs, approx)
     print("日志分析完成，正在生成报告...")
     generate_report()
     print(f"报告已生成：{REPORT_FILE_PATH}")
@@ -0,0 +1,352 @@
+"""
+按时间聚合的访问统计存储（SQLite，WAL 模式）
+解析日志时按分钟汇总请求数、流量、状态码类别以及访问最多的IP和URL（按路由模板，见 routes.py），同时累加到所在的小时、天
+（并记下其中请求最多的一分钟），写入滚动存储；查询最近一天、一周的统计时直接读聚合表，不必重新读取原始日志。
+分钟数据保留 2 天、小时数据 35 天、天数据 400 天，过期的行在每次写入后清理。
+
+只在增量模式下写入（每段日志只处理一次，计数可以直接累加）；各时间粒度只保留访问最多的
+若干个IP和URL，跨多次运行累加的 Top 列表是近似值，总请求数、流量和状态码计数是精确的。
+
+另外按 (小时, 站点, 大洲) 保存独立访客的 HyperLogLog 草图（由 log_analysis.py 写入，与小时数据
+保留同样久）。草图合并是幂等的，重复写入同一段日志不会重复计数；按天、按周的独立访客由小时草图合并得出。
+
+用法: python3 aggregate_store.py [--days 1] [--level hour] [--top 10]
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from collections import Counter
+from datetime import datetime
+
+from hyperloglog import HyperLogLog, standard_error, union
+from routes import route_template
+
+AGGREGATE_DB = '/root/logcheck/log_aggregates.db'
+
+# 时间粒度 -> (桶长度秒数, 保留时长秒数, 每个桶保留的 Top IP/URL 数量)
+LEVELS = {
+    'minute': (60, 2 * 86400, 10),
+    'hour': (3600, 35 * 86400, 50),
+    'day': (86400, 400 * 86400, 100),
+}
+
+STATUS_CLASSES = ('s1xx', 's2xx', 's3xx', 's4xx', 's5xx')
+
+# 小时、天按本地时间对齐（如 UTC+8 的一天从本地 0 点开始）
+UTC_OFFSET = int(datetime.now().astimezone().utcoffset().total_seconds())
+
+def bucket_start(epoch, size):
+    return (epoch + UTC_OFFSET) // size * size - UTC_OFFSET
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS stats (
+    level TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    requests INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    {', '.join(f'{name} INTEGER NOT NULL' for name in STATUS_CLASSES)},
+    peak INTEGER NOT NULL,
+    PRIMARY KEY (level, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS top_items (
+    level TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    item TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (level, bucket, kind, item)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS visitor_sketches (
+    bucket INTEGER NOT NULL,
+    site TEXT NOT NULL,
+    region TEXT NOT NULL,
+    sketch BLOB NOT NULL,
+    PRIMARY KEY (bucket, site, region)
+) WITHOUT ROWID;
+"""
+
+UPSERT_STATS = f"""
+INSERT INTO stats (level, bucket, requests, bytes, {', '.join(STATUS_CLASSES)}, peak)
+VALUES (?, ?, ?, ?, {', '.join('?' for _ in STATUS_CLASSES)}, ?)
+ON CONFLICT (level, bucket) DO UPDATE SET
+    requests = requests + excluded.requests,
+    bytes = bytes + excluded.bytes,
+    {', '.join(f'{name} = {name} + excluded.{name}' for name in STATUS_CLASSES)},
+    peak = CASE WHEN level = 'minute' THEN peak + excluded.peak ELSE max(peak, excluded.peak) END
+"""
+
+UPSERT_ITEM = """
+INSERT INTO top_items (level, bucket, kind, item, count) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (level, bucket, kind, item) DO UPDATE SET count = count + excluded.count
+"""
+
+# 累加后只保留桶内计数最多的前 N 项，否则历次运行留下的行会让 Top 列表越积越多
+TRIM_ITEMS = """
+DELETE FROM top_items WHERE level = ?1 AND bucket = ?2 AND kind = ?3 AND item NOT IN (
+    SELECT item FROM top_items WHERE level = ?1 AND bucket = ?2 AND kind = ?3 ORDER BY count DESC, item LIMIT ?4)
+"""
+
+class Bucket:
+    """一个时间桶内的计数"""
+
+    __slots__ = ('requests', 'bytes', 'statuses', 'ips', 'urls')
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.statuses = [0] * len(STATUS_CLASSES)
+        self.ips = Counter()
+        self.urls = Counter()
+
+    def add(self, other):
+        self.requests += other.requests
+        self.bytes += other.bytes
+        self.statuses = [mine + theirs for mine, theirs in zip(self.statuses, other.statuses)]
+        self.ips.update(other.ips)
+        self.urls.update(other.urls)
+
+    def __getstate__(self):
+        return self.requests, self.bytes, self.statuses, self.ips, self.urls
+
+    def __setstate__(self, state):
+        self.requests, self.bytes, self.statuses, self.ips, self.urls = state
+
+class MinuteAggregator:
+    """按分钟汇总记录的分析器，供 LogEngine 分发记录"""
+
+    def __init__(self):
+        self.minutes = {}
+
+    def feed(self, record):
+        minute = record.epoch - record.epoch % 60
+        bucket = self.minutes.get(minute)
+        if bucket is None:
+            bucket = self.minutes[minute] = Bucket()
+        bucket.requests += 1
+        bucket.bytes += record.size
+        status_class = record.status // 100 - 1
+        if 0 <= status_class < len(STATUS_CLASSES):
+            bucket.statuses[status_class] += 1
+        bucket.ips[record.ip] += 1
+        bucket.urls[route_template(record.url) if record.url else record.request] += 1
+
+    def new_partial(self):
+        return MinuteAggregator()
+
+    def merge(self, partial):
+        for minute, other in partial.minutes.items():
+            bucket = self.minutes.get(minute)
+            if bucket is None:
+                self.minutes[minute] = other
+            else:
+                bucket.add(other)
+
+    def rollup(self, level):
+        """把分钟桶合并到 level 粒度，返回 {桶起始时间: Bucket}"""
+        size = LEVELS[level][0]
+        if size == 60:
+            return self.minutes
+        buckets = {}
+        for minute, other in self.minutes.items():
+            start = bucket_start(minute, size)
+            bucket = buckets.get(start)
+            if bucket is None:
+                bucket = buckets[start] = Bucket()
+            bucket.add(other)
+        return buckets
+
+class AggregateStore:
+    def __init__(self, path=AGGREGATE_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def write(self, aggregator):
+        """把本次解析的计数累加到分钟、小时、天三种粒度，在一个事务中完成。返回写入的分钟数"""
+        with self.conn:
+            minute_totals = {}
+            for level, (size, _, top) in LEVELS.items():
+                peaks = {}
+                for minute, requests in minute_totals.items():
+                    start = bucket_start(minute, size)
+                    peaks[start] = max(peaks.get(start, 0), requests)
+                for start, bucket in aggregator.rollup(level).items():
+                    # 分钟桶的 peak 就是请求数；小时、天取其中分钟的最大值，
+                    # 用累加后的分钟请求数，跨两次运行的同一分钟也能算对
+                    peak = bucket.requests if size == 60 else peaks[start]
+                    self.conn.execute(UPSERT_STATS, (level, start, bucket.requests, bucket.bytes, *bucket.statuses, peak))
+                    if size == 60:
+                        minute_totals[start] = self.conn.execute(
+                            "SELECT requests FROM stats WHERE level = 'minute' AND bucket = ?", (start,)).fetchone()[0]
+                    for kind, counter in (('ip', bucket.ips), ('url', bucket.urls)):
+                        self.conn.executemany(UPSERT_ITEM, ((level, start, kind, item, count)
+                                                            for item, count in counter.most_common(top)))
+                        self.conn.execute(TRIM_ITEMS, (level, start, kind, top))
+        return len(aggregator.minutes)
+
+    def write_sketches(self, sketches):
+        """把 {(站点, 小时, 大洲): HyperLogLog} 与库中已有的草图合并后写回，返回写入的草图数"""
+        with self.conn:
+            for (site, hour, region), sketch in sketches.items():
+                row = self.conn.execute('SELECT sketch FROM visitor_sketches WHERE bucket = ? AND site = ? AND region = ?',
+                                        (hour, site, region)).fetchone()
+                if row is not None:
+                    stored = HyperLogLog.from_bytes(row[0])
+                    stored.update(sketch)
+                    sketch = stored
+                self.conn.execute('INSERT OR REPLACE INTO visitor_sketches (bucket, site, region, sketch) VALUES (?, ?, ?, ?)',
+                                  (hour, site, region, sketch.to_bytes()))
+        return len(sketches)
+
+    def prune(self, now=None):
+        """删除超过保留时长的桶"""
+        now = int(now if now is not None else time.time())
+        with self.conn:
+            for level, (_, retention, _) in LEVELS.items():
+                for table in ('stats', 'top_items'):
+                    self.conn.execute(f'DELETE FROM {table} WHERE level = ? AND bucket < ?', (level, now - retention))
+            self.conn.execute('DELETE FROM visitor_sketches WHERE bucket < ?', (now - LEVELS['hour'][1],))
+
+    def series(self, level, start, end):
+        """[start, end) 内的各桶统计：[(桶起始时间, 请求数, 流量, 1xx..5xx), ...]"""
+        return self.conn.execute(
+            f'SELECT bucket, requests, bytes, {", ".join(STATUS_CLASSES)} FROM stats '
+            'WHERE level = ? AND bucket >= ? AND bucket < ? ORDER BY bucket', (level, start, end)).fetchall()
+
+    def totals(self, level, start, end):
+        """[start, end) 内的合计：(请求数, 流量, 1xx..5xx)"""
+        row = self.conn.execute(
+            f'SELECT sum(requests), sum(bytes), {", ".join(f"sum({name})" for name in STATUS_CLASSES)} FROM stats '
+            'WHERE level = ? AND bucket >= ? AND bucket < ?', (level, start, end)).fetchone()
+        return tuple(value or 0 for value in row)
+
+    def peak(self, level, start, end):
+        """
+        [start, end) 内每分钟请求数的峰值：(所在桶的起始时间, 每分钟请求数)，没有数据时为 None。
+        level 为 hour/day 时用各桶记录的峰值分钟，分钟数据过期后仍可查询。
+        """
+        return self.conn.execute(
+            'SELECT bucket, peak FROM stats WHERE level = ? AND bucket >= ? AND bucket < ? '
+            'ORDER BY peak DESC, bucket LIMIT 1', (level, start, end)).fetchone()
+
+    def top(self, kind, level, start, end, limit=10):
+        """[start, end) 内访问最多的 IP（kind='ip'）或 URL（kind='url'）：[(项, 次数), ...]"""
+        return self.conn.execute(
+            'SELECT item, sum(count) AS total FROM top_items WHERE level = ? AND kind = ? AND bucket >= ? AND bucket < ? '
+            'GROUP BY item ORDER BY total DESC, item LIMIT ?', (level, kind, start, end, limit)).fetchall()
+
+    def unique_visitors(self, start, end, site=None, region=None):
+        """[start, end) 内的独立访客估算值，由按小时的草图合并得出；site、region 为 None 表示不限"""
+        query = 'SELECT sketch FROM visitor_sketches WHERE bucket >= ? AND bucket < ?'
+        params = [start, end]
+        for column, value in (('site', site), ('region', region)):
+            if value is not None:
+                query += f' AND {column} = ?'
+                params.append(value)
+        return union(HyperLogLog.from_bytes(sketch) for sketch, in self.conn.execute(query, params)).count()
+
+    def visitor_keys(self, start, end):
+        """[start, end) 内出现过的站点和大洲"""
+        rows = self.conn.execute('SELECT DISTINCT site, region FROM visitor_sketches WHERE bucket >= ? AND bucket < ?',
+                                 (start, end)).fetchall()
+        return sorted({site for site, _ in rows}), sorted({region for _, region in rows})
+
+    def close(self):
+        self.conn.close()
+
+def finest_level(seconds):
+    """保留时长能覆盖 seconds 的最细粒度"""
+    for level, (_, retention, _) in LEVELS.items():
+        if retention >= seconds:
+            return level
+    return 'day'
+
+def format_bucket(epoch, level):
+    return datetime.fromtimestamp(epoch).strftime('%Y-%m-%d' if level == 'day' else '%Y-%m-%d %H:%M')
+
+def report_window(days, level):
+    """最近 days 天对应的 [start, end)，按 level 的桶对齐"""
+    size = LEVELS[level][0]
+    now = int(time.time())
+    return bucket_start(now - int(days * 86400), size), bucket_start(now, size) + size
+
+def print_report(store, days, level, top):
+    seconds = int(days * 86400)
+    if LEVELS[level][1] < seconds and finest_level(seconds) != level:
+        print(f"注意: {level} 粒度的数据只保留 {LEVELS[level][1] // 86400} 天，改用 {finest_level(seconds)} 粒度。")
+        level = finest_level(seconds)
+    start, end = report_window(days, level)
+
+    requests, total_bytes, *statuses = store.totals(level, start, end)
+    print(f"## 最近 {days:g} 天访问统计（按{ {'minute': '分钟', 'hour': '小时', 'day': '天'}[level] }聚合）\n")
+    print(f"总请求数: {requests}，总流量: {total_bytes / 1024 / 1024:.2f} MB")
+    print("状态码: " + "，".join(f"{name[1:]} {count}" for name, count in zip(STATUS_CLASSES, statuses)))
+    peak = store.peak(level, start, end)
+    if peak:
+        print(f"每分钟请求峰值: {peak[1]}（{format_bucket(peak[0], level)}）")
+
+    print(f"\n| 时间 | 请求数 | 流量(MB) | {' | '.join(name[1:] for name in STATUS_CLASSES)} |")
+    print("|------|--------|----------|" + "-----|" * len(STATUS_CLASSES))
+    for bucket, bucket_requests, bucket_bytes, *bucket_statuses in store.series(level, start, end):
+        print(f"| {format_bucket(bucket, level)} | {bucket_requests} | {bucket_bytes / 1024 / 1024:.2f} | "
+              + " | ".join(str(count) for count in bucket_statuses) + " |")
+
+    for kind, title in (('ip', 'IP'), ('url', 'URL路由')):
+        print(f"\n## 访问最多的{title}（前{top}个，近似值）\n")
+        print(f"| {title} | 次数 |")
+        print("|-----|------|")
+        for item, count in store.top(kind, level, start, end, top):
+            print(f"| {item} | {count} |")
+
+    print_unique_visitors(store, days)
+
+def print_unique_visitors(store, days):
+    """由按小时的草图合并出最近 days 天整体、每天、每个站点和大洲的独立访客数"""
+    if days * 86400 > LEVELS['hour'][1]:
+        print(f"\n注意: 独立访客草图只保留 {LEVELS['hour'][1] // 86400} 天。")
+    start, end = report_window(days, 'day')
+    sites, regions = store.visitor_keys(start, end)
+    if not sites:
+        return
+    print(f"\n## 独立访客（HyperLogLog 估算，标准误差约 {standard_error():.1%}）\n")
+    print(f"最近 {days:g} 天合计: {store.unique_visitors(start, end)}")
+    if len(sites) > 1:
+        print("按站点: " + "，".join(f"{site} {store.unique_visitors(start, end, site=site)}" for site in sites))
+    print("按大洲: " + "，".join(f"{region} {store.unique_visitors(start, end, region=region)}" for region in regions))
+    print("\n| 日期 | 独立访客 |")
+    print("|------|----------|")
+    for day in range(start, end, 86400):
+        count = store.unique_visitors(day, day + 86400)
+        if count:
+            print(f"| {format_bucket(day, 'day')} | {count} |")
+
+def main():
+    parser = argparse.ArgumentParser(description="从聚合存储查询最近的访问统计，不读取原始日志")
+    parser.add_argument('--db', default=AGGREGATE_DB, help=f'聚合数据库（默认 {AGGREGATE_DB}）')
+    parser.add_argument('--days', type=float, default=1, help='统计最近多少天')
+    parser.add_argument('--level', choices=list(LEVELS), default='hour', help='按哪种粒度列出明细')
+    parser.add_argument('--top', type=int, default=10, help='列出访问最多的IP/URL数量')
+    parser.add_argument('--peak', action='store_true', help='只输出每分钟请求峰值')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"聚合数据库 {args.db} 不存在，请先以增量模式运行 log_pipeline.py。")
+        return
+    store = AggregateStore(args.db)
+    try:
+        if args.peak:
+            level = finest_level(int(args.days * 86400))
+            peak = store.peak(level, *report_window(args.days, level))
+            print(peak[1] if peak else 0)
+        else:
+            print_report(store, args.days, args.level, args.top)
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
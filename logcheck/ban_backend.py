@@ -0,0 +1,232 @@
+"""
+批量封禁后端
+原来每封禁一个IP就启动一次 sudo fail2ban-client，IP 多时要 fork 成千上万个进程。
+这里把一批IP合并成一次操作提交：
+  ipset    - 生成 add 语句，一次 ipset restore 写入（配合一条 iptables DROP 规则）
+  nft      - 生成 add element 语句，一次 nft -f 原子提交
+  fail2ban - 一次 fail2ban-client set <jail> banip ip1 ip2 ...（按批拆分，避免参数过长）
+提交前先与已封禁的IP做差集，已经在封禁列表中的IP不再产生任何命令；解封同样只处理确实在封禁列表中的IP。
+"""
+
+import ipaddress
+import os
+import re
+import subprocess
+import time
+
+# 默认后端保持原有的 fail2ban 行为
+DEFAULT_BAN_BACKEND = 'fail2ban'
+FAIL2BAN_JAIL = 'fail2ban-nginx-cc'
+IPSET_NAME = 'logcheck_ban'
+NFT_TABLE = 'logcheck'
+
+# 已封禁列表的缓存时间（秒）；fail2ban 的封禁会到期，守护模式下需要定期重新读取
+BANNED_REFRESH_INTERVAL = 300
+# fail2ban-client 单次命令最多携带的IP数量
+FAIL2BAN_CHUNK = 500
+
+IP_TOKEN_PATTERN = re.compile(r'[0-9A-Fa-f:.]+')
+
+def normalize_ips(ips):
+    """去重并校验IP，返回 (合法IP列表（保持原顺序）, 非法条目列表)"""
+    valid = {}
+    invalid = []
+    for ip in ips:
+        ip = ip.strip()
+        try:
+            valid.setdefault(str(ipaddress.ip_address(ip)), None)
+        except ValueError:
+            invalid.append(ip)
+    return list(valid), invalid
+
+def parse_ips(text):
+    """从命令输出中取出所有IP地址"""
+    ips = set()
+    for token in IP_TOKEN_PATTERN.findall(text):
+        try:
+            ips.add(str(ipaddress.ip_address(token)))
+        except ValueError:
+            pass
+    return ips
+
+class BanBackend:
+    """
+    子类实现 list_banned()（返回当前已封禁的IP集合）、add(ips) 和 remove(ips)（一次提交一批IP），
+    调用方只使用 ban(ips) / unban(ips)。命令执行失败时抛出 subprocess.CalledProcessError 或 OSError。
+    """
+
+    name = None
+
+    def __init__(self):
+        self.banned = None
+        self.banned_at = 0.0
+
+    def run(self, command, input=None):
+        if os.geteuid() != 0:
+            command = ['sudo'] + command
+        return subprocess.run(command, input=input, check=True, capture_output=True, text=True).stdout
+
+    def known_banned(self):
+        if self.banned is None or time.time() - self.banned_at > BANNED_REFRESH_INTERVAL:
+            try:
+                self.banned = self.list_banned()
+            except subprocess.CalledProcessError:
+                # 读不到已封禁列表时（如旧版 fail2ban 不支持 get banip）整批提交，由封禁命令自身忽略重复
+                self.banned = set()
+            self.banned_at = time.time()
+        return self.banned
+
+    def ban(self, ips):
+        """封禁 ips 中尚未封禁的IP，返回本次新封禁的IP列表"""
+        ips, _ = normalize_ips(ips)
+        banned = self.known_banned()
+        new_ips = [ip for ip in ips if ip not in banned]
+        if new_ips:
+            self.add(new_ips)
+            banned.update(new_ips)
+        return new_ips
+
+    def unban(self, ips):
+        """解封 ips 中当前处于封禁状态的IP，返回本次解封的IP列表"""
+        ips, _ = normalize_ips(ips)
+        banned = self.known_banned()
+        removed = [ip for ip in ips if ip in banned]
+        if removed:
+            self.remove(removed)
+            banned.difference_update(removed)
+        return removed
+
+    def list_banned(self):
+        raise NotImplementedError
+
+    def add(self, ips):
+        raise NotImplementedError
+
+    def remove(self, ips):
+        raise NotImplementedError
+
+class Fail2banBackend(BanBackend):
+    name = 'fail2ban'
+
+    def __init__(self, jail=FAIL2BAN_JAIL):
+        super().__init__()
+        self.jail = jail
+
+    def list_banned(self):
+        return parse_ips(self.run(['fail2ban-client', 'get', self.jail, 'banip']))
+
+    def add(self, ips):
+        for start in range(0, len(ips), FAIL2BAN_CHUNK):
+            self.run(['fail2ban-client', 'set', self.jail, 'banip'] + ips[start:start + FAIL2BAN_CHUNK])
+
+    def remove(self, ips):
+        for start in range(0, len(ips), FAIL2BAN_CHUNK):
+            self.run(['fail2ban-client', 'set', self.jail, 'unbanip'] + ips[start:start + FAIL2BAN_CHUNK])
+
+class IpsetBackend(BanBackend):
+    """IPv4 和 IPv6 分别放在 <name> 和 <name>6 两个 hash:ip 集合中"""
+
+    name = 'ipset'
+
+    def __init__(self, set_name=IPSET_NAME):
+        super().__init__()
+        self.sets = {4: set_name, 6: set_name + '6'}
+        self.ready = False
+
+    def ensure_sets(self):
+        if self.ready:
+            return
+        for version, set_name in self.sets.items():
+            family = 'inet' if version == 4 else 'inet6'
+            iptables = 'iptables' if version == 4 else 'ip6tables'
+            self.run(['ipset', 'create', set_name, 'hash:ip', 'family', family, '-exist'])
+            rule = ['INPUT', '-m', 'set', '--match-set', set_name, 'src', '-j', 'DROP']
+            try:
+                self.run([iptables, '-C'] + rule)
+            except subprocess.CalledProcessError:
+                self.run([iptables, '-I'] + rule)
+        self.ready = True
+
+    def list_banned(self):
+        self.ensure_sets()
+        banned = set()
+        for set_name in self.sets.values():
+            banned |= parse_ips(self.run(['ipset', 'list', set_name, '-output', 'save']))
+        return banned
+
+    def add(self, ips):
+        self.restore('add', ips)
+
+    def remove(self, ips):
+        self.restore('del', ips)
+
+    def restore(self, action, ips):
+        self.ensure_sets()
+        script = ''.join(f"{action} {self.sets[ipaddress.ip_address(ip).version]} {ip}\n" for ip in ips)
+        self.run(['ipset', 'restore', '-exist'], input=script)
+
+class NftBackend(BanBackend):
+    """在 inet <table> 表中维护 banned4 / banned6 两个集合和一条 input 链"""
+
+    name = 'nft'
+
+    def __init__(self, table=NFT_TABLE):
+        super().__init__()
+        self.table = table
+        self.ready = False
+
+    def ensure_table(self):
+        if self.ready:
+            return
+        try:
+            self.run(['nft', 'list', 'table', 'inet', self.table])
+        except subprocess.CalledProcessError:
+            self.run(['nft', '-f', '-'], input=(
+                f"table inet {self.table} {{\n"
+                f"  set banned4 {{ type ipv4_addr; }}\n"
+                f"  set banned6 {{ type ipv6_addr; }}\n"
+                f"  chain input {{\n"
+                f"    type filter hook input priority -10; policy accept;\n"
+                f"    ip saddr @banned4 drop\n"
+                f"    ip6 saddr @banned6 drop\n"
+                f"  }}\n"
+                f"}}\n"))
+        self.ready = True
+
+    def list_banned(self):
+        self.ensure_table()
+        banned = set()
+        for set_name in ('banned4', 'banned6'):
+            output = self.run(['nft', 'list', 'set', 'inet', self.table, set_name])
+            elements = output.split('elements =', 1)
+            if len(elements) == 2:
+                banned |= parse_ips(elements[1])
+        return banned
+
+    def add(self, ips):
+        self.apply('add', ips)
+
+    def remove(self, ips):
+        self.apply('delete', ips)
+
+    def apply(self, action, ips):
+        self.ensure_table()
+        groups = {4: [], 6: []}
+        for ip in ips:
+            groups[ipaddress.ip_address(ip).version].append(ip)
+        script = ''.join(f"{action} element inet {self.table} banned{version} {{ {', '.join(group)} }}\n"
+                         for version, group in groups.items() if group)
+        # nft -f 中的所有语句在一个事务中提交
+        self.run(['nft', '-f', '-'], input=script)
+
+BAN_BACKENDS = {backend.name: backend for backend in (Fail2banBackend, IpsetBackend, NftBackend)}
+
+def add_ban_arguments(parser, default=DEFAULT_BAN_BACKEND):
+    parser.add_argument('--ban-backend', choices=sorted(BAN_BACKENDS), default=default,
+                        help=f'封禁方式（默认 {default}），一批IP合并为一次操作')
+
+def get_ban_backend(name=DEFAULT_BAN_BACKEND):
+    return BAN_BACKENDS[name]()
+
+def ban_backend_from_args(args):
+    return get_ban_backend(getattr(args, 'ban_backend', None) or DEFAULT_BAN_BACKEND)
@@ -1,50 +1,57 @@
+import argparse
 import subprocess
-import sys
 import logging
 
-# 定义日志文件路径
-SEVERE_RISK_LOG = "severe_risk_ips.log"
+from ban_backend import add_ban_arguments, ban_backend_from_args
+from risk_store import RiskStore
 
 # 设置日志记录
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def read_severe_risk_ips(log_file):
+def apply_batch(backend, action, ips):
+    """action 为 'ban' 或 'unban'，一次提交整批IP，返回是否成功"""
+    label = "封禁" if action == "ban" else "解封"
     try:
-        with open(log_file, 'r') as f:
-            return set(line.strip() for line in f if line.strip())
-    except FileNotFoundError:
-        logging.error(f"错误：找不到日志文件 {log_file}")
-        sys.exit(1)
-    except PermissionError:
-        logging.error(f"错误：没有权限读取日志文件 {log_file}")
-        sys.exit(1)
-
-def ban_ip(ip):
-    command = f"sudo fail2ban-client set fail2ban-nginx-cc banip {ip}"
-    #command = f"sudo ufw insert 1 deny from {ip} to any"
-    try:
-        result = subprocess.run(command, shell=True, check=True, capture_output=True, text=True)
-        logging.info(f"成功将IP {ip} 加入黑名单")
-        logging.debug(f"命令输出：{result.stdout.strip()}")
+        changed = getattr(backend, action)(ips)
     except subprocess.CalledProcessError as e:
-        logging.error(f"将IP {ip} 加入黑名单时出错")
-        logging.error(f"错误信息：{e.stderr.strip()}")
+        logging.error(f"通过 {backend.name} {label}IP时出错")
+        logging.error(f"错误信息：{e.stderr.strip() if e.stderr else e}")
+        return False
     except PermissionError:
         logging.error(f"错误：没有足够的权限执行命令。请确保脚本以适当的权限运行。")
+        return False
+    logging.info(f"通过 {backend.name} {label} {len(changed)} 个IP，其余 {len(ips) - len(changed)} 个无需变更")
+    for ip in changed:
+        logging.debug(f"已{label}IP {ip}")
+    return True
 
 def main():
-    severe_risk_ips = read_severe_risk_ips(SEVERE_RISK_LOG)
-    
-    if not severe_risk_ips:
-        logging.info("未发现严重风险IP")
-        return
-    
-    logging.info(f"发现 {len(severe_risk_ips)} 个严重风险IP")
-    
-    for ip in severe_risk_ips:
-        ban_ip(ip)
-    
-    logging.info("所有严重风险IP已被加入黑名单")
+    parser = argparse.ArgumentParser(description="封禁高风险IP数据库中未过期的IP，解封已过期的IP")
+    add_ban_arguments(parser)
+    args = parser.parse_args()
+
+    backend = ban_backend_from_args(args)
+    risk_store = RiskStore()
+    try:
+        if risk_store.imported:
+            logging.info(f"已从旧的高风险IP日志文件导入 {risk_store.imported} 个IP")
+
+        for expired_ips in risk_store.sweep():
+            logging.info(f"{len(expired_ips)} 个风险IP已过期")
+            if apply_batch(backend, "unban", expired_ips):
+                risk_store.remove(expired_ips)
+
+        severe_risk_ips = risk_store.active_ips()
+        if not severe_risk_ips:
+            logging.info("未发现严重风险IP")
+            return
+
+        logging.info(f"发现 {len(severe_risk_ips)} 个严重风险IP")
+
+        if apply_batch(backend, "ban", severe_risk_ips):
+            logging.info("所有严重风险IP已被加入黑名单")
+    finally:
+        risk_store.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,158 @@
+"""
+基准测试：攻击类型识别的原实现 vs 按请求行 / 用户代理缓存的实现
+
+复刻 logcheck.py 原来的 identify_attack_type / is_whitelisted_request / is_search_engine_bot，
+与现在的实现比较耗时，并核对两者对每条记录的判断完全一致。
+另外给出把全部正则合并成一个命名分组分支（p0|p1|...）后单次 search 的耗时作参考：
+CPython 的 re 对这种大分支无法做字面量前缀优化，比逐个正则 search 更慢，所以没有采用。
+
+classify_request 返回命中的全部攻击类型，先用各正则必含的字面量合成的 ATTACK_KEYWORDS 预筛。
+另外不经缓存比较“逐个正则取全部类型”和“关键字预筛后再逐个检测”，核对两者结果一致，并给出预筛放行的比例。
+
+缓存的收益取决于日志中不同请求行的比例，可用 --url-ids 调整测试日志中 URL 编号的取值范围；
+预筛的收益取决于攻击请求的比例，可用 --attack-ratio 调整（默认约 40%，远高于正常站点）。
+
+用法: python3 benchmarks/bench_attack_matcher.py [--lines 200000] [--url-ids 300] [--attack-ratio 0.02]
+      [--log 已有日志路径]
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logcheck
+from log_engine import LogEngine
+from synth_log import generate_log
+
+def legacy_is_search_engine_bot(user_agent):
+    return any(bot.lower() in user_agent.lower() for bot in logcheck.SEARCH_ENGINE_BOTS)
+
+def legacy_identify_attack_type(request, user_agent):
+    for pattern, attack_type in logcheck.ATTACK_PATTERNS.items():
+        if pattern.search(request):
+            return attack_type
+    if "bot" in user_agent.lower() and not legacy_is_search_engine_bot(user_agent):
+        return "可疑扫描"
+    if re.search(r'[^\w\s]{4,}', request):
+        return "可疑扫描"
+    if len(request.split('?')[1]) > 200 if '?' in request else False:
+        return "可疑扫描"
+    if re.search(r'\.(cgi|pl|exe|dll|jsp|action|do|xml)$', request, re.IGNORECASE):
+        return "可疑扫描"
+    return None
+
+def unfiltered_classify_request(request):
+    """classify_request 去掉关键字预筛"""
+    attack_types = tuple(attack_type for pattern, attack_type in logcheck.ATTACK_PATTERNS.items() if pattern.search(request))
+    if attack_types:
+        return attack_types, False
+    return (), any(pattern.search(request) for pattern in logcheck.SUSPICIOUS_REQUEST_PATTERNS)
+
+def all_types(records, classify):
+    return [classify(request) for request, _ in records]
+
+def legacy_is_whitelisted_request(request):
+    return any(pattern.search(request) for pattern in logcheck.WHITELISTED_PATHS)
+
+def classify_all(records, is_bot, is_whitelisted, identify):
+    return [(is_bot(user_agent), is_whitelisted(request), identify(request, user_agent))
+            for request, user_agent in records]
+
+def legacy(records):
+    return classify_all(records, legacy_is_search_engine_bot, legacy_is_whitelisted_request,
+                        legacy_identify_attack_type)
+
+def clear_caches():
+    for func in (logcheck.classify_request, logcheck.is_whitelisted_request,
+                 logcheck.is_search_engine_bot, logcheck.is_suspicious_bot):
+        func.cache_clear()
+
+def cached(records):
+    clear_caches()
+    return classify_all(records, logcheck.is_search_engine_bot, logcheck.is_whitelisted_request,
+                        logcheck.identify_attack_type)
+
+def build_alternation(patterns):
+    branches = []
+    for index, pattern in enumerate(patterns):
+        body = f"(?i:{pattern.pattern})" if pattern.flags & re.IGNORECASE else pattern.pattern
+        branches.append(f"(?P<p{index}>{body})")
+    return re.compile("|".join(branches))
+
+def single_alternation(records):
+    pattern = build_alternation(list(logcheck.ATTACK_PATTERNS) + logcheck.WHITELISTED_PATHS
+                                + logcheck.SUSPICIOUS_REQUEST_PATTERNS)
+    return [pattern.search(request) is not None for request, _ in records]
+
+class RequestCollector:
+    def __init__(self):
+        self.records = []
+
+    def feed(self, record):
+        self.records.append((record.request, record.user_agent))
+
+def timed(func, records, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(records)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="攻击类型识别基准测试")
+    parser.add_argument("--lines", type=int, default=200000, help="生成的日志行数")
+    parser.add_argument("--url-ids", type=int, default=300, help="测试日志中 URL 编号的取值范围")
+    parser.add_argument("--attack-ratio", type=float, help="测试日志中攻击请求的比例")
+    parser.add_argument("--log", help="使用已有的日志文件，而不是生成测试日志")
+    parser.add_argument("--repeat", type=int, default=3, help="每种方式重复次数，取最快一次")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    log_path = args.log
+    if not log_path:
+        tmp_dir = tempfile.TemporaryDirectory()
+        log_path = generate_log(os.path.join(tmp_dir.name, "access.log"), args.lines, url_ids=args.url_ids,
+                                attack_ratio=args.attack_ratio)
+
+    collector = RequestCollector()
+    LogEngine([collector]).run([log_path])
+    records = collector.records
+    distinct = len(set(request for request, _ in records))
+
+    legacy_time, legacy_result = timed(legacy, records, args.repeat)
+    cached_time, cached_result = timed(cached, records, args.repeat)
+    alternation_time, _ = timed(single_alternation, records, args.repeat)
+    all_time, all_result = timed(lambda records: all_types(records, unfiltered_classify_request),
+                                 records, args.repeat)
+    prefilter_time, prefilter_result = timed(lambda records: all_types(records, logcheck.classify_request.__wrapped__),
+                                             records, args.repeat)
+    passed = sum(1 for request, _ in records if logcheck.ATTACK_KEYWORDS.search(request))
+
+    print(f"日志: {log_path} ({len(records)} 条记录, {distinct} 个不同请求行)")
+    print("| 方式 | 耗时(秒) | 条/秒 | 结果一致 |")
+    print("|------|----------|-------|----------|")
+    print(f"| 原实现 | {legacy_time:.3f} | {len(records) / legacy_time:.0f} | - |")
+    print(f"| 按请求行缓存 | {cached_time:.3f} | {len(records) / cached_time:.0f} | {cached_result == legacy_result} |")
+    print(f"| （参考）合并分支单次 search | {alternation_time:.3f} | {len(records) / alternation_time:.0f} | - |")
+    print(f"加速比: {legacy_time / cached_time:.2f}x")
+    print()
+    print("全部攻击类型（不缓存）:")
+    print("| 方式 | 耗时(秒) | 条/秒 | 结果一致 |")
+    print("|------|----------|-------|----------|")
+    print(f"| 逐个正则 | {all_time:.3f} | {len(records) / all_time:.0f} | - |")
+    print(f"| 关键字预筛 | {prefilter_time:.3f} | {len(records) / prefilter_time:.0f} | "
+          f"{prefilter_result == all_result} |")
+    print(f"预筛放行 {passed} 条（{passed / len(records):.1%}），加速比: {all_time / prefilter_time:.2f}x")
+
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+基准测试：text 与 mmap 解析后端的吞吐量和峰值内存
+
+每个后端在独立子进程中运行，分析器只访问 IP、状态码、URL 三个字段，
+输出每秒处理行数和进程峰值常驻内存（RSS）。
+
+用法: python3 benchmarks/bench_backends.py [--lines 500000] [--log 已有日志路径]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_engine import BACKENDS, LogEngine
+from synth_log import generate_log
+
+class FieldAnalyzer:
+    """模拟只使用部分字段的分析器"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+
+    def feed(self, record):
+        self.count += 1
+        if record.status >= 400 and record.ip and record.url:
+            self.errors += 1
+
+def run_worker(log_path, backend):
+    analyzer = FieldAnalyzer()
+    start = time.perf_counter()
+    engine = LogEngine([analyzer], backend=backend).run([log_path])
+    elapsed = time.perf_counter() - start
+    # Linux 下 ru_maxrss 的单位是 KB
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"lines": engine.lines, "elapsed": elapsed, "peak_rss_kb": peak_rss_kb}))
+
+def main():
+    parser = argparse.ArgumentParser(description="解析后端基准测试")
+    parser.add_argument("--lines", type=int, default=500000, help="生成的日志行数")
+    parser.add_argument("--log", help="使用已有的日志文件，而不是生成测试日志")
+    parser.add_argument("--repeat", type=int, default=3, help="每个后端重复次数，取最快一次")
+    parser.add_argument("--worker", choices=sorted(BACKENDS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.log, args.worker)
+        return
+
+    tmp_dir = None
+    log_path = args.log
+    if not log_path:
+        tmp_dir = tempfile.TemporaryDirectory()
+        log_path = generate_log(os.path.join(tmp_dir.name, "access.log"), args.lines)
+    size_mb = os.path.getsize(log_path) / 1024 / 1024
+
+    print(f"日志: {log_path} ({size_mb:.1f} MB)")
+    print("| 后端 | 行数 | 耗时(秒) | 行/秒 | 峰值RSS(MB) |")
+    print("|------|------|----------|-------|-------------|")
+    for backend in sorted(BACKENDS, reverse=True):
+        results = []
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", backend, "--log", log_path],
+                check=True, capture_output=True, text=True
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        best = min(results, key=lambda result: result['elapsed'])
+        peak_rss_kb = max(result['peak_rss_kb'] for result in results)
+        print(f"| {backend} | {best['lines']} | {best['elapsed']:.3f} | "
+              f"{best['lines'] / best['elapsed']:.0f} | {peak_rss_kb / 1024:.1f} |")
+
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+基准测试：datetime.strptime vs decode_time 时间戳解析
+
+旧流程对每一行调用 strptime 得到 datetime，再用 strftime 生成分钟键；
+decode_time 直接返回整数 Unix 时间戳，并按秒缓存，同一秒内的重复时间串只解析一次。
+
+用法: python3 benchmarks/bench_decode_time.py [--lines 200000] [--log 已有日志路径]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_engine import LogEngine, decode_time
+from synth_log import generate_log
+
+class TimeCollector:
+    def __init__(self):
+        self.times = []
+
+    def feed(self, record):
+        self.times.append(record.time)
+
+def legacy_minute_keys(times):
+    return [datetime.strptime(value, "%d/%b/%Y:%H:%M:%S %z").strftime('%Y-%m-%d %H:%M') for value in times]
+
+def epoch_minute_keys(times):
+    return [decode_time(value) // 60 for value in times]
+
+def timed(func, times, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(times)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="时间戳解析基准测试")
+    parser.add_argument("--lines", type=int, default=200000, help="生成的日志行数")
+    parser.add_argument("--log", help="使用已有的日志文件，而不是生成测试日志")
+    parser.add_argument("--repeat", type=int, default=3, help="每种方式重复次数，取最快一次")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    log_path = args.log
+    if not log_path:
+        tmp_dir = tempfile.TemporaryDirectory()
+        log_path = generate_log(os.path.join(tmp_dir.name, "access.log"), args.lines)
+
+    collector = TimeCollector()
+    LogEngine([collector]).run([log_path])
+    times = collector.times
+
+    legacy_time, legacy_keys = timed(legacy_minute_keys, times, args.repeat)
+    epoch_time, epoch_keys = timed(epoch_minute_keys, times, args.repeat)
+    distinct = len(set(times))
+
+    print(f"日志: {log_path} ({len(times)} 条记录, {distinct} 个不同时间串)")
+    print("| 方式 | 耗时(秒) | 条/秒 | 分钟数 |")
+    print("|------|----------|-------|--------|")
+    print(f"| strptime + strftime | {legacy_time:.3f} | {len(times) / legacy_time:.0f} | {len(set(legacy_keys))} |")
+    print(f"| decode_time | {epoch_time:.3f} | {len(times) / epoch_time:.0f} | {len(set(epoch_keys))} |")
+    print(f"加速比: {legacy_time / epoch_time:.2f}x")
+
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+基准测试：逐个网段比较的 is_crawler_ip vs 区间二分的 CidrMatcher
+
+原实现对每条记录构造 ipaddress 对象，再与 CRAWLER_IPS 中的网段逐个比较；
+CidrMatcher 把网段编译成排序区间后二分查找，并缓存单个 IP 的结果。
+另外给出 contains_many 批量查询（不使用缓存）的耗时。
+
+用法: python3 benchmarks/bench_ip_matcher.py [--lines 200000] [--log 已有日志路径]
+"""
+
+import argparse
+import ipaddress
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ip_matcher import CidrMatcher
+from log_analysis import CRAWLER_IPS
+from log_engine import LogEngine
+from synth_log import generate_log
+
+class IPCollector:
+    def __init__(self):
+        self.ips = []
+
+    def feed(self, record):
+        self.ips.append(record.ip)
+
+def legacy_is_crawler_ip(ip):
+    try:
+        ip_obj = ipaddress.ip_address(ip)
+        return any(ip_obj in network for network in CRAWLER_IPS)
+    except ValueError:
+        return False
+
+def legacy(ips):
+    return [legacy_is_crawler_ip(ip) for ip in ips]
+
+def matcher_single(ips):
+    matcher = CidrMatcher(CRAWLER_IPS)
+    return [ip in matcher for ip in ips]
+
+def matcher_bulk(ips):
+    return CidrMatcher(CRAWLER_IPS).contains_many(ips)
+
+def timed(func, ips, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(ips)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="爬虫IP段匹配基准测试")
+    parser.add_argument("--lines", type=int, default=200000, help="生成的日志行数")
+    parser.add_argument("--log", help="使用已有的日志文件，而不是生成测试日志")
+    parser.add_argument("--repeat", type=int, default=3, help="每种方式重复次数，取最快一次")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    log_path = args.log
+    if not log_path:
+        tmp_dir = tempfile.TemporaryDirectory()
+        log_path = generate_log(os.path.join(tmp_dir.name, "access.log"), args.lines)
+
+    collector = IPCollector()
+    LogEngine([collector]).run([log_path])
+    ips = collector.ips
+
+    legacy_time, legacy_result = timed(legacy, ips, args.repeat)
+    single_time, single_result = timed(matcher_single, ips, args.repeat)
+    bulk_time, bulk_result = timed(matcher_bulk, ips, args.repeat)
+
+    print(f"日志: {log_path} ({len(ips)} 条记录, {len(set(ips))} 个不同IP, {len(CRAWLER_IPS)} 个网段)")
+    print("| 方式 | 耗时(秒) | 条/秒 | 结果一致 |")
+    print("|------|----------|-------|----------|")
+    print(f"| 逐个网段比较 | {legacy_time:.3f} | {len(ips) / legacy_time:.0f} | - |")
+    print(f"| CidrMatcher 逐条 | {single_time:.3f} | {len(ips) / single_time:.0f} | {single_result == legacy_result} |")
+    print(f"| CidrMatcher 批量 | {bulk_time:.3f} | {len(ips) / bulk_time:.0f} | {bulk_result == legacy_result} |")
+    print(f"加速比: {legacy_time / single_time:.2f}x")
+
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+if __name__ == "__main__":
+    main()
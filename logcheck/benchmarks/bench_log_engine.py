@@ -0,0 +1,113 @@
+"""
+基准测试：三次独立解析 vs LogEngine 单次解析分发
+
+旧流程中 logcheck.py、web_log_monitor.py、log_analysis.py 各自用自己的正则读取同一份日志，
+这里复刻三个旧的解析循环，与 LogEngine 一次读取、分发给三个收集器的耗时进行对比。
+各分析器对记录本身的处理（UA解析、GeoIP查询等）两种方式相同，不计入。
+
+用法: python3 benchmarks/bench_log_engine.py [--lines 200000] [--log 已有日志路径]
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_engine import LogEngine
+from synth_log import generate_log
+
+# 旧版三个脚本各自使用的解析正则
+LOGCHECK_PATTERN = re.compile(r'(\d+\.\d+\.\d+\.\d+).*\[([^\]]+)\] "([^"]*)" (\d+) \d+ "[^"]*" "([^"]*)"')
+MONITOR_PATTERN = re.compile(
+    r'(?P<ip>\S+)\s+-\s+-\s+'
+    r'\[(?P<time>[^\]]+)\]\s+'
+    r'"(?P<method>\S+)\s+(?P<url>\S+)\s+(?P<protocol>[^"]+)"\s+'
+    r'(?P<status>\d+)\s+'
+    r'(?P<response_size>\d+)\s+'
+    r'"(?P<referrer>[^"]*)"\s+'
+    r'"(?P<user_agent>[^"]+)"'
+)
+ANALYSIS_IP_PATTERN = re.compile(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
+ANALYSIS_TIME_PATTERN = re.compile(r'\[(\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2})')
+
+def legacy_three_passes(log_path):
+    count = 0
+    with open(log_path, 'r') as f:
+        for line in f:
+            match = LOGCHECK_PATTERN.search(line)
+            if match:
+                match.groups()
+                count += 1
+    with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            match = MONITOR_PATTERN.match(line)
+            if match:
+                match.groupdict()
+                count += 1
+    with open(log_path, 'r') as f:
+        for line in f:
+            ip_match = ANALYSIS_IP_PATTERN.search(line)
+            timestamp_match = ANALYSIS_TIME_PATTERN.search(line)
+            if ip_match and timestamp_match:
+                ip_match.group()
+                timestamp_match.group(1)
+                count += 1
+    return count
+
+class CountingAnalyzer:
+    def __init__(self):
+        self.count = 0
+
+    def feed(self, record):
+        self.count += 1
+
+def single_pass(log_path):
+    analyzers = [CountingAnalyzer() for _ in range(3)]
+    LogEngine(analyzers).run([log_path])
+    return sum(analyzer.count for analyzer in analyzers)
+
+def timed(func, log_path, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(log_path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="LogEngine 单次解析基准测试")
+    parser.add_argument("--lines", type=int, default=200000, help="生成的日志行数")
+    parser.add_argument("--log", help="使用已有的日志文件，而不是生成测试日志")
+    parser.add_argument("--repeat", type=int, default=3, help="每种方式重复次数，取最快一次")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    log_path = args.log
+    if not log_path:
+        tmp_dir = tempfile.TemporaryDirectory()
+        log_path = generate_log(os.path.join(tmp_dir.name, "access.log"), args.lines)
+
+    with open(log_path, 'rb') as f:
+        lines = sum(1 for _ in f)
+    size_mb = os.path.getsize(log_path) / 1024 / 1024
+
+    legacy_time, legacy_count = timed(legacy_three_passes, log_path, args.repeat)
+    engine_time, engine_count = timed(single_pass, log_path, args.repeat)
+
+    print(f"日志: {log_path} ({lines} 行, {size_mb:.1f} MB)")
+    print("| 方式 | 耗时(秒) | 行/秒 | MB/秒 | 分发记录数 |")
+    print("|------|----------|-------|-------|------------|")
+    print(f"| 三次独立解析 | {legacy_time:.3f} | {lines / legacy_time:.0f} | {size_mb / legacy_time:.1f} | {legacy_count} |")
+    print(f"| LogEngine 单次解析 | {engine_time:.3f} | {lines / engine_time:.0f} | {size_mb / engine_time:.1f} | {engine_count} |")
+    print(f"加速比: {legacy_time / engine_time:.2f}x")
+
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+生成用于基准测试的 nginx 访问日志
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+
+BENIGN_URLS = [
+    "/", "/video/{}.html", "/play/{}-1-{}.html", "/show/{}.html",
+    "/index.php/ajax/hits?id={}", "/index.php/user/ajax_ulog/?ac=set&mid=1&id={}",
+    "/statics/img/{}.jpg",
+]
+ATTACK_URLS = [
+    "/wp-login.php", "/.env", "/admin/{}",
+    "/search?wd=' UNION SELECT {} FROM users", "/index.php?s=<script>{}</script>",
+]
+URLS = BENIGN_URLS + ATTACK_URLS
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 13; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)",
+    "python-requests/2.31.0",
+    "Mozilla/5.0 zgrab/0.x",
+]
+
+STATUSES = [200] * 20 + [301, 302, 304, 404, 404, 403, 500, 502]
+
+def generate_log(path, lines, ips=5000, hot_ips=5, seed=1, start=None, url_ids=30000, attack_ratio=None):
+    """
+    hot_ips 个高频IP合计占约 10% 的请求，用于触发频率规则；url_ids 控制 URL 中编号的取值范围；
+    attack_ratio 为攻击请求所占比例，默认在全部 URL 中均匀选取
+    """
+    rng = random.Random(seed)
+    ip_pool = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+               for _ in range(ips)]
+    hot_pool = ip_pool[:hot_ips]
+    current = start or datetime(2024, 5, 1, tzinfo=timezone(timedelta(hours=8)))
+    with open(path, 'w', encoding='utf-8') as f:
+        for _ in range(lines):
+            current += timedelta(milliseconds=rng.randint(0, 40))
+            if attack_ratio is None:
+                template = rng.choice(URLS)
+            else:
+                template = rng.choice(ATTACK_URLS if rng.random() < attack_ratio else BENIGN_URLS)
+            url = template.format(rng.randint(1, url_ids), rng.randint(1, 40))
+            ip = rng.choice(hot_pool) if hot_pool and rng.random() < 0.1 else rng.choice(ip_pool)
+            f.write(
+                f'{ip} - - [{current.strftime("%d/%b/%Y:%H:%M:%S %z")}] '
+                f'"{rng.choice(["GET", "GET", "GET", "POST"])} {url} HTTP/1.1" '
+                f'{rng.choice(STATUSES)} {rng.randint(0, 60000)} "-" "{rng.choice(USER_AGENTS)}"\n'
+            )
+    return path
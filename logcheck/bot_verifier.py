@@ -0,0 +1,425 @@
+"""
+搜索引擎爬虫的反向 DNS 验证（FCrDNS）
+用户代理可以随意伪造，扫描器自称 Googlebot 就能绕过爬虫豁免。这里对自称爬虫的IP做正反向解析确认：
+IP 的 PTR 记录必须落在该爬虫官方公布的域名下（如 *.googlebot.com），且该域名正向解析回同一个IP。
+
+DNS 查询用 asyncio 直接收发 UDP 报文，数百个查询同时进行，不依赖第三方库；
+--dns-server 可以指向本地的桩 DNS 服务（如 127.0.0.1:5353）做测试，也可以用 system 改走系统解析器。
+验证结果按IP缓存到文件（确认的保留 7 天，冒充的保留 1 天），只有缓存中没有结论的IP才会查询；
+超时、SERVFAIL 等临时失败不缓存，本次按原来的方式信任用户代理。
+
+手工验证：python3 bot_verifier.py 66.249.66.1 --bot googlebot --dns-server 127.0.0.1:5353
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import os
+import random
+import re
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BOT_CACHE_FILE = '/root/logcheck/bot_verify_cache.json'
+BOT_CACHE_VERSION = 1
+# 保存到文件的条目上限，超出时保留最近验证的
+BOT_CACHE_SIZE = 100000
+
+# 验证结果的有效期（秒）：确认的爬虫IP很少变化，冒充者可能换成真实爬虫所在的地址段，保留较短
+VERIFIED_TTL = 7 * 24 * 3600
+SPOOFED_TTL = 24 * 3600
+
+# 同时进行的验证数、单次查询的超时（秒）和重试次数
+DNS_CONCURRENCY = 200
+DNS_TIMEOUT = 2.0
+DNS_RETRIES = 1
+
+# 用户代理中的爬虫名称（不区分大小写） -> 官方公布的反向解析域名后缀。
+# AhrefsBot、Bytespider 等没有公布反向解析域名的爬虫无法这样验证，仍按用户代理判断
+BOT_DOMAINS = {
+    "googlebot": (".googlebot.com", ".google.com"),
+    "bingbot": (".search.msn.com",),
+    "msnbot": (".search.msn.com",),
+    "baiduspider": (".baidu.com", ".baidu.jp"),
+    "yandex": (".yandex.ru", ".yandex.net", ".yandex.com"),
+    "sogou": (".sogou.com",),
+    "applebot": (".applebot.apple.com",),
+    "slurp": (".crawl.yahoo.net",),
+    "petalbot": (".petalsearch.com",),
+}
+
+BOT_PATTERN = re.compile("|".join(BOT_DOMAINS), re.IGNORECASE)
+
+QTYPE_A = 1
+QTYPE_PTR = 12
+QTYPE_AAAA = 28
+
+RCODE_NXDOMAIN = 3
+
+class DnsError(Exception):
+    """超时、SERVFAIL、报文异常等临时失败，结果不缓存"""
+
+def claimed_bot(user_agent):
+    """用户代理自称的可验证爬虫名称（BOT_DOMAINS 的键），不是可验证的爬虫时返回 None"""
+    match = BOT_PATTERN.search(user_agent)
+    return match.group(0).lower() if match else None
+
+# ---- DNS 报文 ----
+
+def build_query(query_id, name, qtype):
+    """标准递归查询报文：头部（RD=1，一个问题）+ 问题"""
+    header = struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0)
+    labels = b''.join(bytes([len(label)]) + label for label in name.rstrip('.').encode('ascii').split(b'.'))
+    return header + labels + b'\0' + struct.pack('!HH', qtype, 1)
+
+def read_name(data, pos):
+    """解码 pos 处的域名（支持压缩指针），返回 (小写域名, 域名之后的位置)"""
+    labels = []
+    end = None
+    for _ in range(128):
+        length = data[pos]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = pos + 2
+            pos = ((length & 0x3F) << 8) | data[pos + 1]
+            continue
+        pos += 1
+        if not length:
+            return '.'.join(labels).lower(), pos if end is None else end
+        labels.append(data[pos:pos + length].decode('ascii', errors='replace'))
+        pos += length
+    raise DnsError("域名压缩指针过多")
+
+def parse_response(data, query_id, qtype):
+    """返回应答中 qtype 类型记录的值（PTR 为域名，A/AAAA 为IP字符串）；NXDOMAIN 或没有记录时返回空列表"""
+    query, flags, questions, answers = struct.unpack('!HHHH', data[:8])
+    if query != query_id:
+        raise DnsError("应答ID不匹配")
+    rcode = flags & 0x0F
+    if rcode == RCODE_NXDOMAIN:
+        return []
+    if rcode:
+        raise DnsError(f"DNS 应答错误码 {rcode}")
+    if flags & 0x0200:
+        raise DnsError("DNS 应答被截断")
+    pos = 12
+    for _ in range(questions):
+        _, pos = read_name(data, pos)
+        pos += 4
+    values = []
+    for _ in range(answers):
+        _, pos = read_name(data, pos)
+        rtype, _, _, length = struct.unpack('!HHIH', data[pos:pos + 10])
+        pos += 10
+        rdata = data[pos:pos + length]
+        if rtype == qtype == QTYPE_PTR:
+            values.append(read_name(data, pos)[0])
+        elif rtype == qtype == QTYPE_A and length == 4:
+            values.append(socket.inet_ntop(socket.AF_INET, rdata))
+        elif rtype == qtype == QTYPE_AAAA and length == 16:
+            values.append(socket.inet_ntop(socket.AF_INET6, rdata))
+        pos += length
+    return values
+
+class _QueryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, future):
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        if not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+class DnsResolver:
+    """异步 UDP DNS 客户端，每个查询使用独立的套接字和随机ID"""
+
+    def __init__(self, server, timeout=DNS_TIMEOUT, retries=DNS_RETRIES):
+        self.server = server
+        self.timeout = timeout
+        self.retries = retries
+
+    async def query(self, name, qtype):
+        loop = asyncio.get_running_loop()
+        error = None
+        for _ in range(self.retries + 1):
+            query_id = random.getrandbits(16)
+            future = loop.create_future()
+            try:
+                transport, _ = await loop.create_datagram_endpoint(lambda: _QueryProtocol(future),
+                                                                   remote_addr=self.server)
+            except OSError as e:
+                raise DnsError(f"无法连接 DNS 服务器 {self.server}: {e}") from e
+            try:
+                transport.sendto(build_query(query_id, name, qtype))
+                data = await asyncio.wait_for(future, self.timeout)
+                return parse_response(data, query_id, qtype)
+            except (asyncio.TimeoutError, OSError, DnsError, struct.error, IndexError) as e:
+                error = e
+            finally:
+                transport.close()
+        raise DnsError(f"查询 {name} 失败: {error!r}")
+
+    async def reverse(self, ip):
+        return await self.query(ipaddress.ip_address(ip).reverse_pointer, QTYPE_PTR)
+
+    async def addresses(self, host, version):
+        return await self.query(host, QTYPE_A if version == 4 else QTYPE_AAAA)
+
+    def close(self):
+        pass
+
+class SystemResolver:
+    """通过系统解析器（/etc/hosts、nsswitch）查询，阻塞调用放到线程池执行"""
+
+    def __init__(self, workers=32):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor, func, *args)
+        except (socket.herror, socket.gaierror) as e:
+            if e.errno in (socket.EAI_NONAME, 1):  # 1 为 HOST_NOT_FOUND
+                return None
+            raise DnsError(str(e)) from e
+
+    async def reverse(self, ip):
+        result = await self._call(socket.gethostbyaddr, ip)
+        return [] if result is None else [name.lower() for name in [result[0], *result[1]]]
+
+    async def addresses(self, host, version):
+        family = socket.AF_INET if version == 4 else socket.AF_INET6
+        result = await self._call(socket.getaddrinfo, host, None, family, socket.SOCK_STREAM)
+        return [] if result is None else [sockaddr[0] for *_, sockaddr in result]
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+def system_nameserver(resolv_conf='/etc/resolv.conf'):
+    try:
+        with open(resolv_conf) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == 'nameserver':
+                    return fields[1].split('%')[0]
+    except OSError:
+        pass
+    return None
+
+def parse_server(value):
+    """HOST、HOST:PORT 或 [IPv6]:PORT -> (host, port)"""
+    match = re.fullmatch(r'\[(.+)\](?::(\d+))?|([^:]+)(?::(\d+))?|(.+)', value)
+    host = match.group(1) or match.group(3) or match.group(5)
+    port = match.group(2) or match.group(4)
+    return host, int(port) if port else 53
+
+def make_resolver(dns_server=None, timeout=DNS_TIMEOUT):
+    """dns_server 为 None 时使用 /etc/resolv.conf 的第一个服务器，为 system 或找不到服务器时走系统解析器"""
+    if dns_server != 'system':
+        server = dns_server or system_nameserver()
+        if server:
+            return DnsResolver(parse_server(server), timeout)
+    return SystemResolver()
+
+# ---- 验证与缓存 ----
+
+class BotVerifier:
+    """
+    按IP缓存的爬虫验证结果：{ip: (爬虫名称, 是否确认, 反向解析的域名, 过期时间)}。
+    status() 只查缓存，可以在解析日志时逐条调用（工作进程中也一样）；verify() 集中解析缓存中没有结论的IP。
+    resolver 可以传入测试用的桩对象，需提供 async reverse(ip) 和 async addresses(host, version)。
+    """
+
+    def __init__(self, cache_path=None, dns_server=None, concurrency=DNS_CONCURRENCY, timeout=DNS_TIMEOUT,
+                 resolver=None):
+        self.cache_path = cache_path
+        self.dns_server = dns_server
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.resolver = resolver
+        self.entries = {}
+        self.loaded = 0
+        self.resolved = 0
+        self.failed = 0
+        self.spoofed = {}
+
+    def __getstate__(self):
+        # 工作进程只查缓存，不需要解析器
+        state = self.__dict__.copy()
+        state['resolver'] = None
+        return state
+
+    def status(self, ip, bot, now=None):
+        """缓存中的结论：True 确认是该爬虫，False 冒充，None 没有未过期的结论"""
+        entry = self.entries.get(ip)
+        if entry is None or entry[0] != bot or entry[3] <= (now or time.time()):
+            return None
+        return entry[1]
+
+    async def check(self, resolver, ip, bot):
+        """FCrDNS：PTR 域名属于该爬虫，且正向解析包含原IP。返回 (是否确认, 反向解析的域名)"""
+        address = ipaddress.ip_address(ip)
+        hosts = [host.rstrip('.') for host in await resolver.reverse(ip)]
+        for host in hosts:
+            if not host.endswith(BOT_DOMAINS[bot]):
+                continue
+            if any(ipaddress.ip_address(value) == address
+                   for value in await resolver.addresses(host, address.version)):
+                return True, host
+        return False, hosts[0] if hosts else ''
+
+    async def verify_async(self, claims):
+        """
+        claims 为 {ip: 自称的爬虫名称}。返回 {ip: True/False/None}，None 表示查询失败；
+        缓存中已有结论的IP直接取缓存，其余并发查询（同时最多 concurrency 个）。
+        """
+        now = time.time()
+        results = {}
+        pending = []
+        for ip, bot in claims.items():
+            verified = self.status(ip, bot, now)
+            if verified is None:
+                pending.append((ip, bot))
+            else:
+                results[ip] = verified
+        if not pending:
+            return results
+
+        resolver = self.resolver or make_resolver(self.dns_server, self.timeout)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def verify_one(ip, bot):
+            async with semaphore:
+                try:
+                    return await self.check(resolver, ip, bot)
+                except (DnsError, ValueError) as e:
+                    return e
+
+        try:
+            outcomes = await asyncio.gather(*(verify_one(ip, bot) for ip, bot in pending))
+        finally:
+            if self.resolver is None:
+                resolver.close()
+        now = time.time()
+        for (ip, bot), outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                self.failed += 1
+                results[ip] = None
+                continue
+            verified, host = outcome
+            self.resolved += 1
+            self.entries.pop(ip, None)  # 重新插入到末尾，保存时按最近验证的保留
+            self.entries[ip] = (bot, verified, host, now + (VERIFIED_TTL if verified else SPOOFED_TTL))
+            if not verified:
+                self.spoofed[ip] = (bot, host)
+            results[ip] = verified
+        return results
+
+    def verify(self, claims):
+        return asyncio.run(self.verify_async(claims))
+
+    def load(self):
+        """读取持久化缓存，跳过已过期的条目。返回载入的条目数"""
+        if not self.cache_path:
+            return 0
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (ValueError, OSError) as e:
+            print(f"警告: 爬虫验证缓存文件 {self.cache_path} 无法读取，将重新验证: {e}")
+            return 0
+        if data.get('version') != BOT_CACHE_VERSION:
+            return 0
+        now = time.time()
+        for ip, bot, verified, host, expires in data.get('entries', []):
+            if expires > now:
+                self.entries.setdefault(ip, (bot, verified, host, expires))
+        self.loaded = len(self.entries)
+        return self.loaded
+
+    def save(self):
+        if not self.cache_path:
+            return
+        now = time.time()
+        entries = [[ip, *entry] for ip, entry in self.entries.items() if entry[3] > now][-BOT_CACHE_SIZE:]
+        tmp_path = self.cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': BOT_CACHE_VERSION, 'entries': entries}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"保存爬虫验证缓存文件 {self.cache_path} 时出错: {e}")
+
+    def summary(self):
+        return (f"爬虫验证：缓存 {len(self.entries)} 个IP（从文件载入 {self.loaded} 个），"
+                f"本次反向解析 {self.resolved} 个，发现冒充 {len(self.spoofed)} 个，查询失败 {self.failed} 个。")
+
+def verify_claims(verifier, analyzers, log=print):
+    """
+    解析结束后集中验证：收集各分析器的 bot_claims（{ip: 自称的爬虫}），一次并发解析，
+    再交给各分析器的 apply_bot_results(results) 处理，最后保存缓存
+    """
+    claims = {}
+    for analyzer in analyzers:
+        claims.update(analyzer.bot_claims)
+    results = verifier.verify(claims) if claims else {}
+    for analyzer in analyzers:
+        analyzer.apply_bot_results(results)
+    log(verifier.summary())
+    for ip, (bot, host) in list(verifier.spoofed.items())[:20]:
+        log(f"- 冒充 {bot} 的IP: {ip}（反向解析: {host or '无'}）")
+    verifier.save()
+    return results
+
+def add_bot_verifier_arguments(parser):
+    parser.add_argument('--verify-bots', action='store_true',
+                        help='对自称搜索引擎爬虫的IP做正反向DNS验证，冒充者按普通访客分析')
+    add_dns_arguments(parser)
+
+def add_dns_arguments(parser):
+    parser.add_argument('--bot-cache', default=BOT_CACHE_FILE,
+                        help=f'爬虫验证结果的缓存文件（默认 {BOT_CACHE_FILE}）')
+    parser.add_argument('--dns-server',
+                        help='验证使用的DNS服务器（HOST[:PORT]），默认取 /etc/resolv.conf，system 表示使用系统解析器')
+    parser.add_argument('--dns-concurrency', type=int, default=DNS_CONCURRENCY,
+                        help=f'同时进行的验证数（默认 {DNS_CONCURRENCY}）')
+    parser.add_argument('--dns-timeout', type=float, default=DNS_TIMEOUT,
+                        help=f'单次DNS查询的超时秒数（默认 {DNS_TIMEOUT}）')
+
+def bot_verifier_from_args(args):
+    """未指定 --verify-bots 时返回 None（按用户代理判断爬虫）；否则返回载入了缓存的 BotVerifier"""
+    if args is None or not getattr(args, 'verify_bots', False):
+        return None
+    verifier = BotVerifier(args.bot_cache, args.dns_server, args.dns_concurrency, args.dns_timeout)
+    verifier.load()
+    return verifier
+
+def main():
+    parser = argparse.ArgumentParser(description="验证自称搜索引擎爬虫的IP（正反向DNS）")
+    parser.add_argument('ips', nargs='+', help='要验证的IP')
+    parser.add_argument('--bot', choices=sorted(BOT_DOMAINS), default='googlebot', help='IP 自称的爬虫')
+    parser.add_argument('--no-cache', action='store_true', help='不读取也不保存缓存文件')
+    add_dns_arguments(parser)
+    args = parser.parse_args()
+
+    verifier = BotVerifier(None if args.no_cache else args.bot_cache, args.dns_server, args.dns_concurrency,
+                           args.dns_timeout)
+    verifier.load()
+    results = verifier.verify({ip: args.bot for ip in args.ips})
+    for ip in args.ips:
+        entry = verifier.entries.get(ip)
+        host = entry[2] if entry else ''
+        status = {True: '确认', False: '冒充', None: '查询失败'}[results.get(ip)]
+        print(f"{ip}: {status}（{args.bot}，反向解析: {host or '无'}）")
+    verifier.save()
+
+if __name__ == "__main__":
+    main()
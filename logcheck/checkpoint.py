@@ -0,0 +1,86 @@
+"""
+增量日志处理的断点存储
+记录每个日志文件的 inode、大小和已处理的字节偏移，以及各分析器跨运行保留的滚动窗口状态，
+使每次运行只处理新追加的内容。能识别 logrotate 轮转（inode 变化）和截断（copytruncate）。
+"""
+
+import glob
+import os
+import pickle
+
+# 断点状态文件的格式版本，结构变化时递增，旧文件会被忽略
+CHECKPOINT_VERSION = 4
+
+
+class CheckpointStore:
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        self.states = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            print(f"警告: 断点文件 {self.path} 损坏，将重新完整处理日志: {e}")
+            return
+        if data.get('version') != CHECKPOINT_VERSION:
+            print(f"警告: 断点文件 {self.path} 版本不匹配，将重新完整处理日志。")
+            return
+        self.files = data.get('files', {})
+        self.states = data.get('states', {})
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'version': CHECKPOINT_VERSION, 'files': self.files, 'states': self.states}, f)
+        os.replace(tmp_path, self.path)  # 原子替换，避免中途退出留下半个文件
+
+    def plan(self, log_path):
+        """
+        返回本次需要读取的 (文件路径, 起始偏移) 列表。
+        日志轮转时，先读完旧文件（按 inode 在同目录查找）剩余的部分，再从头读取新文件。
+        """
+        try:
+            st = os.stat(log_path)
+        except FileNotFoundError:
+            return []
+        saved = self.files.get(log_path)
+        if not saved:
+            return [(log_path, 0)]
+        if saved['inode'] == st.st_ino:
+            if st.st_size < saved['offset']:
+                print(f"检测到日志 {log_path} 被截断，从头开始处理。")
+                return [(log_path, 0)]
+            return [(log_path, saved['offset'])]
+
+        print(f"检测到日志 {log_path} 已轮转。")
+        plan = []
+        rotated = find_rotated_file(log_path, saved['inode'])
+        if rotated:
+            plan.append((rotated, saved['offset']))
+        return plan + [(log_path, 0)]
+
+    def update(self, log_path, offset):
+        try:
+            st = os.stat(log_path)
+        except FileNotFoundError:
+            return
+        self.files[log_path] = {'inode': st.st_ino, 'size': st.st_size, 'offset': offset}
+
+
+def find_rotated_file(log_path, inode):
+    """在日志所在目录查找 inode 与记录一致的轮转文件（如 123.log.1、123.log-20240501），跳过压缩文件"""
+    for candidate in sorted(glob.glob(glob.escape(log_path) + '*')):
+        if candidate == log_path or candidate.endswith('.gz'):
+            continue
+        try:
+            if os.stat(candidate).st_ino == inode:
+                return candidate
+        except FileNotFoundError:
+            continue
+    return None
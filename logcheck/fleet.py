@@ -0,0 +1,365 @@
+"""
+多节点汇总与合并
+同一套站点部署在多台 VPS 上时，每个节点单独运行 logcheck，分散到各节点的低频攻击在单个节点上达不到阈值。
+这里让每个节点输出一份可合并的摘要，由协调节点合并后在全局视图上重新执行严重程度规则：
+
+  summarize - 解析本节点日志，输出摘要（gzip 压缩的 JSON）：
+              logcheck 的按IP攻击汇总（请求数、首末时间、状态码、攻击类型、404 次数）、
+              按 (IP, 分钟) 的请求数（不含搜索引擎爬虫和白名单IP）、按 (站点, 小时, 大洲) 的独立访客 HyperLogLog 草图
+  serve     - 在本地 HTTP 端口提供最新的摘要（默认只监听 127.0.0.1，跨机器访问请走 SSH 隧道或内网）
+  merge     - 协调节点：从文件或 http:// 地址读取多个节点的摘要，合并后运行 logcheck 的严重程度规则
+              和 web_log_monitor 的频率规则，列出全局视图下的风险IP，可输出 JSON Lines 供 ip_risk_checker.py 读取
+
+按分钟计数只保留请求数不少于 --min-minute-count 的 (IP, 分钟)，合并后每分钟最多少计
+节点数 × (min-minute-count - 1) 次；频率规则按整分钟的桶计算（5 分钟窗口为连续 5 个分钟桶之和）。
+
+本机测试多个节点：
+  python3 fleet.py summarize --node a --output /tmp/a.json.gz --log /tmp/a.log
+  python3 fleet.py summarize --node b --output /tmp/b.json.gz --log /tmp/b.log
+  python3 fleet.py serve --summary /tmp/b.json.gz --port 8766 &
+  python3 fleet.py merge /tmp/a.json.gz http://127.0.0.1:8766/summary
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import socket
+import time
+import urllib.request
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import logcheck
+from hyperloglog import HyperLogLog, standard_error, union
+from log_discovery import log_paths_from_args
+from log_engine import add_engine_arguments, engine_from_args
+from rate_detector import RateRule
+from risk_store import RiskStore
+
+SUMMARY_VERSION = 1
+SUMMARY_FILE = '/root/logcheck/node_summary.json.gz'
+FLEET_RESULTS_FILE = '/root/logcheck/fleet_risk_ips.jsonl'
+CHECKPOINT_FILE = '/root/logcheck/fleet.checkpoint'
+SERVE_PORT = 8765
+
+# 摘要中保留最近多少小时的按分钟计数
+MINUTE_WINDOW_HOURS = 24
+# 单个节点上少于该请求数的 (IP, 分钟) 不写入摘要
+MIN_MINUTE_COUNT = 2
+
+# 与 web_log_monitor.py 的频率规则一致
+BAN_RULE = RateRule('ban', 60, 71)
+FLEET_RULES = [
+    RateRule('high_frequency', 60, 31),
+    BAN_RULE,
+    RateRule('suspicious', 300, 70),
+]
+RULE_NAMES = {'high_frequency': '每分钟超过30次', 'ban': '每分钟超过70次', 'suspicious': '5分钟内达到70次'}
+
+class MinuteCounter:
+    """按 (IP, 分钟) 统计请求数，不含搜索引擎爬虫和白名单IP，供 LogEngine 分发记录"""
+
+    def __init__(self, whitelist):
+        self.whitelist = whitelist
+        self.counts = defaultdict(Counter)
+
+    def feed(self, record):
+        ip = record.ip
+        if logcheck.is_search_engine_bot(record.user_agent) or ip in self.whitelist:
+            return
+        epoch = record.epoch
+        self.counts[ip][epoch - epoch % 60] += 1
+
+    def new_partial(self):
+        return MinuteCounter(self.whitelist)
+
+    def merge(self, partial):
+        for ip, minutes in partial.counts.items():
+            self.counts[ip].update(minutes)
+
+    def compact(self, window_hours=MINUTE_WINDOW_HOURS, min_count=MIN_MINUTE_COUNT):
+        """只保留最近 window_hours 小时内、请求数不少于 min_count 的分钟：{ip: [[分钟, 次数], ...]}"""
+        latest = max((max(minutes) for minutes in self.counts.values()), default=0)
+        cutoff = latest - window_hours * 3600
+        compacted = {}
+        for ip, minutes in self.counts.items():
+            kept = sorted([minute, count] for minute, count in minutes.items() if minute >= cutoff and count >= min_count)
+            if kept:
+                compacted[ip] = kept
+        return compacted
+
+def encode_attacks(attacks):
+    return {ip: [data["count"], data["first"], data["last"], sorted(data["statuses"]),
+                 sorted(data["attack_types"]), data["404_count"], data["sites"]]
+            for ip, data in attacks.items()}
+
+def decode_attacks(encoded):
+    attacks = {}
+    for ip, (count, first, last, statuses, attack_types, count_404, *rest) in encoded.items():
+        # 旧版本节点的汇总没有站点信息
+        attacks[ip] = {"count": count, "first": first, "last": last, "statuses": set(statuses),
+                       "attack_types": set(attack_types), "404_count": count_404, "sites": rest[0] if rest else {}}
+    return attacks
+
+def build_summary(node, attack_analyzer, minute_counter, visitors=None,
+                  window_hours=MINUTE_WINDOW_HOURS, min_minute_count=MIN_MINUTE_COUNT):
+    sketches = []
+    if visitors is not None:
+        sketches = [[site, hour, region, base64.b64encode(sketch.to_bytes()).decode()]
+                    for (site, hour, region), sketch in visitors.sketches.items()]
+    return {
+        "version": SUMMARY_VERSION,
+        "node": node,
+        "generated_at": int(time.time()),
+        "min_minute_count": min_minute_count,
+        "attacks": encode_attacks(attack_analyzer.attacks),
+        "minutes": minute_counter.compact(window_hours, min_minute_count),
+        "sketches": sketches,
+    }
+
+def write_summary(summary, path):
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def load_summary(source, timeout=30):
+    """source 为摘要文件路径或 http(s):// 地址"""
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source, timeout=timeout) as response:
+            data = response.read()
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+    summary = json.loads(gzip.decompress(data))
+    if summary.get("version") != SUMMARY_VERSION:
+        raise ValueError(f"摘要版本不受支持: {summary.get('version')}")
+    return summary
+
+class FleetView:
+    """多个节点摘要合并后的全局视图"""
+
+    def __init__(self):
+        self.nodes = []
+        self.attacks = logcheck.AttackAnalyzer(None)
+        # 每个节点单独判定的严重风险IP，用于找出只在全局视图中达到严重的IP
+        self.node_severe = set()
+        self.minutes = defaultdict(Counter)
+        self.ip_nodes = defaultdict(set)
+        self.sketches = {}
+        self.min_minute_count = 1
+
+    def add(self, summary):
+        node = summary["node"]
+        self.nodes.append(node)
+        self.min_minute_count = max(self.min_minute_count, summary["min_minute_count"])
+        partial = logcheck.AttackAnalyzer(None)
+        partial.attacks.update(decode_attacks(summary["attacks"]))
+        self.node_severe.update(ip for ip, data in logcheck.summarize_attacks(partial.attacks).items()
+                                if data["severity"] == "严重")
+        self.attacks.merge(partial)
+        for ip in summary["attacks"]:
+            self.ip_nodes[ip].add(node)
+        for ip, minutes in summary["minutes"].items():
+            counts = self.minutes[ip]
+            for minute, count in minutes:
+                counts[minute] += count
+            self.ip_nodes[ip].add(node)
+        for site, hour, region, encoded in summary["sketches"]:
+            sketch = HyperLogLog.from_bytes(base64.b64decode(encoded))
+            key = (site, hour, region)
+            if key in self.sketches:
+                self.sketches[key].update(sketch)
+            else:
+                self.sketches[key] = sketch
+
+    def rate_peaks(self):
+        """每个IP在各频率规则窗口内的最高请求数：{ip: {规则名: 次数}}，只列出至少触发一条规则的IP"""
+        peaks = {}
+        for ip, counts in self.minutes.items():
+            minutes = sorted(counts)
+            bests = {}
+            for rule in FLEET_RULES:
+                best = total = start = 0
+                for minute in minutes:
+                    total += counts[minute]
+                    while minutes[start] <= minute - rule.window:
+                        total -= counts[minutes[start]]
+                        start += 1
+                    best = max(best, total)
+                bests[rule.name] = best
+            if any(bests[rule.name] >= rule.limit for rule in FLEET_RULES):
+                peaks[ip] = bests
+        return peaks
+
+    def unique_visitors(self, site=None):
+        return union(sketch for (sketch_site, _, _), sketch in self.sketches.items()
+                     if site in (None, sketch_site)).count()
+
+def print_fleet_report(view, attacks, peaks):
+    print(f"# 集群日志汇总（{len(view.nodes)} 个节点: {', '.join(view.nodes)}）\n")
+    severe_attacks, minor_attacks, _ = logcheck.split_by_severity(attacks)
+    print(f"严重风险 (IP数量: {len(severe_attacks)}):")
+    logcheck.print_attack_table(severe_attacks)
+    print(f"\n轻微风险 (IP数量: {len(minor_attacks)}):")
+    logcheck.print_attack_table(minor_attacks)
+
+    fleet_only = sorted(attack["ip"] for attack in severe_attacks if attack["ip"] not in view.node_severe)
+    print(f"\n## 只在集群视图中达到严重级别的IP（{len(fleet_only)} 个）\n")
+    for ip in fleet_only:
+        print(f"- {ip}（出现在 {len(view.ip_nodes[ip])} 个节点: {', '.join(sorted(view.ip_nodes[ip]))}）")
+
+    print(f"\n## 集群频率检测（按分钟桶合并，每分钟最多少计 "
+          f"{len(view.nodes) * (view.min_minute_count - 1)} 次）\n")
+    print("| IP地址 | 节点数 | 最高每分钟请求 | 最高5分钟请求 | 触发规则 |")
+    print("|--------|--------|----------------|---------------|----------|")
+    for ip, bests in sorted(peaks.items(), key=lambda item: item[1]['suspicious'], reverse=True):
+        rules = ", ".join(RULE_NAMES[rule.name] for rule in FLEET_RULES if bests[rule.name] >= rule.limit)
+        print(f"| {ip} | {len(view.ip_nodes[ip])} | {bests['ban']} | {bests['suspicious']} | {rules} |")
+
+    if view.sketches:
+        sites = sorted({site for site, _, _ in view.sketches})
+        print(f"\n## 集群独立访客（HyperLogLog 估算，标准误差约 {standard_error():.1%}）\n")
+        print(f"合计: {view.unique_visitors()}")
+        for site in sites:
+            print(f"- {site}: {view.unique_visitors(site)}")
+
+def fleet_risk_entries(view, attacks, peaks):
+    """全局视图下的严重风险IP（攻击规则判定为严重，或每分钟超过封禁阈值），格式与 log_analysis.py 的 JSON Lines 相同"""
+    entries = {}
+    for ip, data in attacks.items():
+        if data["severity"] == "严重":
+            entries[ip] = {"ip": ip, "score": data["count"],
+                           "reasons": [f"攻击: {', '.join(sorted(data['attack_types'])) or '高频错误请求'}"]}
+    for ip, bests in peaks.items():
+        if bests[BAN_RULE.name] >= BAN_RULE.limit:
+            entry = entries.setdefault(ip, {"ip": ip, "score": 0, "reasons": []})
+            entry["score"] = max(entry["score"], bests[BAN_RULE.name])
+            entry["reasons"].append(f"集群每分钟最多访问 {bests[BAN_RULE.name]} 次")
+    generated_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    for ip, entry in entries.items():
+        entry.update({"source": "fleet", "nodes": sorted(view.ip_nodes[ip]), "generated_at": generated_at})
+    return sorted(entries.values(), key=lambda entry: entry["score"], reverse=True)
+
+def write_fleet_results(entries, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+def summarize(args):
+    whitelist = logcheck.load_whitelist()
+    attack_analyzer = logcheck.AttackAnalyzer(whitelist)
+    minute_counter = MinuteCounter(whitelist)
+    analyzers = [attack_analyzer, minute_counter]
+    # GeoIP 依赖缺失时摘要中不含独立访客草图
+    visitors = None
+    try:
+        import log_analysis
+        visitors = log_analysis.UniqueVisitorAnalyzer(whitelist)
+        analyzers.append(visitors)
+    except ImportError as e:
+        print(f"警告: 摘要中不包含独立访客草图: {e}")
+    try:
+        engine_from_args(analyzers, args).run(args.log or log_paths_from_args(logcheck.LOG_PATHS, args))
+    finally:
+        if visitors:
+            visitors.close()
+    summary = build_summary(args.node, attack_analyzer, minute_counter, visitors,
+                            args.window_hours, args.min_minute_count)
+    write_summary(summary, args.output)
+    print(f"节点 {args.node} 的摘要已写入 {args.output}：{len(summary['attacks'])} 个攻击IP，"
+          f"{len(summary['minutes'])} 个IP的按分钟计数，{len(summary['sketches'])} 个独立访客草图，"
+          f"{os.path.getsize(args.output)} 字节。")
+
+def serve(args):
+    summary_path = args.summary
+
+    class SummaryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ('/', '/summary'):
+                self.send_error(404)
+                return
+            try:
+                with open(summary_path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                self.send_error(404, "摘要尚未生成")
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/gzip')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((args.bind, args.port), SummaryHandler)
+    print(f"正在 http://{args.bind}:{args.port}/summary 提供摘要 {summary_path}，按 Ctrl+C 退出。")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def merge(args):
+    view = FleetView()
+    for source in args.sources:
+        try:
+            view.add(load_summary(source, args.timeout))
+        except (OSError, ValueError, socket.timeout) as e:
+            print(f"警告: 无法读取摘要 {source}，已跳过: {e}")
+    if not view.nodes:
+        print("没有可用的节点摘要。")
+        return
+    attacks = view.attacks.result()
+    peaks = view.rate_peaks()
+    print_fleet_report(view, attacks, peaks)
+
+    entries = fleet_risk_entries(view, attacks, peaks)
+    write_fleet_results(entries, args.output)
+    print(f"\n集群严重风险IP（{len(entries)} 个）已写入 {args.output}，可用 ip_risk_checker.py --results 读取并拉黑。")
+    if args.record_risk and entries:
+        risk_store = RiskStore()
+        try:
+            risk_store.record_many([entry["ip"] for entry in entries], "严重", "fleet")
+        finally:
+            risk_store.close()
+        print(f"已记录到高风险IP数据库 {risk_store.path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="多节点日志摘要的生成、提供与合并")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    summarize_parser = commands.add_parser("summarize", help="解析本节点日志并输出摘要")
+    summarize_parser.add_argument("--node", default=socket.gethostname(), help="节点名称（默认主机名）")
+    summarize_parser.add_argument("--output", default=SUMMARY_FILE, help=f"摘要文件（默认 {SUMMARY_FILE}）")
+    summarize_parser.add_argument("--log", action="append", help="日志文件，可重复指定（默认使用 logcheck.py 的 LOG_PATHS，或 --discover 自动发现的日志）")
+    summarize_parser.add_argument("--window-hours", type=int, default=MINUTE_WINDOW_HOURS,
+                                  help=f"保留最近多少小时的按分钟计数（默认 {MINUTE_WINDOW_HOURS}）")
+    summarize_parser.add_argument("--min-minute-count", type=int, default=MIN_MINUTE_COUNT,
+                                  help=f"每分钟请求数少于该值的IP不写入摘要（默认 {MIN_MINUTE_COUNT}）")
+    add_engine_arguments(summarize_parser, CHECKPOINT_FILE)
+
+    serve_parser = commands.add_parser("serve", help="通过 HTTP 提供本节点的摘要")
+    serve_parser.add_argument("--summary", default=SUMMARY_FILE, help=f"摘要文件（默认 {SUMMARY_FILE}）")
+    serve_parser.add_argument("--bind", default="127.0.0.1", help="监听地址（默认 127.0.0.1）")
+    serve_parser.add_argument("--port", type=int, default=SERVE_PORT, help=f"监听端口（默认 {SERVE_PORT}）")
+
+    merge_parser = commands.add_parser("merge", help="合并多个节点的摘要并在全局视图上检测")
+    merge_parser.add_argument("sources", nargs="+", help="摘要文件路径或 http://主机:端口/summary 地址")
+    merge_parser.add_argument("--output", default=FLEET_RESULTS_FILE,
+                              help=f"集群严重风险IP的 JSON Lines 输出（默认 {FLEET_RESULTS_FILE}）")
+    merge_parser.add_argument("--record-risk", action="store_true", help="把集群严重风险IP记录到本机高风险IP数据库")
+    merge_parser.add_argument("--timeout", type=float, default=30, help="读取远程摘要的超时秒数")
+
+    args = parser.parse_args()
+    {"summarize": summarize, "serve": serve, "merge": merge}[args.command](args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+按IP缓存的 GeoIP 查询
+原来每条日志都调用一次 reader.city()，同一批IP在繁忙的日子里被重复查询上百万次。
+这里先对IP去重，每个IP只查一次（数据库以内存映射方式打开），结果存成
+(大洲, 国家, 城市) 元组，相同的元组共用一个对象；缓存可以保存到文件跨运行复用，
+以数据库的 build_epoch 为键，GeoIP 数据库更新后旧缓存自动作废。
+"""
+
+import json
+import os
+
+import geoip2.database
+
+GEOIP_CACHE_FILE = '/root/logcheck/geoip_cache.json'
+GEOIP_CACHE_VERSION = 1
+# 保存到文件的条目上限，超出时保留最近查询的
+GEOIP_CACHE_SIZE = 200000
+
+UNKNOWN_LOCATION = ("Unknown", "Unknown", "Unknown")
+
+class GeoIPCache:
+    def __init__(self, db_path, maxsize=GEOIP_CACHE_SIZE):
+        self.reader = geoip2.database.Reader(db_path, mode=geoip2.database.MODE_MMAP)
+        self.build_epoch = self.reader.metadata().build_epoch
+        self.maxsize = maxsize
+        self.locations = {}
+        self.interned = {}
+        self.lookups = 0
+        self.loaded = 0
+
+    def _intern(self, location):
+        return self.interned.setdefault(location, location)
+
+    def lookup(self, ip):
+        """返回 (大洲, 国家, 城市)，查不到时为 UNKNOWN_LOCATION"""
+        location = self.locations.get(ip)
+        if location is None:
+            self.lookups += 1
+            try:
+                response = self.reader.city(ip)
+                location = self._intern((response.continent.name, response.country.name, response.city.name))
+            except Exception:
+                location = UNKNOWN_LOCATION
+            self.locations[ip] = location
+        return location
+
+    def lookup_many(self, ips):
+        """先去重再逐个查询，返回 {ip: (大洲, 国家, 城市)}"""
+        return {ip: self.lookup(ip) for ip in dict.fromkeys(ips)}
+
+    def load(self, path):
+        """读取持久化缓存，数据库 build_epoch 不一致时丢弃。返回载入的条目数"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (ValueError, OSError) as e:
+            print(f"警告: GeoIP缓存文件 {path} 无法读取，将重新查询: {e}")
+            return 0
+        if data.get('version') != GEOIP_CACHE_VERSION or data.get('build_epoch') != self.build_epoch:
+            return 0
+        for ip, continent, country, city in data.get('entries', []):
+            self.locations.setdefault(ip, self._intern((continent, country, city)))
+        self.loaded = len(self.locations)
+        return self.loaded
+
+    def save(self, path):
+        entries = list(self.locations.items())[-self.maxsize:]
+        data = {
+            'version': GEOIP_CACHE_VERSION,
+            'build_epoch': self.build_epoch,
+            'entries': [[ip, continent, country, city] for ip, (continent, country, city) in entries],
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def summary(self):
+        return (f"GeoIP缓存：{len(self.locations)} 个IP，本次实际查询 {self.lookups} 次，"
+                f"从缓存文件载入 {self.loaded} 个。")
+
+    def close(self):
+        self.reader.close()
+
+def add_geoip_cache_arguments(parser):
+    parser.add_argument('--geoip-cache', default=GEOIP_CACHE_FILE,
+                        help=f'GeoIP查询结果的缓存文件，数据库未更新时跨运行复用（默认 {GEOIP_CACHE_FILE}）')
+    parser.add_argument('--no-geoip-cache', action='store_true', help='不读取也不保存GeoIP缓存文件')
+
+def geoip_cache_path(args):
+    if args is None or getattr(args, 'no_geoip_cache', True):
+        return None
+    return args.geoip_cache
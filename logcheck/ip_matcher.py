@@ -0,0 +1,155 @@
+"""
+CIDR 前缀匹配
+把网段（爬虫IP段、白名单、Googlebot 官方IP段）编译成按起始地址排序、互不重叠的整数区间，
+IPv4 和 IPv6 各一组，查询时用 bisect 二分，O(log n)。IP 字符串用 inet_pton 转整数，
+比逐行构造 ipaddress 对象再逐个网段比较快得多；白名单文件也因此可以写网段。
+安装了 NumPy 时，contains_many 对一批 IPv4 地址用 searchsorted 一次完成查询。
+"""
+
+import ipaddress
+import json
+import os
+import socket
+from bisect import bisect_right
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Googlebot 官方IP段（googlebot_blocker.py 使用的同一份数据）的本地副本，存在时加载：
+# curl -o /root/logcheck/googlebot.json https://developers.google.com/search/apis/ipranges/googlebot.json
+GOOGLEBOT_JSON_PATH = '/root/logcheck/googlebot.json'
+
+# 单个 IP 查询结果的缓存条目上限，超过后清空重来
+MATCH_CACHE_SIZE = 65536
+
+def ip_to_int(ip):
+    """返回 (版本, 整数)，不是合法IP时返回 None"""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except OSError:
+        pass
+    try:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+    except (OSError, ValueError):
+        return None
+
+class CidrMatcher:
+    def __init__(self, networks=()):
+        self.networks = []
+        self.compiled = None
+        self.cache = {}
+        for network in networks:
+            self.add(network)
+
+    def add(self, network):
+        """network 为 ip_network 对象或 '1.2.3.0/24'、'1.2.3.4' 形式的字符串"""
+        if not isinstance(network, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            network = ipaddress.ip_network(network.strip(), strict=False)
+        self.networks.append(network)
+        self.compiled = None
+
+    def update(self, networks):
+        for network in networks:
+            self.add(network)
+
+    def __len__(self):
+        return len(self.networks)
+
+    def compile(self):
+        """把网段合并成按起始地址排序、互不重叠的区间：{版本: (起始列表, 结束列表)}"""
+        intervals = {4: [], 6: []}
+        for network in self.networks:
+            intervals[network.version].append((int(network.network_address), int(network.broadcast_address)))
+        compiled = {}
+        for version, ranges in intervals.items():
+            starts, ends = [], []
+            for start, end in sorted(ranges):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            compiled[version] = (starts, ends)
+        self.compiled = compiled
+        self.cache = {}
+        return compiled
+
+    def _match(self, version, value):
+        starts, ends = self.compiled[version]
+        index = bisect_right(starts, value) - 1
+        return index >= 0 and value <= ends[index]
+
+    def __contains__(self, ip):
+        if self.compiled is None:
+            self.compile()
+        result = self.cache.get(ip)
+        if result is None:
+            parsed = ip_to_int(ip)
+            result = parsed is not None and self._match(*parsed)
+            if len(self.cache) >= MATCH_CACHE_SIZE:
+                self.cache.clear()
+            self.cache[ip] = result
+        return result
+
+    def contains_many(self, ips):
+        """批量查询，返回与 ips 等长的布尔列表；重复的IP只查询一次"""
+        if self.compiled is None:
+            self.compile()
+        unique = list(dict.fromkeys(ips))
+        parsed = [ip_to_int(ip) for ip in unique]
+        if np is None:
+            hits = [value is not None and self._match(*value) for value in parsed]
+        else:
+            hits = np.zeros(len(parsed), dtype=bool)
+            starts, ends = self.compiled[4]
+            v4_rows = [row for row, value in enumerate(parsed) if value is not None and value[0] == 4]
+            if v4_rows and starts:
+                values = np.fromiter((parsed[row][1] for row in v4_rows), dtype=np.int64, count=len(v4_rows))
+                index = np.searchsorted(np.asarray(starts, dtype=np.int64), values, side='right') - 1
+                hits[v4_rows] = (index >= 0) & (values <= np.asarray(ends, dtype=np.int64)[np.maximum(index, 0)])
+            for row, value in enumerate(parsed):
+                if value is not None and value[0] == 6:
+                    hits[row] = self._match(6, value[1])
+            hits = hits.tolist()
+        result = dict(zip(unique, hits))
+        return [result[ip] for ip in ips]
+
+def read_network_file(path):
+    """读取每行一个IP或网段的文件（# 开头为注释），返回网段列表，无法解析的行跳过"""
+    networks = []
+    with open(path, 'r') as f:
+        for line in f:
+            entry = line.split('#', 1)[0].strip()
+            if not entry:
+                continue
+            try:
+                networks.append(ipaddress.ip_network(entry, strict=False))
+            except ValueError:
+                pass
+    return networks
+
+def read_googlebot_json(path=GOOGLEBOT_JSON_PATH):
+    """读取 Googlebot IP段 JSON（{"prefixes": [{"ipv4Prefix": ...}, {"ipv6Prefix": ...}]}），文件不存在时返回空列表"""
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return []
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"警告: 无法读取Googlebot IP段文件 {path}: {e}")
+        return []
+    networks = []
+    for prefix in data.get('prefixes', []):
+        value = prefix.get('ipv4Prefix') or prefix.get('ipv6Prefix')
+        if value:
+            networks.append(ipaddress.ip_network(value, strict=False))
+    return networks
+
+def load_whitelist_matcher(path):
+    """白名单文件（每行一个IP或网段）编译成匹配器，文件不存在时为空"""
+    matcher = CidrMatcher()
+    if os.path.exists(path):
+        matcher.update(read_network_file(path))
+    return matcher
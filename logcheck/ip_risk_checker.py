@@ -1,11 +1,39 @@
+import argparse
+import json
 import re
 import os
+import subprocess
+
+from ban_backend import add_ban_arguments, ban_backend_from_args, normalize_ips
 
 # 定义日志分析结果文件路径
 LOG_ANALYSIS_FILE = "/root/logcheck/log_analysis.txt"
+# log_analysis.py 输出的可疑IP结构化结果（JSON Lines），存在时优先读取
+SUSPICIOUS_RESULTS_FILE = "/root/logcheck/suspicious_ips.jsonl"
 WHITELIST_FILE = "/root/logcheck/ip_whitelist.txt"
 
+# 默认用 ipset 集合 + 一条 iptables 规则封禁，一批IP一次 ipset restore 写入，
+# 不再逐个 ufw insert（规则越多插入越慢）
+DEFAULT_BACKEND = "ipset"
+
+def load_suspicious_results(results_file):
+    """读取 JSON Lines 结果，返回按分数从高到低排列的条目列表，无法解析的行跳过"""
+    entries = []
+    with open(results_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry.get('ip'):
+                entries.append(entry)
+    return sorted(entries, key=lambda entry: entry.get('score', 0), reverse=True)
+
 def extract_suspicious_ips(log_analysis_file):
+    """旧版 log_analysis.py 只输出 markdown 报告，从其中的可疑IP表格提取"""
     suspicious_ips = []
     ip_regions = {}
     with open(log_analysis_file, 'r', encoding='utf-8') as f:
@@ -23,16 +51,54 @@ def extract_suspicious_ips(log_analysis_file):
                 ip_regions[ip] = region
     return suspicious_ips, ip_regions
 
-def block_ip(ip):
-    os.system(f"sudo ufw insert 1 deny from {ip} to any")
-    print(f"已拉黑IP: {ip}")
+def load_suspicious_ips(results_file, log_analysis_file):
+    """返回 (可疑IP列表, {IP: 地区}, {IP: 条目})；没有结构化结果时退回解析 markdown 报告"""
+    if os.path.exists(results_file):
+        entries = load_suspicious_results(results_file)
+        return ([entry['ip'] for entry in entries], {entry['ip']: entry.get('region', '未知') for entry in entries},
+                {entry['ip']: entry for entry in entries})
+    if not os.path.exists(log_analysis_file):
+        return [], {}, {}
+    suspicious_ips, ip_regions = extract_suspicious_ips(log_analysis_file)
+    return suspicious_ips, ip_regions, {}
 
-def unblock_ip(ip):
-    os.system(f"sudo ufw delete deny from {ip} to any")
-    print(f"已解封IP: {ip}")
+def block_ips(backend, ips):
+    """一次提交整批IP，已封禁的IP跳过"""
+    ips, invalid = normalize_ips(ips)
+    for ip in invalid:
+        print(f"无效IP，已跳过: {ip}")
+    if not ips:
+        print("没有需要拉黑的IP。")
+        return
+    try:
+        blocked = backend.ban(ips)
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"拉黑IP时出错: {e}")
+        return
+    for ip in blocked:
+        print(f"已拉黑IP: {ip}")
+    print(f"共拉黑 {len(blocked)} 个IP，{len(ips) - len(blocked)} 个此前已在封禁列表中。")
 
-def view_blocked_ips():
-    os.system("sudo ufw status | grep DENY")
+def unblock_ip(backend, ip):
+    try:
+        removed = backend.unban([ip])
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"解封IP时出错: {e}")
+        return
+    if removed:
+        print(f"已解封IP: {ip}")
+    else:
+        print(f"IP {ip} 不在 {backend.name} 封禁列表中。")
+
+def view_blocked_ips(backend):
+    try:
+        banned = sorted(backend.list_banned())
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"读取封禁列表时出错: {e}")
+        return
+    print(f"{backend.name} 封禁列表共 {len(banned)} 个IP：")
+    for ip in banned:
+        print(f"- {ip}")
 
 def view_ufw_status():
     os.system("sudo ufw status numbered")
@@ -54,7 +120,7 @@ def load_whitelist():
             return {line.strip() for line in f}
     return set()
 
-def menu(suspicious_ips, ip_regions, whitelist):
+def menu(suspicious_ips, ip_regions, whitelist, backend):
     while True:
         print("\n菜单:")
         print("1. 拉黑全部可疑IP")
@@ -68,21 +134,18 @@ def menu(suspicious_ips, ip_regions, whitelist):
         choice = input("请选择一个选项: ")
 
         if choice == '1':
-            for ip in suspicious_ips:
-                if ip not in whitelist:
-                    block_ip(ip)
+            block_ips(backend, [ip for ip in suspicious_ips if ip not in whitelist])
         elif choice == '2':
-            for ip in suspicious_ips:
-                if ip not in whitelist and ip_regions[ip] not in ["亚洲"]:
-                    block_ip(ip)
+            block_ips(backend, [ip for ip in suspicious_ips
+                                if ip not in whitelist and ip_regions[ip] not in ["亚洲"]])
         elif choice == '3':
             ip_to_block = input("请输入要拉黑的IP: ")
-            block_ip(ip_to_block)
+            block_ips(backend, [ip_to_block])
         elif choice == '4':
             ip_to_unblock = input("请输入要解封的IP: ")
-            unblock_ip(ip_to_unblock)
+            unblock_ip(backend, ip_to_unblock)
         elif choice == '5':
-            view_blocked_ips()
+            view_blocked_ips(backend)
         elif choice == '6':
             view_ufw_status()
         elif choice == '7':
@@ -94,18 +157,28 @@ def menu(suspicious_ips, ip_regions, whitelist):
             print("无效选项，请重试。")
 
 def main():
-    suspicious_ips, ip_regions = extract_suspicious_ips(LOG_ANALYSIS_FILE)
+    parser = argparse.ArgumentParser(description="可疑IP风险检查与批量拉黑")
+    parser.add_argument("--results", default=SUSPICIOUS_RESULTS_FILE,
+                        help=f"log_analysis.py 输出的可疑IP结果（默认 {SUSPICIOUS_RESULTS_FILE}）")
+    add_ban_arguments(parser, DEFAULT_BACKEND)
+    args = parser.parse_args()
+
+    suspicious_ips, ip_regions, entries = load_suspicious_ips(args.results, LOG_ANALYSIS_FILE)
     whitelist = load_whitelist()
-    
+
     if not suspicious_ips:
         print("未找到可疑IP。")
         return
 
     print(f"找到 {len(suspicious_ips)} 个可疑IP：")
     for ip in suspicious_ips:
-        print(f"- {ip}")
+        entry = entries.get(ip)
+        if entry:
+            print(f"- {ip}（{entry.get('region', '未知')}，{'；'.join(entry.get('reasons', []))}）")
+        else:
+            print(f"- {ip}")
 
-    menu(suspicious_ips, ip_regions, whitelist)
+    menu(suspicious_ips, ip_regions, whitelist, ban_backend_from_args(args))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,214 @@
+"""
+响应耗时统计
+nginx 的日志格式中加入 $request_time、$upstream_response_time（可选 $upstream_addr）后，
+按路由模板和上游（PHP-FPM 的 socket 或 地址:端口）统计耗时分布，找出最拖慢 PHP-FPM 的页面，决定优先缓存哪些页面。
+
+支持两种写法，写在 combined 格式的用户代理之后：
+    ... "$http_user_agent" rt=$request_time urt="$upstream_response_time" uaddr="$upstream_addr"
+    ... "$http_user_agent" "$http_x_forwarded_for" $request_time $upstream_response_time
+日志中没有耗时字段时分析器不统计任何内容，报表中也不输出这一节。
+
+耗时分布用对数分桶的直方图保存：相邻桶的上界相差 5%，分位数的相对误差不超过 5%，
+内存只与出现过的桶数有关，与请求量无关；两个直方图按桶相加即可合并。
+"""
+
+import math
+import re
+
+from log_discovery import site_name
+from routes import route_template
+
+# 相邻桶上界的比例，决定分位数的相对误差
+BUCKET_GROWTH = 1.05
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+# 路由、上游各自最多统计的键数，超过后新出现的键并入 OTHER_KEY，防止扫描器的随机 URL 撑大内存
+MAX_LATENCY_KEYS = 2000
+OTHER_KEY = '(其他)'
+
+# 报表中的分位数
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 耗时字符串 -> 桶编号的缓存上限；nginx 耗时精确到毫秒，不同的取值有限
+BUCKET_CACHE_SIZE = 65536
+_bucket_cache = {}
+
+_NUMBER = r'(?:\d+(?:\.\d+)?|-)'
+_ADDRESS = r'(?:unix:[^\s,"]+|[\w.\-\[\]]+:\d+|-)'
+# 多个上游（重试、内部跳转）之间用 ", " 或 " : " 分隔
+_SEPARATOR = r'(?:\s*,\s*|\s+:\s+)'
+
+# key=value 写法，值可以加引号
+TIMING_FIELD = re.compile(
+    r'\b(?P<key>rt|request_time|urt|upstream_response_time|uaddr|upstream_addr)='
+    r'(?P<quote>"?)(?P<value>[^"\s]*(?:' + _SEPARATOR + r'[^"\s]+)*)(?P=quote)')
+# 行尾直接跟耗时的写法：$request_time [$upstream_response_time [$upstream_addr]]，值可以加引号
+TIMING_TAIL = re.compile(
+    r'(?:^|\s)"?(?P<rt>\d+\.\d+)"?'
+    r'(?:\s+"?(?P<urt>' + _NUMBER + '(?:' + _SEPARATOR + _NUMBER + r')*)"?)?'
+    r'(?:\s+"?(?P<uaddr>' + _ADDRESS + '(?:' + _SEPARATOR + _ADDRESS + r')*)"?)?\s*$')
+
+FIELD_NAMES = {
+    'rt': 'rt', 'request_time': 'rt',
+    'urt': 'urt', 'upstream_response_time': 'urt',
+    'uaddr': 'uaddr', 'upstream_addr': 'uaddr',
+}
+
+def split_values(value):
+    return re.split(_SEPARATOR, value) if value else []
+
+def request_timings(tail):
+    """
+    从用户代理之后的内容中取出耗时，返回 (请求耗时秒数, [(上游地址, 上游耗时秒数), ...])；
+    没有耗时字段时返回 None。没有记录上游地址时地址为 '-'，没有经过上游（静态文件）时列表为空。
+    """
+    if not tail:
+        return None
+    fields = {}
+    if '=' in tail:
+        fields = {FIELD_NAMES[m.group('key')]: m.group('value') for m in TIMING_FIELD.finditer(tail)}
+    if 'rt' not in fields:
+        m = TIMING_TAIL.search(tail)
+        fields = m.groupdict() if m else {}
+    request_time = fields.get('rt')
+    if not request_time or request_time == '-':
+        return None
+    try:
+        request_time = float(request_time)
+    except ValueError:
+        return None
+    times = split_values(fields.get('urt'))
+    addresses = split_values(fields.get('uaddr'))
+    upstream = []
+    for index, value in enumerate(times):
+        if value == '-':
+            continue
+        try:
+            seconds = float(value)
+        except ValueError:
+            continue
+        upstream.append((addresses[index] if index < len(addresses) else '-', seconds))
+    return request_time, upstream
+
+def bucket_index(seconds):
+    """耗时所在桶的编号，桶 i 的上界为 BUCKET_GROWTH ** i 毫秒；不足 1 毫秒的记入桶 0"""
+    index = _bucket_cache.get(seconds)
+    if index is None:
+        if len(_bucket_cache) >= BUCKET_CACHE_SIZE:
+            _bucket_cache.clear()
+        milliseconds = seconds * 1000
+        index = _bucket_cache[seconds] = math.ceil(math.log(milliseconds) / _LOG_GROWTH) if milliseconds > 1 else 0
+    return index
+
+def bucket_bound(index):
+    """桶的上界（秒）"""
+    return BUCKET_GROWTH ** index / 1000
+
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        index = bucket_index(seconds)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def update(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """分位数的估算值（秒）：所在桶的上界，不超过实际最大值"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(bucket_bound(index), self.max)
+        return self.max
+
+class LatencyAnalyzer:
+    """按 (站点, 路由模板) 统计请求耗时，按上游地址统计上游耗时，供 LogEngine 分发记录"""
+
+    def __init__(self, max_keys=MAX_LATENCY_KEYS):
+        self.max_keys = max_keys
+        self.routes = {}
+        self.upstreams = {}
+        self.site = ''
+
+    def begin_file(self, log_path):
+        self.site = site_name(log_path)
+
+    def histogram(self, histograms, key):
+        histogram = histograms.get(key)
+        if histogram is None:
+            if len(histograms) >= self.max_keys:
+                key = (key[0], OTHER_KEY) if isinstance(key, tuple) else OTHER_KEY
+                histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = LatencyHistogram()
+        return histogram
+
+    def feed(self, record):
+        timings = request_timings(record.tail)
+        if timings is not None:
+            self.add(route_template(record.url), timings)
+
+    def add(self, route, timings):
+        """记录一条请求的耗时；timings 为 request_timings 的结果，站点取当前文件的站点"""
+        request_time, upstream = timings
+        self.histogram(self.routes, (self.site, route)).add(request_time)
+        for address, seconds in upstream:
+            self.histogram(self.upstreams, address).add(seconds)
+
+    def new_partial(self):
+        return LatencyAnalyzer(self.max_keys)
+
+    def merge(self, partial):
+        for mine, theirs in ((self.routes, partial.routes), (self.upstreams, partial.upstreams)):
+            for key, histogram in theirs.items():
+                self.histogram(mine, key).update(histogram)
+
+    def clear(self):
+        self.routes = {}
+        self.upstreams = {}
+
+def format_seconds(seconds):
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+def latency_rows(histograms, limit):
+    """按总耗时从多到少排列的 (键, 直方图, 占总耗时的比例)"""
+    grand_total = sum(histogram.total for histogram in histograms.values()) or 1.0
+    ranked = sorted(histograms.items(), key=lambda item: item[1].total, reverse=True)[:limit]
+    return [(key, histogram, histogram.total / grand_total) for key, histogram in ranked]
+
+def latency_report(analyzer, limit=20):
+    """耗时报表的 markdown 行：总耗时最多的路由（优先缓存的候选）和各上游的耗时分布"""
+    quantile_headers = ' | '.join(f"p{q * 100:g}" for q in QUANTILES)
+    lines = [f"## 耗时最多的前{limit}个路由（$request_time）", "",
+             f"| 站点 | 路由 | 请求次数 | {quantile_headers} | 总耗时 | 占比 |",
+             "|------|------|----------|" + "-----|" * len(QUANTILES) + "--------|------|"]
+    for (site, route), histogram, share in latency_rows(analyzer.routes, limit):
+        quantiles = ' | '.join(format_seconds(histogram.quantile(q)) for q in QUANTILES)
+        lines.append(f"| {site or '-'} | {route} | {histogram.count} | {quantiles} | "
+                     f"{histogram.total:.1f}s | {share:.1%} |")
+    if analyzer.upstreams:
+        lines += ["", "## 各上游耗时（$upstream_response_time）", "",
+                  f"| 上游 | 请求次数 | {quantile_headers} | 总耗时 | 占比 |",
+                  "|------|----------|" + "-----|" * len(QUANTILES) + "--------|------|"]
+        for address, histogram, share in latency_rows(analyzer.upstreams, limit):
+            quantiles = ' | '.join(format_seconds(histogram.quantile(q)) for q in QUANTILES)
+            lines.append(f"| {address if address != '-' else '（未记录地址）'} | {histogram.count} | {quantiles} | "
+                         f"{histogram.total:.1f}s | {share:.1%} |")
+    return lines
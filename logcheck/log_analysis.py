@@ -1,10 +1,18 @@
-import re
-import geoip2.database
+import argparse
 from collections import Counter
 import ipaddress
 from datetime import datetime
+import json
 import os
 
+from aggregate_store import AGGREGATE_DB, AggregateStore, bucket_start
+from geoip_cache import GEOIP_CACHE_FILE, GeoIPCache, add_geoip_cache_arguments, geoip_cache_path
+from hyperloglog import HyperLogLog, hash_position, standard_error, union
+from ip_matcher import CidrMatcher, load_whitelist_matcher, read_googlebot_json
+from latency import LatencyAnalyzer, latency_report
+from log_discovery import log_paths_from_args, site_name
+from log_engine import LogEngine, add_engine_arguments, engine_from_args
+
 # 定义日志文件路径列表
 LOG_PATHS = [
     "/www/wwwlogs/123.log",
@@ -23,6 +31,12 @@ os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 # 定义输出文件路径
 OUTPUT_PATH = os.path.join(OUTPUT_FOLDER, "log_analysis.txt")
 
+# 可疑IP的结构化结果（JSON Lines），供 ip_risk_checker.py 直接读取
+SUSPICIOUS_RESULTS_PATH = os.path.join(OUTPUT_FOLDER, "suspicious_ips.jsonl")
+
+# 定义增量模式的断点文件路径
+CHECKPOINT_PATH = os.path.join(OUTPUT_FOLDER, "log_analysis.checkpoint")
+
 # 定义白名单文件路径
 WHITELIST_PATH = "/root/logcheck/ip_whitelist.txt"
 
@@ -50,130 +64,351 @@ CRAWLER_IPS = [
     ipaddress.ip_network("57.141.3.0/24"),   # FacebookBot IP范围
 ]
 
+# 爬虫IP段编译成区间表，另外加载 Googlebot 官方IP段（本地副本存在时）
+CRAWLER_MATCHER = CidrMatcher(CRAWLER_IPS + read_googlebot_json())
+
+# 大洲的中文名称，用于独立访客统计
+REGION_NAMES = {
+    "Asia": "亚洲",
+    "North America": "北美洲",
+    "Europe": "欧洲",
+    "South America": "南美洲",
+    "Africa": "非洲",
+    "Oceania": "大洋洲",
+    "Antarctica": "南极洲",
+    "Unknown": "未知",
+}
+
+# 独立访客统计中每个IP的查询结果缓存上限，超过后清空重来
+VISITOR_CACHE_SIZE = 65536
+
 def load_whitelist():
-    whitelist = set()
-    if os.path.exists(WHITELIST_PATH):
-        with open(WHITELIST_PATH, 'r') as f:
-            for line in f:
-                ip = line.strip()
-                if re.match(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$', ip):
-                    whitelist.add(ip)
-    return whitelist
+    # 白名单每行一个IP或网段
+    return load_whitelist_matcher(WHITELIST_PATH)
 
 def is_crawler_ip(ip):
-    try:
-        ip_obj = ipaddress.ip_address(ip)
-        return any(ip_obj in network for network in CRAWLER_IPS)
-    except ValueError:
-        return False
+    return ip in CRAWLER_MATCHER
+
+class RegionAnalyzer:
+    """
+    按IP汇总非爬虫IP的请求，供 LogEngine 分发记录：各站点的请求次数和每分钟的请求次数，
+    内存与IP数、(IP, 分钟) 数有关，不保存单条记录
+    """
+
+    def __init__(self):
+        # {(ip, 分钟): 请求次数}，用于每分钟频率检测；增量模式下包含从上次运行带过来的最后一分钟
+        self.minute_counts = {}
+        # {ip: {站点: 请求次数}}，用于按地区统计IP和在报表中标明IP访问的站点
+        self.ip_sites = {}
+        self.site = ""
+
+    def begin_file(self, log_path):
+        self.site = site_name(log_path)
+
+    def feed(self, record):
+        ip = record.ip
+        if not is_crawler_ip(ip):
+            # Unix 时间戳（秒）按分钟分组
+            key = (ip, record.epoch // 60)
+            self.minute_counts[key] = self.minute_counts.get(key, 0) + 1
+            sites = self.ip_sites.get(ip)
+            if sites is None:
+                sites = self.ip_sites[ip] = {}
+            sites[self.site] = sites.get(self.site, 0) + 1
+
+    def new_partial(self):
+        return RegionAnalyzer()
+
+    def merge(self, partial):
+        minute_counts = self.minute_counts
+        for key, count in partial.minute_counts.items():
+            minute_counts[key] = minute_counts.get(key, 0) + count
+        for ip, part in partial.ip_sites.items():
+            sites = self.ip_sites.setdefault(ip, {})
+            for site, count in part.items():
+                sites[site] = sites.get(site, 0) + count
+
+    def get_state(self):
+        # 保留最后一分钟的计数，使跨越两次运行的同一分钟也能完整计数
+        if not self.minute_counts:
+            return {"carried_counts": []}
+        last_minute = max(minute for _, minute in self.minute_counts)
+        return {"carried_counts": [(ip, minute, count) for (ip, minute), count in self.minute_counts.items()
+                                   if minute == last_minute]}
+
+    def set_state(self, state):
+        carried = state.get("carried_counts")
+        if carried is None:
+            # 旧版本保存的是最后一分钟的 (ip, 时间戳) 记录
+            carried = [(ip, timestamp // 60, 1) for ip, timestamp in state.get("carried_pairs", [])]
+        for ip, minute, count in carried:
+            self.minute_counts[(ip, minute)] = self.minute_counts.get((ip, minute), 0) + count
+
+class UniqueVisitorAnalyzer:
+    """
+    按 (站点, 小时, 大洲) 统计独立访客（非爬虫、非白名单IP）的 HyperLogLog 草图，不保存IP本身。
+    大洲在解析时通过 GeoIP 查询（每个IP只查一次）；GeoIP 数据库不可用时全部记为 Unknown。
+    """
+
+    def __init__(self, whitelist=None, geoip_db_path=GEOIP_DB_PATH):
+        self.whitelist = whitelist if whitelist is not None else CidrMatcher()
+        self.geoip_db_path = geoip_db_path
+        self.site = ""
+        self.sketches = {}
+        self.geo = None
+        self.cache = {}
+
+    def __getstate__(self):
+        # GeoIP reader 不能跨进程传递，工作进程中重新打开
+        state = self.__dict__.copy()
+        state['geo'] = None
+        state['cache'] = {}
+        return state
+
+    def begin_file(self, log_path):
+        self.site = site_name(log_path)
+
+    def locate(self, ip):
+        if self.geo is None:
+            try:
+                self.geo = GeoIPCache(self.geoip_db_path)
+            except (OSError, ValueError) as e:
+                print(f"警告: 无法打开GeoIP数据库，独立访客的地区记为 Unknown: {e}")
+                self.geo = False
+        if not self.geo:
+            return "Unknown"
+        return self.geo.lookup(ip)[0] or "Unknown"
+
+    def feed(self, record):
+        ip = record.ip
+        entry = self.cache.get(ip)
+        if entry is None:
+            if len(self.cache) >= VISITOR_CACHE_SIZE:
+                self.cache.clear()
+            if is_crawler_ip(ip) or ip in self.whitelist:
+                entry = self.cache[ip] = ()
+            else:
+                entry = self.cache[ip] = (self.locate(ip), *hash_position(ip))
+        if not entry:
+            return
+        region, index, rank = entry
+        key = (self.site, bucket_start(record.epoch, 3600), region)
+        sketch = self.sketches.get(key)
+        if sketch is None:
+            sketch = self.sketches[key] = HyperLogLog()
+        sketch.add_position(index, rank)
+
+    def new_partial(self):
+        partial = UniqueVisitorAnalyzer(self.whitelist, self.geoip_db_path)
+        partial.site = self.site
+        return partial
+
+    def merge(self, partial):
+        for key, sketch in partial.sketches.items():
+            if key in self.sketches:
+                self.sketches[key].update(sketch)
+            else:
+                self.sketches[key] = sketch
+
+    def unique(self, site=None, hour=None, region=None):
+        """合并符合条件的草图，估算独立访客数；条件为 None 表示不限"""
+        return union(sketch for (sketch_site, sketch_hour, sketch_region), sketch in self.sketches.items()
+                     if site in (None, sketch_site) and hour in (None, sketch_hour)
+                     and region in (None, sketch_region)).count()
+
+    def close(self):
+        if self.geo:
+            self.geo.close()
+        self.geo = None
 
 def parse_log_file(log_path):
-    ip_pattern = r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}'
-    timestamp_pattern = r'\[(\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2})'
-    ip_time_pairs = []
-    
-    with open(log_path, 'r') as f:
-        for line in f:
-            ip_match = re.search(ip_pattern, line)
-            timestamp_match = re.search(timestamp_pattern, line)
-            if ip_match and timestamp_match:
-                ip = ip_match.group()
-                timestamp = datetime.strptime(timestamp_match.group(1), '%d/%b/%Y:%H:%M:%S')
-                if not is_crawler_ip(ip):
-                    ip_time_pairs.append((ip, timestamp))
-    
-    return ip_time_pairs
+    analyzer = RegionAnalyzer()
+    LogEngine([analyzer]).process_file(log_path)
+    return analyzer
 
-def get_ip_location(ip, reader):
-    try:
-        response = reader.city(ip)
-        continent = response.continent.name
-        country = response.country.name
-        city = response.city.name
-        return continent, country, city
-    except:
-        return "Unknown", "Unknown", "Unknown"
-
-def analyze_ips(ip_time_pairs, reader, whitelist):
-    asia_ips = []
-    north_america_ips = []
-    for ip, timestamp in ip_time_pairs:
-        if ip in whitelist:
-            continue  # 排除白名单中的IP
-        continent, country, city = get_ip_location(ip, reader)
+def analyze_ips(ip_sites, geo, whitelist):
+    """返回亚洲、北美洲各IP的请求次数 Counter({(ip, 城市): 次数})，IP数即 Counter 的长度"""
+    asia_ips = Counter()
+    north_america_ips = Counter()
+    ips = [ip for ip in ip_sites if ip not in whitelist]  # 排除白名单中的IP
+    locations = geo.lookup_many(ips)
+    for ip in ips:
+        continent, country, city = locations[ip]
         if continent == "Asia":
-            asia_ips.append((ip, city))
+            asia_ips[(ip, city)] = sum(ip_sites[ip].values())
         elif continent == "North America":
-            north_america_ips.append((ip, city))
+            north_america_ips[(ip, city)] = sum(ip_sites[ip].values())
     return asia_ips, north_america_ips
 
 def get_top_ips(ips, n=15):
-    return Counter(ips).most_common(n)
+    return ips.most_common(n)
 
-def get_suspicious_ips(ip_time_pairs, reader, whitelist):
-    ip_minute_counts = {}
-    for ip, timestamp in ip_time_pairs:
-        if ip in whitelist:
-            continue  # 排除白名单中的IP
-        minute_key = timestamp.strftime('%Y-%m-%d %H:%M')
-        if ip not in ip_minute_counts:
-            ip_minute_counts[ip] = Counter()
-        ip_minute_counts[ip][minute_key] += 1
+def get_suspicious_ips(minute_counts, geo, whitelist):
+    max_counts = {}
+    for (ip, _), count in minute_counts.items():
+        if count > max_counts.get(ip, 0):
+            max_counts[ip] = count
     
     suspicious_ips = []
-    for ip, minute_counts in ip_minute_counts.items():
-        if any(count >= 30 for count in minute_counts.values()):
-            max_count = max(minute_counts.values())
-            continent, _, _ = get_ip_location(ip, reader)
+    for ip, max_count in max_counts.items():
+        if max_count >= 30 and ip not in whitelist:  # 排除白名单中的IP
+            continent, _, _ = geo.lookup(ip)
             region = "亚洲" if continent == "Asia" else "北美洲" if continent == "North America" else "未知"
             suspicious_ips.append((ip, max_count, region))
     
     return sorted(suspicious_ips, key=lambda x: x[1], reverse=True)
 
-def write_results_to_file(output_path, asia_ips, north_america_ips, suspicious_ips):
+def format_sites(ip_sites, ip):
+    """IP访问过的站点，按请求次数从多到少"""
+    sites = ip_sites.get(ip, {})
+    return ", ".join(site or "-" for site, _ in sorted(sites.items(), key=lambda item: (-item[1], item[0])))
+
+def write_site_summary(f, ip_sites, whitelist):
+    """跨站点视图：各站点的请求次数和访问IP数（非爬虫、非白名单），上面各表为全部站点合并的结果"""
+    requests = Counter()
+    unique_ips = Counter()
+    for ip, sites in ip_sites.items():
+        if ip in whitelist:
+            continue
+        for site, count in sites.items():
+            requests[site] += count
+            unique_ips[site] += 1
+    f.write(f"\n## 各站点访问汇总（站点数量: {len(requests)}）\n\n")
+    f.write("| 站点 | 请求次数 | IP数量 |\n")
+    f.write("|-----|----------|--------|\n")
+    for site, count in requests.most_common():
+        f.write(f"| {site or '-'} | {count} | {unique_ips[site]} |\n")
+
+def write_unique_visitors(f, visitors):
+    f.write(f"\n## 独立访客（HyperLogLog 估算，标准误差约 {standard_error():.1%}）\n\n")
+    f.write(f"总独立访客: {visitors.unique()}\n\n")
+    for title, label, position in (("地区", "地区", 2), ("站点", "站点", 0), ("小时", "时间", 1)):
+        values = sorted({key[position] for key in visitors.sketches})
+        f.write(f"按{title}:\n\n")
+        f.write(f"| {label} | 独立访客 |\n")
+        f.write("|-----|----------|\n")
+        for value in values:
+            count = visitors.unique(**{("site", "hour", "region")[position]: value})
+            if position == 2:
+                value = REGION_NAMES.get(value, value)
+            elif position == 1:
+                value = datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:00')
+            f.write(f"| {value} | {count} |\n")
+        f.write("\n")
+
+def write_visitor_sketches(visitors, db_path):
+    """把按小时的草图合并进聚合数据库，之后可从中查询按天、按周的独立访客"""
+    store = AggregateStore(db_path)
+    try:
+        written = store.write_sketches(visitors.sketches)
+        store.prune()
+    finally:
+        store.close()
+    print(f"已将 {written} 个按小时的独立访客草图写入 {db_path}。")
+
+def write_suspicious_results(path, suspicious_ips, ip_sites=None):
+    """每行一个可疑IP：ip、score（最大每分钟访问次数）、region、sites、reasons，先写临时文件再替换"""
+    generated_at = datetime.now().isoformat(timespec='seconds')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for ip, max_count, region in suspicious_ips:
+            entry = {
+                "ip": ip,
+                "score": max_count,
+                "region": region,
+                "sites": sorted((ip_sites or {}).get(ip, {})),
+                "reasons": [f"每分钟最多访问 {max_count} 次"],
+                "source": "log_analysis",
+                "generated_at": generated_at,
+            }
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+def write_results_to_file(output_path, asia_ips, north_america_ips, suspicious_ips, visitors=None,
+                          ip_sites=None, whitelist=(), latency=None):
+    ip_sites = ip_sites or {}
     with open(output_path, 'w', encoding='utf-8') as f:
         f.write(f"# 日志分析结果 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
         
         f.write(f"## 亚洲地区IP统计\n\n")
-        f.write(f"总IP数量: {len(set(ip for ip, _ in asia_ips))}\n\n")
+        f.write(f"总IP数量: {len(asia_ips)}\n\n")
         f.write("前15个高频IP:\n\n")
-        f.write("| IP | 访问次数 | 城市 |\n")
-        f.write("|-----|----------|------|\n")
+        f.write("| IP | 访问次数 | 城市 | 站点 |\n")
+        f.write("|-----|----------|------|------|\n")
         for (ip, city), count in get_top_ips(asia_ips):
-            f.write(f"| {ip} | {count} | {city or 'None'} |\n")
+            f.write(f"| {ip} | {count} | {city or 'None'} | {format_sites(ip_sites, ip)} |\n")
         
         f.write(f"\n## 北美洲地区IP统计\n\n")
-        f.write(f"总IP数量: {len(set(ip for ip, _ in north_america_ips))}\n\n")
+        f.write(f"总IP数量: {len(north_america_ips)}\n\n")
         f.write("前15个高频IP:\n\n")
-        f.write("| IP | 访问次数 | 城市 |\n")
-        f.write("|-----|----------|------|\n")
+        f.write("| IP | 访问次数 | 城市 | 站点 |\n")
+        f.write("|-----|----------|------|------|\n")
         for (ip, city), count in get_top_ips(north_america_ips):
-            f.write(f"| {ip} | {count} | {city or 'None'} |\n")
+            f.write(f"| {ip} | {count} | {city or 'None'} | {format_sites(ip_sites, ip)} |\n")
         
         f.write(f"\n## 可疑IP（每分钟访问30次以上）\n\n")
-        f.write("| IP | 最大每分钟访问次数 | 地区 |\n")
-        f.write("|-----|--------------------|---------|\n")
+        f.write("| IP | 最大每分钟访问次数 | 地区 | 站点 |\n")
+        f.write("|-----|--------------------|---------|------|\n")
         for ip, max_count, region in suspicious_ips:
-            f.write(f"| {ip} | {max_count} | {region} |\n")
+            f.write(f"| {ip} | {max_count} | {region} | {format_sites(ip_sites, ip)} |\n")
 
-def main():
-    reader = geoip2.database.Reader(GEOIP_DB_PATH)
-    
-    all_ip_time_pairs = []
-    whitelist = load_whitelist()  # 加载白名单
-    for log_path in LOG_PATHS:
-        if log_path:  # 只处理非空路径
-            ip_time_pairs = parse_log_file(log_path)
-            all_ip_time_pairs.extend(ip_time_pairs)
-    
-    asia_ips, north_america_ips = analyze_ips(all_ip_time_pairs, reader, whitelist)
-    suspicious_ips = get_suspicious_ips(all_ip_time_pairs, reader, whitelist)
-    
-    write_results_to_file(OUTPUT_PATH, asia_ips, north_america_ips, suspicious_ips)
+        if ip_sites:
+            write_site_summary(f, ip_sites, whitelist)
+
+        if visitors is not None and visitors.sketches:
+            write_unique_visitors(f, visitors)
+
+        if latency is not None and latency.routes:
+            f.write("\n" + "\n".join(latency_report(latency)) + "\n")
+
+def report_regions(region, whitelist, cache_path=GEOIP_CACHE_FILE, visitors=None, latency=None):
+    """
+    region 为 RegionAnalyzer，各表中标明IP访问的站点，并输出各站点汇总；
+    cache_path 为 GeoIP 缓存文件，None 表示不读取也不保存；visitors 为 UniqueVisitorAnalyzer 时输出独立访客统计；
+    latency 为 LatencyAnalyzer 且日志中有耗时字段时输出各路由、上游的耗时分布
+    """
+    ip_sites = region.ip_sites
+    geo = GeoIPCache(GEOIP_DB_PATH)
+    try:
+        if cache_path:
+            geo.load(cache_path)
+        asia_ips, north_america_ips = analyze_ips(ip_sites, geo, whitelist)
+        suspicious_ips = get_suspicious_ips(region.minute_counts, geo, whitelist)
+        write_results_to_file(OUTPUT_PATH, asia_ips, north_america_ips, suspicious_ips, visitors, ip_sites, whitelist,
+                              latency)
+        write_suspicious_results(SUSPICIOUS_RESULTS_PATH, suspicious_ips, ip_sites)
+        print(geo.summary())
+        if cache_path:
+            try:
+                geo.save(cache_path)
+            except OSError as e:
+                print(f"保存GeoIP缓存文件 {cache_path} 时出错: {e}")
+    finally:
+        geo.close()
     
     print(f"分析结果已保存到文件: {OUTPUT_PATH}")
-    
-    reader.close()
+    print(f"可疑IP结构化结果已保存到文件: {SUSPICIOUS_RESULTS_PATH}")
+
+def main():
+    parser = argparse.ArgumentParser(description="按地区统计访问IP")
+    add_engine_arguments(parser, CHECKPOINT_PATH)
+    add_geoip_cache_arguments(parser)
+    parser.add_argument("--aggregate-db", default=AGGREGATE_DB,
+                        help=f"保存按小时独立访客草图的数据库（默认 {AGGREGATE_DB}）")
+    parser.add_argument("--no-aggregates", action="store_true", help="不保存独立访客草图")
+    args = parser.parse_args()
+
+    whitelist = load_whitelist()  # 加载白名单
+    analyzer = RegionAnalyzer()
+    visitors = UniqueVisitorAnalyzer(whitelist)
+    latency = LatencyAnalyzer()
+    try:
+        engine_from_args([analyzer, visitors, latency], args).run(log_paths_from_args(LOG_PATHS, args))
+    finally:
+        visitors.close()
+    report_regions(analyzer, whitelist, geoip_cache_path(args), visitors, latency)
+    if not args.no_aggregates:
+        write_visitor_sketches(visitors, args.aggregate_db)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""
+站点日志自动发现
+宝塔面板给每个站点在 /www/wwwlogs/ 下写一个访问日志（<站点>.log），logrotate 轮转后留下
+<站点>.log.1、<站点>.log.2.gz、<站点>.log-20240501.gz 等文件。这里按目录扫描出所有站点的日志，
+需要时带上轮转文件（压缩文件由 LogEngine 流式解压读取），不必在每个脚本里手工维护 LOG_PATHS。
+"""
+
+import functools
+import glob
+import os
+import re
+
+# 宝塔面板的站点日志目录
+WWWLOGS_DIR = "/www/wwwlogs"
+
+# 错误日志（<站点>.error.log、nginx_error.log 等）不是访问日志
+ERROR_LOG_PATTERN = re.compile(r'[._-]error\.log$')
+
+# 轮转文件相对当前日志多出的后缀：.1、.2.gz、-20240501、-20240501.gz、-2024-05-01.gz
+ROTATED_SUFFIX_PATTERN = re.compile(r'^[.-]\d[\d-]*(\.gz)?$')
+
+@functools.lru_cache(maxsize=1024)
+def site_name(log_path):
+    """日志文件对应的站点名：去掉目录和 .log 及其后的轮转后缀（/www/wwwlogs/123.log.1 -> 123）"""
+    return re.sub(r'\.log([.-].*)?$', '', os.path.basename(log_path))
+
+def rotated_files(log_path):
+    """log_path 的轮转文件，按修改时间从旧到新排列；解析缓存、临时文件等不符合轮转后缀的文件跳过"""
+    candidates = []
+    for candidate in glob.glob(glob.escape(log_path) + '[.-]*'):
+        if not ROTATED_SUFFIX_PATTERN.match(candidate[len(log_path):]):
+            continue
+        try:
+            candidates.append((os.path.getmtime(candidate), candidate))
+        except FileNotFoundError:
+            continue
+    return [path for _, path in sorted(candidates)]
+
+def discover_logs(log_dir=WWWLOGS_DIR, include_rotated=False):
+    """
+    返回 log_dir 下各站点的访问日志路径，按站点名排列。
+    include_rotated 为 True 时每个站点先列出轮转文件（从旧到新），再列出当前日志，保证同一站点按时间顺序处理。
+    """
+    paths = []
+    for log_path in sorted(glob.glob(os.path.join(glob.escape(log_dir), '*.log'))):
+        if ERROR_LOG_PATTERN.search(log_path) or not os.path.isfile(log_path):
+            continue
+        if include_rotated:
+            paths.extend(rotated_files(log_path))
+        paths.append(log_path)
+    return paths
+
+def add_discovery_arguments(parser):
+    parser.add_argument("--discover", action="store_true",
+                        help="自动发现日志目录下所有站点的访问日志，代替脚本中的 LOG_PATHS")
+    parser.add_argument("--log-dir", default=WWWLOGS_DIR, help=f"自动发现日志的目录（默认 {WWWLOGS_DIR}）")
+    parser.add_argument("--include-rotated", action="store_true",
+                        help="自动发现时同时读取轮转的旧日志（.1、.gz 等，压缩文件流式解压）；增量模式下不使用")
+
+def log_paths_from_args(log_paths, args):
+    """命令行指定 --discover 时返回自动发现的日志，否则返回脚本中配置的 log_paths"""
+    if args is None or not getattr(args, 'discover', False):
+        return log_paths
+    # 增量模式由断点自己跟踪轮转文件，再把轮转文件当作独立日志读取会重复计数
+    include_rotated = args.include_rotated and not getattr(args, 'incremental', False)
+    if args.include_rotated and not include_rotated:
+        print("增量模式下忽略 --include-rotated，轮转文件由断点按 inode 跟踪。")
+    paths = discover_logs(args.log_dir, include_rotated)
+    if not paths:
+        print(f"警告: 在 {args.log_dir} 下没有发现站点日志。")
+    else:
+        sites = sorted({site_name(path) for path in paths})
+        print(f"在 {args.log_dir} 下发现 {len(sites)} 个站点的 {len(paths)} 个日志文件。")
+    return paths
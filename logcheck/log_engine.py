@@ -0,0 +1,588 @@
+"""
+共享日志解析引擎
+每个日志文件只读取、解析一次，再把解析后的记录分发给多个分析器。
+
+分析器只需实现 feed(record) 方法；可选实现 on_unmatched(line) 处理无法匹配的日志行，
+begin_file(log_path) 在开始处理每个日志文件（含增量模式下的轮转文件）前得到通知，
+以及下面 LogEngine 说明中的增量、并行模式所需方法。
+以 .gz 结尾的日志（轮转后压缩的旧日志）流式解压后逐行解析，不整体解压到内存或磁盘。
+"""
+
+import calendar
+import gzip
+import itertools
+import mmap
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from checkpoint import CheckpointStore
+from log_discovery import add_discovery_arguments, site_name
+from log_merge import MAX_LATENESS, MergeStats, merge_streams
+
+# nginx 默认 combined 日志格式；用户代理之后的自定义字段（如 $request_time）整体保存在 tail 中
+LOG_PATTERN = re.compile(
+    r'(?P<ip>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] '
+    r'"(?P<request>(?P<method>[A-Z]+) (?P<url>\S+)(?: (?P<protocol>[^"]*))?|[^"]*)" '
+    r'(?P<status>\d{3}) (?P<size>\d+|-) '
+    r'"(?P<referrer>[^"]*)" "(?P<user_agent>[^"]*)"'
+    r'(?P<tail>.*)'
+)
+
+
+# mmap 后端使用的 bytes 正则，直接在映射的文件缓冲区上匹配。
+# LOG_SCAN_PATTERN 用 finditer 扫描整段缓冲区，每个匹配从行首开始并吃掉整行；
+# 格式异常的行可能导致匹配跨行，此时退回用 LOG_PATTERN_BYTES 单独匹配该行
+LOG_PATTERN_BYTES = re.compile(LOG_PATTERN.pattern.encode())
+LOG_SCAN_PATTERN = re.compile(('(?m)^' + LOG_PATTERN.pattern + r'[^\n]*\n?').encode())
+
+# mmap 后端每处理这么多字节，就释放已处理部分占用的页面，避免常驻内存随文件增长
+MMAP_RELEASE_BYTES = 8 * 1024 * 1024
+
+# 小于该大小的日志不值得启动进程池
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+
+MONTHS = {name: index for index, name in enumerate(calendar.month_abbr) if name}
+
+# 时间解码缓存的上限，日志基本按时间顺序写入，同一时刻的记录集中出现
+TIME_CACHE_SIZE = 4096
+_time_cache = {}
+_minute_cache = {}
+
+
+def decode_time(value):
+    """
+    把 nginx 时间字符串（如 01/May/2024:00:00:05 +0800）转换为整数 epoch 秒。
+    按秒缓存结果；未命中时按分钟缓存换算结果，只需加上秒数，避免逐行调用 strptime。
+    没有时区的时间按 UTC 处理。格式错误时抛出 ValueError。
+    """
+    epoch = _time_cache.get(value)
+    if epoch is not None:
+        return epoch
+    if len(_time_cache) >= TIME_CACHE_SIZE:
+        _time_cache.clear()
+        _minute_cache.clear()
+    try:
+        minute_key = value[:17] + value[20:]
+        base = _minute_cache.get(minute_key)
+        if base is None:
+            base = calendar.timegm((int(value[7:11]), MONTHS[value[3:6]], int(value[0:2]),
+                                    int(value[12:14]), int(value[15:17]), 0))
+            zone = value[21:]
+            if zone:
+                offset = int(zone[1:3]) * 3600 + int(zone[3:5]) * 60
+                base -= offset if zone[0] == '+' else -offset
+            _minute_cache[minute_key] = base
+        epoch = base + int(value[18:20])
+    except (KeyError, IndexError) as e:
+        raise ValueError(f"无法解析的时间: {value}") from e
+    _time_cache[value] = epoch
+    return epoch
+
+
+class LogRecord:
+    """一条解析后的访问日志，epoch 为整数 epoch 秒，tail 为用户代理之后的内容（没有时为空字符串）"""
+
+    __slots__ = ('ip', 'time', 'request', 'method', 'url', 'protocol',
+                 'status', 'size', 'referrer', 'user_agent', 'tail')
+
+    @property
+    def epoch(self):
+        return decode_time(self.time)
+
+
+def decode_field(raw):
+    return raw.decode('utf-8', errors='ignore') if raw is not None else ''
+
+
+def decode_size(raw):
+    return 0 if raw == b'-' else int(raw)
+
+
+def lazy_field(name, convert):
+    """生成按需解码的字段属性：访问时才从 bytes 匹配结果中取出该字段并解码"""
+    index = LOG_PATTERN_BYTES.groupindex[name]
+
+    def getter(self):
+        return convert(self._match.group(index))
+    return property(getter)
+
+
+class LazyRecord:
+    """
+    mmap 后端的记录，字段与 LogRecord 相同，但只持有 bytes 匹配结果，字段在被访问时才解码。
+    匹配结果引用着映射的文件缓冲区，分析器不能在 feed() 之外保留记录对象本身。
+    """
+
+    __slots__ = ('_match',)
+
+    def __init__(self, match):
+        self._match = match
+
+    ip = lazy_field('ip', decode_field)
+    time = lazy_field('time', decode_field)
+    request = lazy_field('request', decode_field)
+    method = lazy_field('method', decode_field)
+    url = lazy_field('url', decode_field)
+    protocol = lazy_field('protocol', decode_field)
+    status = lazy_field('status', int)
+    size = lazy_field('size', decode_size)
+    referrer = lazy_field('referrer', decode_field)
+    user_agent = lazy_field('user_agent', decode_field)
+    tail = lazy_field('tail', decode_field)
+
+    @property
+    def epoch(self):
+        return decode_time(self.time)
+
+
+def parse_line(line):
+    match = LOG_PATTERN.match(line)
+    if match is None:
+        return None
+    record = LogRecord()
+    (record.ip, record.time, record.request, method, url, protocol,
+     status, size, record.referrer, record.user_agent, record.tail) = match.groups()
+    record.method = method or ''
+    record.url = url or ''
+    record.protocol = protocol or ''
+    record.status = int(status)
+    record.size = 0 if size == '-' else int(size)
+    return record
+
+
+def complete_end(log_path, start, size):
+    """返回 [start, size) 内最后一个完整行的结束位置，正在写入的半行不计入"""
+    with open(log_path, 'rb') as f:
+        pos = size
+        while pos > start:
+            block_start = max(start, pos - 65536)
+            f.seek(block_start)
+            index = f.read(pos - block_start).rfind(b'\n')
+            if index >= 0:
+                return block_start + index + 1
+            pos = block_start
+    return start
+
+
+def split_ranges(log_path, start, end, parts):
+    """把 [start, end) 切分成最多 parts 段，每段的边界都对齐到行首"""
+    bounds = [start]
+    step = (end - start) // parts
+    with open(log_path, 'rb') as f:
+        for i in range(1, parts):
+            pos = start + i * step
+            if pos <= bounds[-1]:
+                continue
+            f.seek(pos)
+            f.readline()  # 跳到下一行行首
+            pos = f.tell()
+            if pos >= end:
+                break
+            bounds.append(pos)
+    bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+
+def is_compressed(log_path):
+    return log_path.endswith('.gz')
+
+
+def scan_range(log_path, start, end, analyzers, opener=open):
+    """解析 [start, end) 内的日志行并分发给分析器，返回 (行数, 匹配数)"""
+    feeders = [analyzer.feed for analyzer in analyzers]
+    unmatched_handlers = [analyzer.on_unmatched for analyzer in analyzers
+                          if hasattr(analyzer, 'on_unmatched')]
+    lines = matched = 0
+    offset = start
+    with opener(log_path, 'rb') as f:
+        f.seek(start)
+        for raw_line in f:
+            if offset >= end:
+                break
+            offset += len(raw_line)
+            lines += 1
+            line = raw_line.decode('utf-8', errors='ignore')
+            record = parse_line(line)
+            if record is None:
+                for handler in unmatched_handlers:
+                    handler(line)
+                continue
+            matched += 1
+            for feed in feeders:
+                feed(record)
+    return lines, matched
+
+
+def scan_gzip(log_path, start, end, analyzers):
+    """gzip 压缩的日志：边解压边逐行解析，start、end 为解压后的偏移，end 取 sys.maxsize 表示读到文件末尾"""
+    return scan_range(log_path, start, end, analyzers, opener=gzip.open)
+
+
+def scan_range_mmap(log_path, start, end, analyzers):
+    """
+    mmap 后端：把日志映射到内存，bytes 正则直接在缓冲区上扫描，不复制、不解码整行，
+    只有分析器实际访问的字段才会被解码。返回 (行数, 匹配数)
+    """
+    feeders = [analyzer.feed for analyzer in analyzers]
+    unmatched_handlers = [analyzer.on_unmatched for analyzer in analyzers
+                          if hasattr(analyzer, 'on_unmatched')]
+    lines = matched = 0
+    with open(log_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            can_release = hasattr(mm, 'madvise')
+            if can_release:
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            released = start - start % mmap.PAGESIZE
+            find = mm.find
+            pos = start
+            m = record = None
+            while pos < end:
+                for m in LOG_SCAN_PATTERN.finditer(mm, pos, end):
+                    match_start, match_end = m.span()
+                    if match_start != pos:
+                        # 两次匹配之间的内容是无法解析的行
+                        lines += count_unmatched(mm, pos, match_start, unmatched_handlers)
+                        pos = match_start
+                    if find(b'\n', match_start, match_end - 1) >= 0:
+                        break  # 匹配跨行，交给下面逐行处理
+                    pos = match_end
+                    lines += 1
+                    matched += 1
+                    record = LazyRecord(m)
+                    for feed in feeders:
+                        feed(record)
+                    if can_release and pos - released >= MMAP_RELEASE_BYTES:
+                        release_end = pos - pos % mmap.PAGESIZE
+                        mm.madvise(mmap.MADV_DONTNEED, released, release_end - released)
+                        released = release_end
+                else:
+                    if pos < end:
+                        lines += count_unmatched(mm, pos, end, unmatched_handlers)
+                    break
+
+                newline = find(b'\n', pos, end)
+                line_end = end if newline < 0 else newline + 1
+                m = LOG_PATTERN_BYTES.match(mm, pos, line_end)
+                if m is None:
+                    lines += count_unmatched(mm, pos, line_end, unmatched_handlers)
+                else:
+                    lines += 1
+                    matched += 1
+                    record = LazyRecord(m)
+                    for feed in feeders:
+                        feed(record)
+                pos = line_end
+            del find, m, record  # 关闭映射前释放对缓冲区的引用
+    return lines, matched
+
+
+def count_unmatched(mm, start, end, handlers):
+    chunk = mm[start:end]
+    raw_lines = chunk.splitlines(keepends=True)
+    if handlers:
+        for raw_line in raw_lines:
+            line = raw_line.decode('utf-8', errors='ignore')
+            for handler in handlers:
+                handler(line)
+    return len(raw_lines)
+
+
+# 可选的解析后端：text 逐行解码后用 str 正则解析；mmap 在内存映射的缓冲区上用 bytes 正则解析
+BACKENDS = {
+    'text': scan_range,
+    'mmap': scan_range_mmap,
+}
+
+
+def scanner_for(log_path, backend):
+    """压缩文件只能顺序解压，固定使用 scan_gzip；其余按选择的后端"""
+    return scan_gzip if is_compressed(log_path) else BACKENDS[backend]
+
+
+def scan_range_partial(log_path, start, end, partials, backend='text'):
+    """工作进程入口：用分析器的部分结果收集器解析一段日志，返回收集器供主进程合并"""
+    lines, matched = scanner_for(log_path, backend)(log_path, start, end, partials)
+    return partials, lines, matched
+
+
+def begin_file(analyzers, log_path):
+    for analyzer in analyzers:
+        if hasattr(analyzer, 'begin_file'):
+            analyzer.begin_file(log_path)
+
+
+def add_engine_arguments(parser, checkpoint_file):
+    """为脚本添加解析引擎相关的命令行参数"""
+    parser.add_argument("--incremental", action="store_true", help="增量模式：只处理上次运行后新追加的日志")
+    parser.add_argument("--checkpoint", default=checkpoint_file, help="增量模式使用的断点文件")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="并行解析的进程数，0 表示使用全部CPU核心；有多个日志文件时也是同时读取的文件数上限")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="text",
+                        help="日志解析后端：text 逐行解码，mmap 内存映射 + bytes 正则")
+    parser.add_argument("--parse-cache", action="store_true",
+                        help="缓存每个日志文件的解析结果，未变化的部分直接回放，只解析新追加的内容；"
+                             "增量模式下不使用")
+    parser.add_argument("--parse-cache-dir", help="解析缓存的存放目录（默认 /root/logcheck/parsecache）；"
+                             "缓存加载时会执行其中的代码，不要放在其他用户可写的目录中")
+    parser.add_argument("--ordered", action="store_true",
+                        help="有多个日志文件时按时间归并成一个流再分发给分析器，使按时间窗口的检测跨文件也准确；"
+                             "归并在单个进程中进行，不使用 --jobs 和解析缓存")
+    parser.add_argument("--max-lateness", type=float, default=MAX_LATENESS,
+                        help=f"按时间归并时单个日志内允许的乱序秒数（默认 {MAX_LATENESS}）")
+    add_discovery_arguments(parser)
+
+
+def engine_from_args(analyzers, args):
+    checkpoint = CheckpointStore(args.checkpoint) if args.incremental else None
+    parse_cache = None
+    if getattr(args, 'parse_cache', False) and not args.incremental:
+        from parse_cache import ParseCache
+        parse_cache = ParseCache(args.parse_cache_dir)
+    return LogEngine(analyzers, checkpoint, args.jobs, args.backend, parse_cache,
+                     getattr(args, 'ordered', False), getattr(args, 'max_lateness', MAX_LATENESS))
+
+
+class LogEngine:
+    """
+    checkpoint 为 CheckpointStore 时启用增量模式：只读取上次运行之后追加的内容，
+    并通过分析器的 get_state()/set_state() 保存、恢复跨运行的滚动窗口状态。
+
+    jobs 大于 1 时启用多进程解析：把日志按行对齐切分成多段，由进程池并行解析；
+    有多个日志文件时（如自动发现的各站点日志），各文件共用一个进程池并发解析，
+    同时读取、解析的任务数不超过 jobs。每个分析器需实现 new_partial() 返回可序列化的部分结果收集器，
+    以及 merge(partial) 按日志顺序合并，保证结果与单进程解析一致。
+    部分结果收集器同样会在解析前收到 begin_file(log_path)。
+
+    backend 选择解析后端，见 BACKENDS。
+
+    parse_cache 为 parse_cache.ParseCache 时（仅非增量模式），从头处理的日志先回放缓存中
+    已解析的记录，只解析缓存之后追加的内容，再把新解析的部分写回缓存。
+
+    ordered 为 True 且有多个日志文件时，各站点的日志（同一站点的轮转文件按顺序接在一起）
+    逐行读取后用 log_merge 按时间归并，分析器收到的是一个全局按时间排列的记录流，
+    每当记录来自另一个文件时先收到 begin_file(log_path)。归并在单个进程中进行，不使用 jobs 和 parse_cache。
+    """
+
+    def __init__(self, analyzers, checkpoint=None, jobs=1, backend='text', parse_cache=None, ordered=False,
+                 max_lateness=MAX_LATENESS):
+        self.analyzers = list(analyzers)
+        self.checkpoint = checkpoint
+        self.jobs = jobs if jobs > 0 else (os.cpu_count() or 1)
+        self.backend = backend
+        self.parse_cache = parse_cache
+        self.ordered = ordered
+        self.max_lateness = max_lateness
+        self.merge_stats = None
+        self.cached_lines = 0
+        self.lines = 0
+        self.matched = 0
+
+    def run(self, log_paths):
+        log_paths = [log_path for log_path in log_paths if log_path]  # 只处理非空路径
+        if self.checkpoint:
+            self.restore_states()
+            if self.ordered and len(log_paths) > 1:
+                self.process_ordered(log_paths)
+            else:
+                for log_path in log_paths:
+                    for path, start in self.checkpoint.plan(log_path):
+                        offset = self.process_file(path, start, complete_lines_only=True)
+                        if path == log_path:
+                            self.checkpoint.update(log_path, offset)
+            self.save_states()
+        elif self.ordered and len(log_paths) > 1:
+            self.process_ordered(log_paths)
+        elif self.jobs > 1 and self.parse_cache is None and len(log_paths) > 1:
+            self.process_files(log_paths)
+        else:
+            for log_path in log_paths:
+                self.process_file(log_path)
+        return self
+
+    def restore_states(self):
+        for analyzer in self.analyzers:
+            state = self.checkpoint.states.get(type(analyzer).__name__)
+            if state is not None and hasattr(analyzer, 'set_state'):
+                analyzer.set_state(state)
+
+    def save_states(self):
+        for analyzer in self.analyzers:
+            if hasattr(analyzer, 'get_state'):
+                self.checkpoint.states[type(analyzer).__name__] = analyzer.get_state()
+        self.checkpoint.save()
+
+    def process_file(self, log_path, start=0, complete_lines_only=False):
+        """
+        从字节偏移 start 开始处理日志，返回处理结束位置的偏移。
+        complete_lines_only 为 True 时（增量模式）不处理正在写入的半行，留到下次运行。
+        """
+        try:
+            size = os.path.getsize(log_path)
+        except FileNotFoundError:
+            print(f"警告: 日志文件 {log_path} 不存在。")
+            return start
+        begin_file(self.analyzers, log_path)
+        if is_compressed(log_path):
+            # 压缩文件不会再追加内容，断点中记录过偏移即已处理完
+            if start == 0:
+                self.process_range(log_path, 0, sys.maxsize, self.analyzers)
+            return size
+        if self.parse_cache is not None and start == 0 and not complete_lines_only:
+            return self.process_cached(log_path, size)
+        end = complete_end(log_path, start, size) if complete_lines_only else size
+        if end <= start:
+            return start
+        self.process_range(log_path, start, end, self.analyzers)
+        return end
+
+    def plan_segment(self, log_path, start):
+        """
+        返回 (读取结束位置, 处理后的断点偏移)，与 process_file 的处理范围一致；文件不存在时返回 None。
+        压缩文件读到末尾（sys.maxsize），断点中记录过偏移的压缩文件不再读取。
+        """
+        try:
+            size = os.path.getsize(log_path)
+        except FileNotFoundError:
+            print(f"警告: 日志文件 {log_path} 不存在。")
+            return None
+        if is_compressed(log_path):
+            return (sys.maxsize if start == 0 else start), size
+        end = complete_end(log_path, start, size) if self.checkpoint else size
+        return max(end, start), max(end, start)
+
+    def process_ordered(self, log_paths):
+        """按站点把日志分成多个流（同一站点的轮转文件先旧后新接在一起），按时间归并后分发给分析器"""
+        streams = []
+        offsets = []
+        for _, site_paths in itertools.groupby(log_paths, key=site_name):
+            segments = []
+            for log_path in site_paths:
+                planned = self.checkpoint.plan(log_path) if self.checkpoint else [(log_path, 0)]
+                for path, start in planned:
+                    segment = self.plan_segment(path, start)
+                    if segment is None:
+                        continue
+                    end, offset = segment
+                    if path == log_path:
+                        offsets.append((log_path, offset))
+                    if end > start:
+                        segments.append((path, start, end))
+            if segments:
+                streams.append(self.iter_segments(segments))
+
+        feeders = [analyzer.feed for analyzer in self.analyzers]
+        self.merge_stats = MergeStats()
+        current = None
+        for _, _, _, (log_path, record) in merge_streams(streams, self.max_lateness, self.merge_stats):
+            if log_path != current:
+                begin_file(self.analyzers, log_path)
+                current = log_path
+            for feed in feeders:
+                feed(record)
+        print(self.merge_stats.summary())
+        if self.checkpoint:
+            for log_path, offset in offsets:
+                self.checkpoint.update(log_path, offset)
+
+    def iter_segments(self, segments):
+        """
+        逐行解析 (日志路径, 起始偏移, 结束偏移) 列表，产出 (epoch, (日志路径, 记录))。
+        记录要在归并缓冲中保留一段时间，固定使用 text 后端（mmap 后端的记录不能在 feed() 之外保留）。
+        无法匹配或时间无法解析的行直接交给 on_unmatched。
+        """
+        unmatched_handlers = [analyzer.on_unmatched for analyzer in self.analyzers
+                              if hasattr(analyzer, 'on_unmatched')]
+        for log_path, start, end in segments:
+            opener = gzip.open if is_compressed(log_path) else open
+            offset = start
+            with opener(log_path, 'rb') as f:
+                f.seek(start)
+                for raw_line in f:
+                    if offset >= end:
+                        break
+                    offset += len(raw_line)
+                    self.lines += 1
+                    line = raw_line.decode('utf-8', errors='ignore')
+                    record = parse_line(line)
+                    try:
+                        epoch = record.epoch if record is not None else None
+                    except ValueError:
+                        epoch = None
+                    if epoch is None:
+                        for handler in unmatched_handlers:
+                            handler(line)
+                        continue
+                    self.matched += 1
+                    yield epoch, (log_path, record)
+
+    def process_cached(self, log_path, size):
+        """回放解析缓存，解析缓存之后的完整行并写回缓存；正在写入的半行照常解析但不缓存"""
+        columns, offset = self.parse_cache.load(log_path)
+        lines, matched = columns.replay(self.analyzers)
+        self.lines += lines
+        self.matched += matched
+        self.cached_lines += lines
+        end = complete_end(log_path, offset, size)
+        if end > offset:
+            # 缓存本身作为分析器收集新解析的记录
+            self.process_range(log_path, offset, end, self.analyzers + [columns])
+            try:
+                self.parse_cache.save(log_path, columns, end)
+            except OSError as e:
+                print(f"警告: 无法保存解析缓存 {self.parse_cache.path_for(log_path)}: {e}")
+        if size > end:
+            self.process_range(log_path, end, size, self.analyzers)
+        return size
+
+    def process_range(self, log_path, start, end, analyzers):
+        if self.jobs > 1 and not is_compressed(log_path) and end - start >= PARALLEL_MIN_BYTES:
+            self.process_parallel(log_path, start, end, analyzers)
+        else:
+            lines, matched = scanner_for(log_path, self.backend)(log_path, start, end, analyzers)
+            self.lines += lines
+            self.matched += matched
+
+    def process_parallel(self, log_path, start, end, analyzers):
+        ranges = split_ranges(log_path, start, end, self.jobs * 2)
+        self.run_tasks([(log_path, range_start, range_end) for range_start, range_end in ranges], analyzers)
+
+    def process_files(self, log_paths):
+        """
+        并发解析多个日志文件：小文件、压缩文件各作为一个任务，大文件再按行切成多段，
+        全部提交到同一个进程池，同时最多 jobs 个任务在读取、解析。
+        """
+        tasks = []
+        for log_path in log_paths:
+            try:
+                size = os.path.getsize(log_path)
+            except FileNotFoundError:
+                print(f"警告: 日志文件 {log_path} 不存在。")
+                continue
+            begin_file(self.analyzers, log_path)
+            if is_compressed(log_path):
+                ranges = [(0, sys.maxsize)]
+            elif size >= PARALLEL_MIN_BYTES:
+                ranges = split_ranges(log_path, 0, size, self.jobs * 2)
+            else:
+                ranges = [(0, size)]
+            tasks.extend((log_path, start, end) for start, end in ranges if end > start)
+        self.run_tasks(tasks, self.analyzers)
+
+    def run_tasks(self, tasks, analyzers):
+        """tasks 为 (日志路径, 起始偏移, 结束偏移) 列表，由进程池并行解析后按列表顺序合并"""
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            futures = []
+            for log_path, start, end in tasks:
+                partials = [analyzer.new_partial() for analyzer in analyzers]
+                begin_file(partials, log_path)
+                futures.append(pool.submit(scan_range_partial, log_path, start, end, partials, self.backend))
+            # 按日志顺序合并，保证计数器的先后顺序、记录顺序与单进程一致
+            for future in futures:
+                partials, lines, matched = future.result()
+                self.lines += lines
+                self.matched += matched
+                for analyzer, partial in zip(analyzers, partials):
+                    analyzer.merge(partial)
@@ -0,0 +1,66 @@
+"""
+按时间归并多个日志流
+多个站点的日志、轮转文件或从其他服务器拉取的日志依次处理时，分析器先看到一个文件的全部记录，
+再看到另一个文件中更早的记录，按时间窗口计数的检测（RateDetector 等）会把同一IP的请求算错窗口。
+这里用最小堆做 k 路归并，把各自基本有序的日志流合成一个全局按时间排列的流，边读边输出，
+不需要把全部记录读进内存再排序。
+
+单个日志内部也会有少量乱序（多个 worker 同时写入，记录的时间与写入顺序略有出入），
+每个流先经过一个按水位线输出的小堆：只有时间不晚于“该流已见到的最新时间 - max_lateness”的记录才输出，
+乱序不超过 max_lateness 秒的记录都能排回正确位置，缓冲的记录数只与这段时间内的请求量有关。
+乱序超过 max_lateness 的记录照常输出（分析器能容忍少量乱序），计入 MergeStats.late。
+"""
+
+import heapq
+
+# 默认允许的乱序时长（秒）
+MAX_LATENESS = 5
+
+class MergeStats:
+    def __init__(self):
+        self.records = 0
+        # 输出时已落后于同一流中已输出记录的条数，以及最大落后秒数
+        self.late = 0
+        self.max_delay = 0
+
+    def summary(self):
+        message = f"按时间归并了 {self.records} 条记录"
+        if self.late:
+            message += f"，其中 {self.late} 条乱序超过允许范围（最多晚 {self.max_delay} 秒），按到达顺序处理"
+        return message + "。"
+
+def reorder(items, max_lateness, stats, stream=0):
+    """
+    items 为 (epoch, 数据) 的基本有序流，按水位线重新排序后产出 (epoch, stream, 序号, 数据)。
+    前三项在所有流中唯一，归并时不会比较到数据本身。
+    """
+    heap = []
+    newest = None
+    emitted = None
+    for seq, (epoch, payload) in enumerate(items):
+        if newest is None or epoch > newest:
+            newest = epoch
+        heapq.heappush(heap, (epoch, stream, seq, payload))
+        watermark = newest - max_lateness
+        while heap and heap[0][0] <= watermark:
+            item = heapq.heappop(heap)
+            emitted = track(item[0], emitted, stats)
+            yield item
+    while heap:
+        item = heapq.heappop(heap)
+        emitted = track(item[0], emitted, stats)
+        yield item
+
+def track(epoch, emitted, stats):
+    """记录一条输出，返回已输出的最新时间"""
+    stats.records += 1
+    if emitted is None or epoch >= emitted:
+        return epoch
+    stats.late += 1
+    stats.max_delay = max(stats.max_delay, emitted - epoch)
+    return emitted
+
+def merge_streams(streams, max_lateness=MAX_LATENESS, stats=None):
+    """把多个 (epoch, 数据) 流归并为一个按时间排列的 (epoch, stream, 序号, 数据) 流"""
+    stats = stats if stats is not None else MergeStats()
+    return heapq.merge(*(reorder(items, max_lateness, stats, index) for index, items in enumerate(streams)))
@@ -0,0 +1,107 @@
+"""
+单次读取的日志分析流水线
+依次运行 logcheck.py、web_log_monitor.py、log_analysis.py 会把同一份日志读取、解析三遍，
+这里用 LogEngine 只读一遍，同时把记录分发给三个分析器，再分别输出原有报告。
+"""
+
+import argparse
+
+import logcheck
+from aggregate_store import AGGREGATE_DB, AggregateStore, MinuteAggregator
+from ban_backend import add_ban_arguments, ban_backend_from_args
+from bot_verifier import add_bot_verifier_arguments, bot_verifier_from_args, verify_claims
+from log_discovery import log_paths_from_args
+from log_engine import add_engine_arguments, engine_from_args
+from web_log_monitor import LogAnalyzer, add_ua_cache_arguments, ua_cache_path
+
+# 定义日志文件路径
+LOG_PATHS = [
+    "/www/wwwlogs/123.log",
+    # 在这里添加更多日志文件路径
+]
+
+# 定义增量模式的断点文件路径
+CHECKPOINT_FILE = "/root/logcheck/log_pipeline.checkpoint"
+
+def write_aggregates(aggregator, db_path, log):
+    store = AggregateStore(db_path)
+    try:
+        minutes = store.write(aggregator)
+        store.prune()
+    finally:
+        store.close()
+    log(f"已将 {minutes} 分钟的聚合统计写入 {db_path}。")
+
+def main():
+    parser = argparse.ArgumentParser(description="单次读取的日志分析流水线")
+    add_engine_arguments(parser, CHECKPOINT_FILE)
+    add_ua_cache_arguments(parser)
+    add_ban_arguments(parser)
+    add_bot_verifier_arguments(parser)
+    parser.add_argument("--aggregate-db", default=AGGREGATE_DB,
+                        help=f"写入按分钟聚合统计（仅增量模式）和独立访客草图的数据库（默认 {AGGREGATE_DB}）")
+    parser.add_argument("--no-aggregates", action="store_true", help="不写入按分钟聚合的统计和独立访客草图")
+    args = parser.parse_args()
+
+    whitelist = logcheck.load_whitelist()
+    # 两个分析器共用一个验证器，解析结束后一起验证
+    bot_verifier = bot_verifier_from_args(args)
+    attack_analyzer = logcheck.AttackAnalyzer(whitelist, bot_verifier)
+    web_analyzer = LogAnalyzer()
+    web_analyzer.ban_backend = ban_backend_from_args(args)
+    web_analyzer.bot_verifier = bot_verifier
+    analyzers = [attack_analyzer, web_analyzer]
+
+    # GeoIP 依赖缺失时跳过地区分析，不影响其他分析器
+    try:
+        import log_analysis
+    except ImportError as e:
+        log_analysis = None
+        print(f"警告: 跳过地区分析: {e}")
+    visitors = None
+    if log_analysis:
+        region_analyzer = log_analysis.RegionAnalyzer()
+        visitors = log_analysis.UniqueVisitorAnalyzer(log_analysis.load_whitelist())
+        analyzers += [region_analyzer, visitors]
+
+    # 聚合统计按次累加，只在增量模式（每段日志只处理一次）下写入
+    aggregator = None
+    if args.incremental and not args.no_aggregates:
+        aggregator = MinuteAggregator()
+        analyzers.append(aggregator)
+
+    try:
+        web_analyzer.log("开始解析日志文件...")
+        web_analyzer.warm_ua_cache(ua_cache_path(args))
+        try:
+            engine = engine_from_args(analyzers, args).run(log_paths_from_args(LOG_PATHS, args))
+        finally:
+            if visitors:
+                visitors.close()
+        web_analyzer.log(f"日志解析完成。共读取 {engine.lines} 行，解析 {engine.matched} 条记录。")
+        if engine.parse_cache is not None:
+            web_analyzer.log(f"其中 {engine.cached_lines} 行来自解析缓存。")
+        if bot_verifier:
+            verify_claims(bot_verifier, [attack_analyzer, web_analyzer], web_analyzer.log)
+        web_analyzer.flush_bans()
+        if aggregator:
+            write_aggregates(aggregator, args.aggregate_db, web_analyzer.log)
+        web_analyzer.finish_ua_cache(ua_cache_path(args))
+
+        logcheck.format_output(attack_analyzer.result())
+        web_analyzer.run_reports()
+        if log_analysis:
+            try:
+                log_analysis.report_regions(region_analyzer, log_analysis.load_whitelist(), visitors=visitors)
+            except FileNotFoundError as e:
+                print(f"警告: 跳过地区分析: {e}")
+            # 草图合并是幂等的，非增量模式下也可以写入
+            if not args.no_aggregates:
+                log_analysis.write_visitor_sketches(visitors, args.aggregate_db)
+    except Exception as e:
+        web_analyzer.log(f"发生错误：{str(e)}")
+    finally:
+        web_analyzer.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+异步跟踪日志文件（类似 tail -F）
+按固定间隔轮询文件末尾，读取新追加的完整行；能识别 logrotate 轮转（inode 变化，
+先读完旧文件再切到新文件）、截断（copytruncate）以及文件暂时不存在的情况。
+"""
+
+import asyncio
+import os
+import time
+
+# 每批最多返回的行数，避免某个文件写入很快时长时间占住事件循环
+MAX_BATCH_LINES = 5000
+
+async def follow(path, poll_interval=0.5, from_end=True):
+    """
+    异步生成器，每次产出一批新写入的完整行（已按 utf-8 解码，忽略非法字节）。
+    from_end 为 True 时从当前文件末尾开始，只处理启动之后写入的内容。
+    """
+    f = None
+    inode = None
+    pending = b''
+    first_open = True
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path, 'rb')
+                except FileNotFoundError:
+                    await asyncio.sleep(poll_interval)
+                    continue
+                inode = os.fstat(f.fileno()).st_ino
+                if first_open and from_end:
+                    f.seek(0, os.SEEK_END)
+                first_open = False
+                pending = b''
+
+            lines = []
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    # 行还没写完，等下次轮询再拼接
+                    pending += raw
+                    break
+                lines.append((pending + raw).decode('utf-8', 'ignore'))
+                pending = b''
+                if len(lines) >= MAX_BATCH_LINES:
+                    break
+            if lines:
+                yield lines
+                await asyncio.sleep(0)
+                continue
+
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                st = None
+            if pending and st is not None and (st.st_ino != inode or st.st_size < f.tell()):
+                # 旧内容的最后一行没有换行符，轮转或截断后不会再补全，作为完整的一行产出
+                lines = [pending.decode('utf-8', 'ignore')]
+                pending = b''
+                yield lines
+            if st is not None and st.st_ino != inode:
+                # 已轮转，旧文件已读到末尾，切换到新文件并从头读取
+                f.close()
+                f = None
+                from_end = False
+                continue
+            if st is not None and st.st_size < f.tell():
+                # 被截断，从头开始
+                f.seek(0)
+                continue
+            await asyncio.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
+
+class TailStats:
+    """守护模式的运行计数：处理行数、每秒行数，以及日志时间到做出判断之间的延迟"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.lines = 0
+        self.matched = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.window_start = self.started
+        self.window_lines = 0
+
+    def observe(self, lines, epoch=None):
+        self.lines += lines
+        self.window_lines += lines
+        if epoch is not None:
+            self.matched += 1
+            self.last_lag = max(time.time() - epoch, 0.0)
+            if self.last_lag > self.max_lag:
+                self.max_lag = self.last_lag
+
+    def snapshot(self):
+        """返回当前计数，并开始下一个统计区间（lines_per_sec 为本区间的速率，max_lag 为本区间的最大延迟）"""
+        now = time.time()
+        elapsed = max(now - self.window_start, 1e-9)
+        snapshot = {
+            'uptime': round(now - self.started, 1),
+            'lines': self.lines,
+            'matched': self.matched,
+            'lines_per_sec': round(self.window_lines / elapsed, 1),
+            'lag': round(self.last_lag, 1),
+            'max_lag': round(self.max_lag, 1),
+        }
+        self.window_start = now
+        self.window_lines = 0
+        self.max_lag = self.last_lag
+        return snapshot
@@ -1,9 +1,18 @@
+import argparse
+import functools
 import re
 from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import datetime
 import ipaddress
 import sys
 
+from bot_verifier import add_bot_verifier_arguments, bot_verifier_from_args, claimed_bot, verify_claims
+from ip_matcher import CidrMatcher, read_network_file
+from log_discovery import log_paths_from_args, site_name
+from log_engine import LogEngine, add_engine_arguments, engine_from_args, parse_line
+from risk_store import RiskStore
+from routes import WHITELISTED_PATHS
+
 # 定义白名单文件路径
 WHITELIST_FILE = "/root/logcheck/ip_whitelist.txt"
 
@@ -13,6 +22,10 @@ LOG_PATHS = [
     # 在这里添加更多日志文件路径
 ]
 
+# 增量模式下的断点文件，以及跨运行保留IP攻击汇总的时长
+CHECKPOINT_FILE = "/root/logcheck/logcheck.checkpoint"
+ATTACK_STATE_TTL = 24 * 3600  # 秒
+
 # 攻击类型和模式（预编译正则表达式）
 ATTACK_PATTERNS = {
     re.compile(r"/admin|/login\.php|/manage|/dashboard|/control"): "后台页面访问",
@@ -34,61 +47,139 @@ SEARCH_ENGINE_BOTS = [
     "DuckDuckBot", "Slurp", "ia_archiver", "AhrefsBot", "Bytespider"
 ]
 
-# 白名单路径（预编译正则表达式）
-WHITELISTED_PATHS = [
-    re.compile(r'/index\.php/ajax/hits'),
-    re.compile(r'/index\.php/user/ajax_ulog'),
-    re.compile(r'/video/\d+\.html'),
-    re.compile(r'/play/\d+-\d+-\d+\.html'),
-    re.compile(r'/show/')
+# 其他可疑扫描特征：连续标点、过长的查询参数、不常见的扩展名
+SUSPICIOUS_REQUEST_PATTERNS = [
+    re.compile(r'[^\w\s]{4,}'),
+    re.compile(r'\A[^?]*\?[^?]{201}'),  # 第一个 ? 之后的查询参数超过 200 个字符
+    re.compile(r'\.(cgi|pl|exe|dll|jsp|action|do|xml)$', re.IGNORECASE),
 ]
 
+# 按请求行、用户代理缓存检测结果的条目上限
+REQUEST_CACHE_SIZE = 65536
+
+def required_literals(source):
+    """
+    正则的每个顶层分支取一段任何匹配都必然包含的字面量（最长的一段，路径里到处都有的 / 和 . 不计长度）；
+    含分组、字符集等无法判断的写法，或某个分支没有字面量时返回 None
+    """
+    literals = []
+    runs, run = [], ''
+    i = 0
+    while i < len(source):
+        char = source[i]
+        i += 1
+        if char == '\\' and i < len(source):
+            char = source[i]
+            i += 1
+            if char.isalnum():  # \d、\w、\b 等字符类和断言
+                runs.append(run)
+                run = ''
+            else:
+                run += char
+        elif char in '*?{':  # 前一个字符可以不出现
+            if char == '{':
+                i = source.find('}', i) + 1 or len(source)
+            runs.append(run[:-1])
+            run = ''
+        elif char in '+.^$':
+            runs.append(run)
+            run = ''
+        elif char == '|':
+            runs.append(run)
+            literals.append(max(runs, key=lambda run: (len(run.strip('/.')), len(run))))
+            runs, run = [], ''
+        elif char in '()[]':
+            return None
+        else:
+            run += char
+    runs.append(run)
+    literals.append(max(runs, key=lambda run: (len(run.strip('/.')), len(run))))
+    return literals if all(literals) else None
+
+def trie_pattern(words):
+    """把一组字面量按公共前缀合成正则（字典树）：每个位置只沿首字符相同的分支比较，比逐个字面量的分支快得多"""
+    if '' in words:
+        return ''  # 更短的字面量已经命中，后面的字符不必再比较
+    groups = {}
+    for word in words:
+        groups.setdefault(word[0], []).append(word[1:])
+    branches = [re.escape(char) + trie_pattern(rest) for char, rest in sorted(groups.items())]
+    return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+def keyword_prefilter(patterns):
+    """
+    由各正则的必含字面量合成一个预筛正则：请求行不含其中任何一段时，所有正则都不可能命中，不必逐个检测。
+    有正则无法提取字面量时返回 None，不做预筛
+    """
+    keywords = set()
+    for pattern in patterns:
+        literals = required_literals(pattern.pattern) if not pattern.flags & re.IGNORECASE else None
+        if literals is None:
+            return None
+        keywords.update(literals)
+    return re.compile(trie_pattern(keywords))
+
+# 攻击特征的关键字预筛，大多数正常请求一次 search 即可排除
+ATTACK_KEYWORDS = keyword_prefilter(ATTACK_PATTERNS)
+
+# 白名单路径合并成一个正则
+WHITELISTED_PATTERN = re.compile("|".join(pattern.pattern for pattern in WHITELISTED_PATHS))
+
+# 搜索引擎爬虫名称合并成一个正则，匹配小写后的用户代理
+SEARCH_ENGINE_BOT_PATTERN = re.compile("|".join(re.escape(bot.lower()) for bot in SEARCH_ENGINE_BOTS))
+
 def load_whitelist():
-    whitelist = set()
+    # 白名单每行一个IP或网段
+    whitelist = CidrMatcher()
     try:
-        with open(WHITELIST_FILE, 'r') as f:
-            for line in f:
-                whitelist.add(line.strip())
+        whitelist.update(read_network_file(WHITELIST_FILE))
     except FileNotFoundError:
         print(f"警告: 白名单文件 {WHITELIST_FILE} 不存在。")
     return whitelist
 
 def parse_log_line(line):
-    pattern = r'(\d+\.\d+\.\d+\.\d+).*\[([^\]]+)\] "([^"]*)" (\d+) \d+ "[^"]*" "([^"]*)"'
-    match = re.search(pattern, line)
-    if match:
-        ip, timestamp, request, status, user_agent = match.groups()
+    record = parse_line(line)
+    if record:
         return {
-            "ip": ip,
-            "timestamp": datetime.strptime(timestamp, "%d/%b/%Y:%H:%M:%S %z"),
-            "request": request,
-            "status": int(status),
-            "user_agent": user_agent
+            "ip": record.ip,
+            "timestamp": record.epoch,
+            "request": record.request,
+            "status": record.status,
+            "user_agent": record.user_agent
         }
     return None
 
+@functools.lru_cache(maxsize=REQUEST_CACHE_SIZE)
 def is_search_engine_bot(user_agent):
-    return any(bot.lower() in user_agent.lower() for bot in SEARCH_ENGINE_BOTS)
+    return SEARCH_ENGINE_BOT_PATTERN.search(user_agent.lower()) is not None
 
-def identify_attack_type(request, user_agent):
-    for pattern, attack_type in ATTACK_PATTERNS.items():
-        if pattern.search(request):
-            return attack_type
-    
-    if "bot" in user_agent.lower() and not is_search_engine_bot(user_agent):
-        return "可疑扫描"
-    
-    if re.search(r'[^\w\s]{4,}', request):
-        return "可疑扫描"
-    
-    if len(request.split('?')[1]) > 200 if '?' in request else False:
-        return "可疑扫描"
-    
-    unusual_extensions = r'\.(cgi|pl|exe|dll|jsp|action|do|xml)$'
-    if re.search(unusual_extensions, request, re.IGNORECASE):
-        return "可疑扫描"
+@functools.lru_cache(maxsize=REQUEST_CACHE_SIZE)
+def is_suspicious_bot(user_agent):
+    return "bot" in user_agent.lower() and not is_search_engine_bot(user_agent)
 
-    return None
+@functools.lru_cache(maxsize=REQUEST_CACHE_SIZE)
+def classify_request(request):
+    """返回 (按 ATTACK_PATTERNS 顺序命中的全部攻击类型, 是否有其他可疑扫描特征)，同一请求行只检测一次"""
+    if ATTACK_KEYWORDS is None or ATTACK_KEYWORDS.search(request):
+        attack_types = tuple(attack_type for pattern, attack_type in ATTACK_PATTERNS.items() if pattern.search(request))
+        if attack_types:
+            return attack_types, False
+    return (), any(pattern.search(request) for pattern in SUSPICIOUS_REQUEST_PATTERNS)
+
+def identify_attack_types(request, user_agent):
+    """请求命中的全部攻击类型；没有命中但有可疑特征时为 ("可疑扫描",)"""
+    attack_types, suspicious = classify_request(request)
+    if attack_types:
+        return attack_types
+
+    if is_suspicious_bot(user_agent) or suspicious:
+        return ("可疑扫描",)
+
+    return ()
+
+def identify_attack_type(request, user_agent):
+    attack_types = identify_attack_types(request, user_agent)
+    return attack_types[0] if attack_types else None
 
 def is_private_ip(ip):
     try:
@@ -96,48 +187,147 @@ def is_private_ip(ip):
     except ValueError:
         return False
 
+@functools.lru_cache(maxsize=REQUEST_CACHE_SIZE)
 def is_whitelisted_request(request):
-    return any(pattern.search(request) for pattern in WHITELISTED_PATHS)
+    return WHITELISTED_PATTERN.search(request) is not None
+
+def new_attack_entry():
+    # sites 为 {站点: 请求次数}，多站点时标明IP攻击了哪些站点
+    return {"count": 0, "first": None, "last": None, "statuses": set(), "attack_types": set(), "404_count": 0,
+            "sites": {}}
+
+class AttackAnalyzer:
+    """
+    按IP汇总攻击请求，供 LogEngine 分发记录。
+    bot_verifier 为 bot_verifier.BotVerifier 时，自称搜索引擎爬虫的请求只有在IP通过反向DNS验证后才豁免：
+    缓存中确认为冒充的照常分析；还没有结论的先单独汇总到 claimed，解析结束后由 verify_claims()
+    集中验证，冒充者的汇总再并入 attacks（汇总只有计数、最值和集合，先后合并结果相同）。
+    """
+
+    def __init__(self, whitelist, bot_verifier=None):
+        self.whitelist = whitelist
+        self.bot_verifier = bot_verifier
+        self.attacks = defaultdict(new_attack_entry)
+        # 待验证的自称爬虫IP：{ip: 攻击汇总} 和 {ip: 自称的爬虫}
+        self.claimed = defaultdict(new_attack_entry)
+        self.bot_claims = {}
+        self.latest = None
+        self.site = ""
+
+    def begin_file(self, log_path):
+        self.site = site_name(log_path)
+
+    def feed(self, record):
+        if is_private_ip(record.ip) or is_whitelisted_request(record.request):
+            return
+        ip = record.ip
+        if ip in self.whitelist:
+            return
+        attacks = self.attacks
+        if is_search_engine_bot(record.user_agent):
+            bot = claimed_bot(record.user_agent) if self.bot_verifier else None
+            if bot is None:
+                return  # 未启用验证，或没有公布反向解析域名的爬虫，按用户代理豁免
+            verified = self.bot_verifier.status(ip, bot)
+            if verified:
+                return
+            if verified is None:
+                attacks = self.claimed
+                self.bot_claims[ip] = bot
+        attack_types = identify_attack_types(record.request, record.user_agent)
+        if attack_types or record.status == 404:
+            timestamp = record.epoch
+            data = attacks[ip]
+            data["count"] += 1
+            if data["first"] is None or timestamp < data["first"]:
+                data["first"] = timestamp
+            if data["last"] is None or timestamp > data["last"]:
+                data["last"] = timestamp
+            if self.latest is None or timestamp > self.latest:
+                self.latest = timestamp
+            data["statuses"].add(record.status)
+            data["attack_types"].update(attack_types)
+            if record.status == 404:
+                data["404_count"] += 1
+            sites = data["sites"]
+            sites[self.site] = sites.get(self.site, 0) + 1
+
+    def new_partial(self):
+        return AttackAnalyzer(self.whitelist, self.bot_verifier)
+
+    def merge(self, partial):
+        for ip, part in partial.attacks.items():
+            merge_attack_entry(self.attacks[ip], part)
+        for ip, part in partial.claimed.items():
+            merge_attack_entry(self.claimed[ip], part)
+        self.bot_claims.update(partial.bot_claims)
+        if partial.latest is not None and (self.latest is None or partial.latest > self.latest):
+            self.latest = partial.latest
+
+    def apply_bot_results(self, results):
+        """results 为 {ip: True/False/None}：冒充者（False）的汇总并入 attacks，确认或查询失败的按爬虫豁免"""
+        for ip, verified in results.items():
+            part = self.claimed.pop(ip, None)
+            self.bot_claims.pop(ip, None)
+            if part is not None and verified is False:
+                merge_attack_entry(self.attacks[ip], part)
+
+    def get_state(self):
+        # 只保留最近 ATTACK_STATE_TTL 内仍有活动的IP，供下次增量运行继续累计
+        if self.latest is None:
+            return {"attacks": {}, "latest": None}
+        cutoff = self.latest - ATTACK_STATE_TTL
+        attacks = {ip: data for ip, data in self.attacks.items() if data["last"] >= cutoff}
+        # 尚未验证的自称爬虫IP一起保存，下次运行验证后再决定是否并入
+        claimed = {ip: data for ip, data in self.claimed.items() if data["last"] >= cutoff}
+        return {"attacks": attacks, "latest": self.latest, "claimed": claimed,
+                "bot_claims": {ip: self.bot_claims[ip] for ip in claimed}}
+
+    def set_state(self, state):
+        for data in state["attacks"].values():
+            data.setdefault("sites", {})  # 旧版本保存的状态没有站点信息
+        self.attacks.update(state["attacks"])
+        self.latest = state["latest"]
+        if self.bot_verifier:
+            self.claimed.update(state.get("claimed", {}))
+            self.bot_claims.update(state.get("bot_claims", {}))
+
+    def result(self):
+        return summarize_attacks(self.attacks)
+
+def merge_attack_entry(data, part):
+    data["count"] += part["count"]
+    if data["first"] is None or part["first"] < data["first"]:
+        data["first"] = part["first"]
+    if data["last"] is None or part["last"] > data["last"]:
+        data["last"] = part["last"]
+    data["statuses"] |= part["statuses"]
+    data["attack_types"] |= part["attack_types"]
+    data["404_count"] += part["404_count"]
+    for site, count in part["sites"].items():
+        data["sites"][site] = data["sites"].get(site, 0) + count
 
 def analyze_logs(log_paths, whitelist):
-    attacks = defaultdict(lambda: {"requests": [], "statuses": set(), "attack_types": set(), "404_count": 0})
-
-    for log_file_path in log_paths:
-        try:
-            with open(log_file_path, 'r') as file:
-                for line in file:
-                    parsed = parse_log_line(line)
-                    if parsed and not is_search_engine_bot(parsed["user_agent"]) and not is_private_ip(parsed["ip"]) and not is_whitelisted_request(parsed["request"]):
-                        ip = parsed["ip"]
-                        if ip not in whitelist:
-                            attack_type = identify_attack_type(parsed["request"], parsed["user_agent"])
-                            if attack_type or parsed["status"] == 404:
-                                attacks[ip]["requests"].append(parsed)
-                                attacks[ip]["statuses"].add(parsed["status"])
-                                if attack_type:
-                                    attacks[ip]["attack_types"].add(attack_type)
-                                if parsed["status"] == 404:
-                                    attacks[ip]["404_count"] += 1
-        except FileNotFoundError:
-            print(f"警告: 日志文件 {log_file_path} 不存在。")
+    analyzer = AttackAnalyzer(whitelist)
+    LogEngine([analyzer]).run(log_paths)
+    return analyzer.result()
 
+def summarize_attacks(attacks):
     filtered_attacks = {}
     for ip, data in attacks.items():
-        if len(data["requests"]) > 3 and (len(data["statuses"]) > 1 or 200 not in data["statuses"]):
-            data["requests"].sort(key=lambda x: x["timestamp"])
-            start_time = data["requests"][0]["timestamp"]
-            end_time = data["requests"][-1]["timestamp"]
-            duration = end_time - start_time
-            duration_seconds = duration.total_seconds()
+        if data["count"] > 3 and (len(data["statuses"]) > 1 or 200 not in data["statuses"]):
+            start_time = data["first"]
+            end_time = data["last"]
+            duration_seconds = end_time - start_time
             
-            request_rate = len(data["requests"]) / max(duration_seconds, 1)
+            request_rate = data["count"] / max(duration_seconds, 1)
             
             is_attack = (
-                (duration <= timedelta(minutes=10) and len(data["requests"]) > 50)  # 10分钟内50次以上请求
+                (duration_seconds <= 600 and data["count"] > 50)  # 10分钟内50次以上请求
                 or request_rate > 10  # 每秒超过10次请求
                 or (len(data["attack_types"]) > 1 and any(status >= 400 for status in data["statuses"]))  # 多种攻击类型且有错误状态码
                 or any(attack in ["SQL注入尝试", "XSS攻击尝试", "命令注入尝试"] for attack in data["attack_types"])  # 特定严重攻击类型
-                or (data["404_count"] >= 20 and duration <= timedelta(minutes=10))  # 10分钟内20次以上404状态
+                or (data["404_count"] >= 20 and duration_seconds <= 600)  # 10分钟内20次以上404状态
             )
             
             if is_attack:
@@ -147,13 +337,14 @@ def analyze_logs(log_paths, whitelist):
             
             if data["attack_types"] or is_attack:
                 filtered_attacks[ip] = {
-                    "count": len(data["requests"]),
+                    "count": data["count"],
                     "statuses": data["statuses"],
                     "start_time": start_time,
                     "duration_seconds": duration_seconds,
                     "attack_types": data["attack_types"],
                     "request_rate": request_rate,
                     "404_count": data["404_count"],
+                    "sites": data["sites"],
                     "severity": severity
                 }
 
@@ -167,44 +358,49 @@ def format_duration(seconds):
     else:
         return f"{seconds / 3600:.2f}小时"
 
-def format_output(attacks):
-    print("日志记录汇总:")
-    
+def format_sites(sites):
+    """按请求次数从多到少列出站点"""
+    return ", ".join(site or "-" for site, _ in sorted(sites.items(), key=lambda item: (-item[1], item[0])))
+
+def split_by_severity(attacks):
+    """
+    把 summarize_attacks() 的结果整理成表格行：返回 (严重风险行, 轻微风险行, {严重风险IP: 最后一次请求时间})。
+    最后一次请求时间记入高风险IP数据库，据此计算到期时间。
+    """
     severe_attacks = []
     minor_attacks = []
-    
-    # 添加生成严重风险IP日志的部分
-    severe_risk_log = "/root/logcheck/severe_risk_ips.log"
-    existing_ips = set()
-    try:
-        with open(severe_risk_log, 'r') as f:
-            existing_ips = set(line.strip() for line in f)
-    except FileNotFoundError:
-        pass
-
-    with open(severe_risk_log, 'a') as log_file:
-        for ip, data in attacks.items():
-            if data["attack_types"] and (len(data["statuses"]) > 1 or 200 not in data["statuses"]):
-                attack_info = {
-                    "ip": ip,
-                    "statuses": ", ".join(map(str, data["statuses"])),
-                    "start_time": data["start_time"].strftime("%Y-%m-%d %H:%M:%S"),
-                    "duration": format_duration(data["duration_seconds"]),
-                    "attack_types": ", ".join(data["attack_types"]),
-                    "count": data["count"],
-                    "request_rate": f"{data['request_rate']:.2f}",
-                    "404_count": data["404_count"],
-                    "severity": "轻微" if data["severity"] == "可疑" else data["severity"]
-                }
-                
-                if data["severity"] == "严重":
-                    severe_attacks.append(attack_info)
-                    # 将严重风险IP写入日志，如果不存在
-                    if ip not in existing_ips:
-                        log_file.write(f"{ip}\n")
-                        existing_ips.add(ip)
-                else:
-                    minor_attacks.append(attack_info)
+    severe_last_seen = {}
+
+    for ip, data in attacks.items():
+        if data["attack_types"] and (len(data["statuses"]) > 1 or 200 not in data["statuses"]):
+            attack_info = {
+                "ip": ip,
+                "sites": format_sites(data["sites"]),
+                "statuses": ", ".join(map(str, data["statuses"])),
+                "start_time": datetime.fromtimestamp(data["start_time"]).strftime("%Y-%m-%d %H:%M:%S"),
+                "duration": format_duration(data["duration_seconds"]),
+                "attack_types": ", ".join(data["attack_types"]),
+                "count": data["count"],
+                "request_rate": f"{data['request_rate']:.2f}",
+                "404_count": data["404_count"],
+                "severity": "轻微" if data["severity"] == "可疑" else data["severity"]
+            }
+            
+            if data["severity"] == "严重":
+                severe_attacks.append(attack_info)
+                severe_last_seen[ip] = data["start_time"] + data["duration_seconds"]
+            else:
+                minor_attacks.append(attack_info)
+    return severe_attacks, minor_attacks, severe_last_seen
+
+def format_output(attacks):
+    print("日志记录汇总:")
+
+    severe_attacks, minor_attacks, severe_last_seen = split_by_severity(attacks)
+
+    risk_store = RiskStore()
+    risk_store.record_times(severe_last_seen, "严重", "logcheck")
+    risk_store.close()
     
     print(f"严重风险 (IP数量: {len(severe_attacks)}):")
     print_attack_table(severe_attacks)
@@ -212,17 +408,47 @@ def format_output(attacks):
     print(f"\n轻微风险 (IP数量: {len(minor_attacks)}):")
     print_attack_table(minor_attacks)
 
-    print(f"\n严重风险IP已记录到 {severe_risk_log}")
+    print_site_summary(attacks)
+
+    print(f"\n严重风险IP已记录到 {risk_store.path}")
+
+def print_site_summary(attacks):
+    """跨站点汇总：每个站点的攻击请求次数和涉及的风险IP数，同一IP攻击多个站点时在每个站点各计一次"""
+    summary = {}
+    for data in attacks.values():
+        if not data["attack_types"] or (len(data["statuses"]) == 1 and 200 in data["statuses"]):
+            continue  # 与 split_by_severity 的筛选一致
+        for site, count in data["sites"].items():
+            row = summary.setdefault(site or "-", {"requests": 0, "严重": 0, "可疑": 0})
+            row["requests"] += count
+            row[data["severity"]] += 1
+    if not summary:
+        return
+    print(f"\n各站点汇总 (站点数量: {len(summary)}):")
+    print("| 站点 | 攻击请求次数 | 严重风险IP | 轻微风险IP |")
+    print("|------|--------------|------------|------------|")
+    for site, row in sorted(summary.items(), key=lambda item: item[1]["requests"], reverse=True):
+        print(f"| {site} | {row['requests']} | {row['严重']} | {row['可疑']} |")
 
 def print_attack_table(attacks):
-    print("| 恶意IP | 返回状态码 | 攻击开始时间 | 时间跨度 | 攻击方式 | 请求次数 | 请求频率(/秒) | 404状态次数 | 严重程度 |")
-    print("|---------|------------|--------------|----------|----------|----------|----------------|-------------|----------|")
+    print("| 恶意IP | 站点 | 返回状态码 | 攻击开始时间 | 时间跨度 | 攻击方式 | 请求次数 | 请求频率(/秒) | 404状态次数 | 严重程度 |")
+    print("|---------|------|------------|--------------|----------|----------|----------|----------------|-------------|----------|")
     for attack in attacks:
-        print(f"| {attack['ip']} | {attack['statuses']} | {attack['start_time']} | {attack['duration']} | {attack['attack_types']} | {attack['count']} | {attack['request_rate']} | {attack['404_count']} | {attack['severity']} |")
+        print(f"| {attack['ip']} | {attack['sites']} | {attack['statuses']} | {attack['start_time']} | {attack['duration']} | {attack['attack_types']} | {attack['count']} | {attack['request_rate']} | {attack['404_count']} | {attack['severity']} |")
 
 def main():
+    parser = argparse.ArgumentParser(description="分析访问日志中的攻击行为")
+    add_engine_arguments(parser, CHECKPOINT_FILE)
+    add_bot_verifier_arguments(parser)
+    args = parser.parse_args()
+
     whitelist = load_whitelist()
-    attacks = analyze_logs(LOG_PATHS, whitelist)
+    bot_verifier = bot_verifier_from_args(args)
+    analyzer = AttackAnalyzer(whitelist, bot_verifier)
+    engine_from_args([analyzer], args).run(log_paths_from_args(LOG_PATHS, args))
+    if bot_verifier:
+        verify_claims(bot_verifier, [analyzer])
+    attacks = analyzer.result()
     format_output(attacks)
 
 if __name__ == "__main__":
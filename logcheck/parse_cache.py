@@ -0,0 +1,178 @@
+"""
+日志解析结果缓存
+调整阈值后重新运行分析时，日志内容没有变化却要重新解析一遍。这里把每个日志文件解析出的字段
+按列保存（字符串驻留为编号，状态码、响应大小存入 array），放在 PARSE_CACHE_DIR 中以日志路径命名的 .parsecache 文件里。
+缓存用 pickle 保存，加载时会执行其中的代码，所以只放在 root 专用的目录中，不放在网站用户可写的日志目录里，
+属主不是当前用户或其他用户可写的缓存文件一律不加载。
+缓存以 inode、已缓存的字节数，以及文件开头和缓存末尾各 4KB 的哈希为指纹（日志追加内容后 mtime 总会变化，不参与比较）：
+文件未变化时直接回放缓存中的记录；文件只是追加了内容时回放缓存后只解析新增的部分，再更新缓存。
+回放时按原来的顺序调用分析器的 feed() / on_unmatched()，结果与重新解析一致。
+"""
+
+import hashlib
+import os
+import pickle
+from array import array
+from operator import attrgetter
+
+from log_engine import LogRecord
+from record_store import Interner
+
+PARSE_CACHE_VERSION = 2
+PARSE_CACHE_SUFFIX = '.parsecache'
+# 默认的缓存目录，只有 root 可以访问
+PARSE_CACHE_DIR = "/root/logcheck/parsecache"
+# 指纹中参与哈希的开头、结尾字节数
+FINGERPRINT_BYTES = 4096
+
+# 按编号保存的字符串字段，status、size 直接保存数值
+STRING_FIELDS = ('ip', 'time', 'request', 'method', 'url', 'protocol', 'referrer', 'user_agent', 'tail')
+get_fields = attrgetter(*STRING_FIELDS, 'status', 'size')
+# 每攒够这么多条记录按列编码一次
+ENCODE_BATCH = 8192
+
+def fingerprint(log_path, offset):
+    """日志文件前 offset 字节的指纹"""
+    inode = os.stat(log_path).st_ino
+    with open(log_path, 'rb') as f:
+        head = hashlib.sha1(f.read(min(offset, FINGERPRINT_BYTES))).hexdigest()
+        tail_start = max(0, offset - FINGERPRINT_BYTES)
+        f.seek(tail_start)
+        tail = hashlib.sha1(f.read(offset - tail_start)).hexdigest()
+    return {'inode': inode, 'offset': offset, 'head': head, 'tail': tail}
+
+class RecordColumns:
+    """按列收集解析后的记录和无法匹配的行，作为分析器接入 LogEngine"""
+
+    def __init__(self):
+        self.strings = Interner()
+        self.columns = {name: array('i') for name in STRING_FIELDS}
+        self.status = array('H')
+        self.size = array('q')
+        # (出现在第几条记录之前, 行内容)
+        self.unmatched = []
+        # 尚未编码的记录字段元组，攒够一批再按列编码，比逐条查字典快
+        self.pending = []
+
+    def __len__(self):
+        return len(self.status) + len(self.pending)
+
+    def __getstate__(self):
+        self.flush()
+        return self.__dict__
+
+    def feed(self, record):
+        self.pending.append(get_fields(record))
+        if len(self.pending) >= ENCODE_BATCH:
+            self.flush()
+
+    def on_unmatched(self, line):
+        self.unmatched.append((len(self), line))
+
+    def flush(self):
+        """把待编码的记录按列编码进 array：每批只对新出现的字符串分配编号，其余用 map 在 C 层查表"""
+        if not self.pending:
+            return
+        fields = list(zip(*self.pending))
+        self.pending = []
+        code = self.strings.code
+        lookup = self.strings.codes.__getitem__
+        for name, values in zip(STRING_FIELDS, fields):
+            for value in dict.fromkeys(values):
+                code(value)
+            self.columns[name].extend(map(lookup, values))
+        self.status.extend(fields[-2])
+        self.size.extend(fields[-1])
+
+    def new_partial(self):
+        return RecordColumns()
+
+    def merge(self, other):
+        """追加 other 中的记录，字符串编号重新映射到本对象的字典"""
+        self.flush()
+        other.flush()
+        base = len(self)
+        self.unmatched.extend((index + base, line) for index, line in other.unmatched)
+        mapping = [self.strings.code(value) for value in other.strings.values]
+        for name in STRING_FIELDS:
+            self.columns[name].extend(map(mapping.__getitem__, other.columns[name]))
+        self.status.extend(other.status)
+        self.size.extend(other.size)
+
+    def replay(self, analyzers):
+        """
+        按原顺序把记录和无法匹配的行分发给分析器，返回 (行数, 匹配数)。
+        与 mmap 后端一样，分析器不能在 feed() 之外保留记录对象：回放时复用同一个 LogRecord。
+        """
+        feeders = [analyzer.feed for analyzer in analyzers]
+        unmatched_handlers = [analyzer.on_unmatched for analyzer in analyzers
+                              if hasattr(analyzer, 'on_unmatched')]
+        lookup = self.strings.values.__getitem__
+        pending = iter(self.unmatched)
+        next_row, next_line = next(pending, (-1, None))
+        record = LogRecord()
+        for row, (record.ip, record.time, record.request, record.method, record.url, record.protocol,
+                  record.referrer, record.user_agent, record.tail, record.status, record.size) in enumerate(
+                zip(*(map(lookup, self.columns[name]) for name in STRING_FIELDS), self.status, self.size)):
+            while row == next_row:
+                for handler in unmatched_handlers:
+                    handler(next_line)
+                next_row, next_line = next(pending, (-1, None))
+            for feed in feeders:
+                feed(record)
+        while next_row >= 0:
+            for handler in unmatched_handlers:
+                handler(next_line)
+            next_row, next_line = next(pending, (-1, None))
+        return len(self) + len(self.unmatched), len(self)
+
+class ParseCache:
+    """缓存文件放在 cache_dir 中（以日志路径命名），cache_dir 为 None 时使用 PARSE_CACHE_DIR"""
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or PARSE_CACHE_DIR
+
+    def path_for(self, log_path):
+        name = os.path.abspath(log_path).strip(os.sep).replace(os.sep, '_')
+        return os.path.join(self.cache_dir, name + PARSE_CACHE_SUFFIX)
+
+    def load(self, log_path):
+        """返回 (RecordColumns, 已缓存的字节数)；没有可用缓存时返回空的 RecordColumns 和 0"""
+        cache_path = self.path_for(log_path)
+        try:
+            with open(cache_path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if st.st_uid != os.getuid() or st.st_mode & 0o022:
+                    print(f"警告: 解析缓存 {cache_path} 的属主不是当前用户或可被其他用户修改，不予加载")
+                    return RecordColumns(), 0
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return RecordColumns(), 0
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError) as e:
+            print(f"警告: 解析缓存 {cache_path} 损坏，将重新解析: {e}")
+            return RecordColumns(), 0
+        if data.get('version') != PARSE_CACHE_VERSION:
+            return RecordColumns(), 0
+        saved = data['fingerprint']
+        try:
+            st = os.stat(log_path)
+            # 文件被替换、截断，或已缓存部分的内容有变化时缓存作废
+            if st.st_ino != saved['inode'] or st.st_size < saved['offset']:
+                return RecordColumns(), 0
+            current = fingerprint(log_path, saved['offset'])
+        except FileNotFoundError:
+            return RecordColumns(), 0
+        if (current['head'], current['tail']) != (saved['head'], saved['tail']):
+            return RecordColumns(), 0
+        return data['columns'], saved['offset']
+
+    def save(self, log_path, columns, offset):
+        columns.flush()
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        cache_path = self.path_for(log_path)
+        tmp_path = cache_path + '.tmp'
+        data = {'version': PARSE_CACHE_VERSION, 'fingerprint': fingerprint(log_path, offset), 'columns': columns}
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, cache_path)
@@ -0,0 +1,134 @@
+"""
+按IP的流式滑动窗口频率检测
+每条记录到达时更新该IP最近一段时间内每秒的请求数，任一规则（如 60 秒内 71 次、300 秒内 70 次）
+的窗口计数达到阈值时立即触发回调，不必等整份日志解析完再排序统计。
+每个IP只保存最长窗口内有请求的那些秒及其计数，最多 max_window 项，与请求量无关：
+单个IP每秒上千次的洪水请求也只占一项。只保留最长窗口内仍有请求的IP，内存与活跃IP数成正比。
+"""
+
+import bisect
+
+class RateRule:
+    """window 秒内（与最新请求相差小于 window 秒）的请求数达到 limit 即触发"""
+
+    def __init__(self, name, window, limit):
+        self.name = name
+        self.window = window
+        self.limit = limit
+
+class SecondCounts:
+    """
+    一个IP每秒的请求数：有请求的秒（升序）和截至该秒的累计请求数，窗口内的请求数为两个累计数之差。
+    base 为已删除部分的累计请求数
+    """
+
+    __slots__ = ('seconds', 'totals', 'base')
+
+    def __init__(self):
+        self.seconds = []
+        self.totals = []
+        self.base = 0
+
+    def add(self, second):
+        seconds, totals = self.seconds, self.totals
+        if seconds and second == seconds[-1]:
+            totals[-1] += 1
+        elif not seconds or second > seconds[-1]:
+            seconds.append(second)
+            totals.append((totals[-1] if totals else self.base) + 1)
+        else:
+            # 多个日志文件交错或请求完成顺序不同导致的少量乱序，之后各秒的累计数都要加一
+            index = bisect.bisect_left(seconds, second)
+            if seconds[index] != second:
+                seconds.insert(index, second)
+                totals.insert(index, totals[index - 1] if index else self.base)
+            for i in range(index, len(totals)):
+                totals[i] += 1
+
+    def expire(self, cutoff):
+        """删除 cutoff 及更早的秒"""
+        seconds = self.seconds
+        if seconds and seconds[0] <= cutoff:
+            index = bisect.bisect_right(seconds, cutoff)
+            self.base = self.totals[index - 1]
+            del seconds[:index]
+            del self.totals[:index]
+
+    def count_since(self, cutoff):
+        """晚于 cutoff 的请求数"""
+        index = bisect.bisect_right(self.seconds, cutoff)
+        return self.totals[-1] - (self.totals[index - 1] if index else self.base)
+
+class RateDetector:
+    def __init__(self, rules, on_trigger=None, forget_expired=False):
+        self.rules = rules
+        # on_trigger(rule, ip, epoch, count)：IP 首次达到某条规则的阈值时调用
+        self.on_trigger = on_trigger
+        self.max_window = max(rule.window for rule in rules)
+        # IP -> 最长窗口内每秒的请求数（SecondCounts）
+        self.windows = {}
+        # 规则名 -> {触发过该规则的IP: 窗口内最高请求数}，按触发先后排列
+        self.peaks = {rule.name: {} for rule in rules}
+        # 长期运行时为 True：IP 离开窗口后同时忘掉触发记录，以后再次超限会重新触发
+        self.forget_expired = forget_expired
+        self.latest = None
+        self.next_sweep = None
+
+    def add(self, ip, epoch):
+        window = self.windows.get(ip)
+        if window is None:
+            window = self.windows[ip] = SecondCounts()
+        window.add(epoch)
+        newest = window.seconds[-1]
+        window.expire(newest - self.max_window)
+
+        for rule in self.rules:
+            count = window.count_since(newest - rule.window)
+            if count < rule.limit:
+                continue
+            peaks = self.peaks[rule.name]
+            peak = peaks.get(ip)
+            if peak is None:
+                peaks[ip] = count
+                if self.on_trigger:
+                    self.on_trigger(rule, ip, epoch, count)
+            elif count > peak:
+                peaks[ip] = count
+
+        if self.latest is None or epoch > self.latest:
+            self.latest = epoch
+            if self.next_sweep is None:
+                self.next_sweep = epoch + self.max_window
+            elif epoch >= self.next_sweep:
+                self.expire()
+
+    def expire(self):
+        """删除最长窗口内已没有请求的IP"""
+        cutoff = self.latest - self.max_window
+        self.windows = {ip: window for ip, window in self.windows.items() if window.seconds[-1] > cutoff}
+        if self.forget_expired:
+            for name, peaks in self.peaks.items():
+                self.peaks[name] = {ip: peak for ip, peak in peaks.items() if ip in self.windows}
+        self.next_sweep = self.latest + self.max_window
+
+    def active_ips(self):
+        return len(self.windows)
+
+    def triggered(self, rule_name):
+        return self.peaks[rule_name]
+
+    def get_state(self):
+        # 增量模式下只带走窗口内的每秒计数，使跨越两次运行的请求仍能一起计数；触发记录不跨运行保留
+        if self.latest is not None:
+            self.expire()
+        return {"windows": self.windows, "latest": self.latest}
+
+    def set_state(self, state):
+        self.windows = state.get("windows", {})
+        # 旧版本保存的是每个IP窗口内的请求时间戳
+        for ip, times in state.get("times", {}).items():
+            window = self.windows[ip] = SecondCounts()
+            for epoch in times:
+                window.add(epoch)
+        self.latest = state["latest"]
+        self.next_sweep = None if self.latest is None else self.latest + self.max_window
@@ -0,0 +1,274 @@
+"""
+LogAnalyzer 使用的列式记录存储
+每条请求不再保存为一个中文键的字典，而是拆成几列：IP、路由模板、请求类型、用户代理先驻留（intern）
+为整数编号，时间戳、状态码、响应大小直接存入 array 列。报表按列做分组统计，
+安装了 NumPy 时走向量化实现，否则退回纯 Python 循环，两者输出一致。
+"""
+
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class Interner:
+    """字符串（或元组）到连续整数编号的映射，编号按首次出现的顺序分配"""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getstate__(self):
+        return self.values
+
+    def __setstate__(self, values):
+        self.values = values
+        self.codes = {value: code for code, value in enumerate(values)}
+
+# 列名 -> array 类型码
+COLUMNS = {
+    'ip': 'i',        # IP 编号
+    'epoch': 'q',     # Unix 时间戳（秒）
+    'method': 'i',    # 请求类型编号
+    'route': 'i',     # 路由模板编号（routes.route_template，不保存原始 URL）
+    'status': 'H',    # 状态码
+    'size': 'q',      # 响应大小
+    'ua': 'i',        # (简化后的用户代理, 是否爬虫) 编号
+    'site': 'i',      # 站点编号
+}
+
+class RecordStore:
+    def __init__(self):
+        self.ips = Interner()
+        self.methods = Interner()
+        self.routes = Interner()
+        self.uas = Interner()
+        self.sites = Interner()
+        for name, typecode in COLUMNS.items():
+            setattr(self, name, array(typecode))
+
+    def __len__(self):
+        return len(self.epoch)
+
+    def append(self, ip, epoch, method, route, status, size, user_agent, is_crawler, site=''):
+        self.ip.append(self.ips.code(ip))
+        self.epoch.append(epoch)
+        self.method.append(self.methods.code(method))
+        self.route.append(self.routes.code(route))
+        self.status.append(status)
+        self.size.append(size)
+        self.ua.append(self.uas.code((user_agent, is_crawler)))
+        self.site.append(self.sites.code(site))
+
+    def extend(self, other):
+        """追加 other 中的记录，编号重新映射到本存储的字典"""
+        self.epoch.extend(other.epoch)
+        self.status.extend(other.status)
+        self.size.extend(other.size)
+        for name, interner in (('ip', 'ips'), ('method', 'methods'), ('route', 'routes'), ('ua', 'uas'), ('site', 'sites')):
+            mine = getattr(self, interner)
+            mapping = [mine.code(value) for value in getattr(other, interner).values]
+            codes = getattr(other, name)
+            if np is not None:
+                mapped = np.asarray(mapping, dtype=COLUMNS[name])[self._view(codes)]
+                getattr(self, name).frombytes(mapped.tobytes())
+            else:
+                getattr(self, name).extend(map(mapping.__getitem__, codes))
+
+    def is_crawler(self, row):
+        return self.uas.values[self.ua[row]][1]
+
+    # ---- 分组统计 ----
+    # skip_ip 是按 IP 判断是否排除（白名单等）的函数，每个不同的 IP 只调用一次。
+
+    @staticmethod
+    def _view(column):
+        return np.frombuffer(column, dtype=column.typecode)
+
+    def _columns(self, *names):
+        return [self._view(getattr(self, name)) for name in names]
+
+    def _ip_mask(self, skip_ip):
+        return np.fromiter((not skip_ip(ip) for ip in self.ips.values), dtype=bool, count=len(self.ips))
+
+    def _crawler_flags(self):
+        return np.fromiter((is_crawler for _, is_crawler in self.uas.values), dtype=bool, count=len(self.uas))
+
+    @staticmethod
+    def _group(codes):
+        """返回 (编号, 首次出现位置, 次数, 按编号稳定排序后的行序)"""
+        order = np.argsort(codes, kind='stable')
+        unique, first, counts = np.unique(codes, return_index=True, return_counts=True)
+        return unique, first, counts, order
+
+    @staticmethod
+    def _top(first, counts, limit):
+        # 次数降序，次数相同按首次出现的先后，与 sorted(..., reverse=True) / most_common 一致
+        return np.lexsort((first, -counts))[:limit]
+
+    def ip_summary(self, skip_ip, crawler, limit=20):
+        """
+        按 IP 汇总访问次数、用户代理、请求类型、状态码和平均响应大小，返回访问次数最多的 limit 个：
+        [(ip, 次数, {用户代理}, {请求类型}, {状态码字符串}, 平均响应大小), ...]
+        集合按记录出现顺序构建，与逐条 add 的结果一致。
+        """
+        if np is None:
+            return self._ip_summary_py(skip_ip, crawler, limit)
+        ip, ua, method, status, size = self._columns('ip', 'ua', 'method', 'status', 'size')
+        keep = self._ip_mask(skip_ip)[ip] & (self._crawler_flags()[ua] == crawler)
+        rows = np.flatnonzero(keep)
+        if not len(rows):
+            return []
+        unique, first, counts, order = self._group(ip[rows])
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        size_sums = np.add.reduceat(size[rows][order], starts)
+        result = []
+        for index in self._top(first, counts, limit).tolist():
+            group = rows[order[starts[index]:starts[index] + counts[index]]]
+            result.append((
+                self.ips.values[unique[index]],
+                int(counts[index]),
+                set(self.uas.values[code][0] for code in ua[group].tolist()),
+                set(self.methods.values[code] for code in method[group].tolist()),
+                set(str(code) for code in status[group].tolist()),
+                int(size_sums[index]) / int(counts[index]),
+            ))
+        return result
+
+    def _ip_summary_py(self, skip_ip, crawler, limit):
+        groups = {}
+        skipped = {}
+        for row in range(len(self)):
+            code = self.ip[row]
+            if code not in skipped:
+                skipped[code] = skip_ip(self.ips.values[code])
+            user_agent, is_crawler = self.uas.values[self.ua[row]]
+            if skipped[code] or is_crawler != crawler:
+                continue
+            data = groups.get(code)
+            if data is None:
+                data = groups[code] = [0, set(), set(), set(), 0]
+            data[0] += 1
+            data[1].add(user_agent)
+            data[2].add(self.methods.values[self.method[row]])
+            data[3].add(str(self.status[row]))
+            data[4] += self.size[row]
+        top = sorted(groups.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        return [(self.ips.values[code], count, uas, methods, statuses, size_sum / count)
+                for code, (count, uas, methods, statuses, size_sum) in top]
+
+    def route_summary(self, limit=20):
+        """
+        访问次数最多的 limit 个 (站点, 路由模板)：[(站点, 路由, 次数, 响应大小合计, 4xx/5xx 次数), ...]，
+        不同站点的同一路由分开计数
+        """
+        routes = len(self.routes)
+        if np is None:
+            groups = {}
+            for site, route, status, size in zip(self.site, self.route, self.status, self.size):
+                key = site * routes + route
+                data = groups.get(key)
+                if data is None:
+                    data = groups[key] = [0, 0, 0]
+                data[0] += 1
+                data[1] += size
+                data[2] += 400 <= status < 600
+            top = sorted(groups.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        else:
+            site, route, status, size = self._columns('site', 'route', 'status', 'size')
+            keys, first, inverse, counts = np.unique(site.astype(np.int64) * routes + route, return_index=True,
+                                                     return_inverse=True, return_counts=True)
+            size_sums = np.bincount(inverse, weights=size, minlength=len(keys)).astype(np.int64)
+            errors = np.bincount(inverse[(status >= 400) & (status < 600)], minlength=len(keys))
+            top = [(int(keys[index]), (int(counts[index]), int(size_sums[index]), int(errors[index])))
+                   for index in self._top(first, counts, limit).tolist()]
+        return [(self.sites.values[key // routes], self.routes.values[key % routes], *data) for key, data in top]
+
+    def ip_sites(self, ips):
+        """指定IP访问过的站点：{ip: [站点, ...]}，按该IP在各站点的请求次数从多到少排列"""
+        codes = {self.ips.codes[ip] for ip in ips if ip in self.ips.codes}
+        if not codes:
+            return {}
+        sites = len(self.sites)
+        if np is None:
+            counts = {}
+            for ip, site in zip(self.ip, self.site):
+                if ip in codes:
+                    key = ip * sites + site
+                    counts[key] = counts.get(key, 0) + 1
+            pairs = counts.items()
+        else:
+            ip, site = self._columns('ip', 'site')
+            rows = np.isin(ip, np.fromiter(codes, dtype=ip.dtype, count=len(codes)))
+            keys, counts = np.unique(ip[rows].astype(np.int64) * sites + site[rows], return_counts=True)
+            pairs = zip(keys.tolist(), counts.tolist())
+        result = {}
+        for key, count in sorted(pairs, key=lambda item: item[1], reverse=True):
+            result.setdefault(self.ips.values[key // sites], []).append(self.sites.values[key % sites])
+        return result
+
+    def site_summary(self):
+        """
+        各站点的汇总（跨站点视图）：[(站点, 请求数, 独立IP数, 4xx/5xx 次数, 响应大小合计), ...]，
+        按请求数从多到少排列
+        """
+        sites = len(self.sites)
+        ips = len(self.ips)
+        if np is None:
+            rows = [[0, set(), 0, 0] for _ in range(sites)]
+            for ip, site, status, size in zip(self.ip, self.site, self.status, self.size):
+                row = rows[site]
+                row[0] += 1
+                row[1].add(ip)
+                row[2] += 400 <= status < 600
+                row[3] += size
+            rows = [(requests, len(unique_ips), errors, size_sum) for requests, unique_ips, errors, size_sum in rows]
+        else:
+            ip, site, status, size = self._columns('ip', 'site', 'status', 'size')
+            requests = np.bincount(site, minlength=sites)
+            unique_ips = np.bincount(np.unique(site.astype(np.int64) * ips + ip) // max(ips, 1), minlength=sites)
+            errors = np.bincount(site[(status >= 400) & (status < 600)], minlength=sites)
+            # float64 累加，合计在 2^53 字节以内是精确的
+            size_sums = np.bincount(site, weights=size, minlength=sites).astype(np.int64)
+            rows = zip(requests.tolist(), unique_ips.tolist(), errors.tolist(), size_sums.tolist())
+        summary = [(self.sites.values[code], *row) for code, row in enumerate(rows)]
+        return sorted(summary, key=lambda row: row[1], reverse=True)
+
+    def error_status_counts(self, skip_ip, limit=15):
+        """状态码 4xx/5xx 次数最多的 limit 个 IP：[(ip, [(状态码, 次数), ...]), ...]，状态码升序"""
+        if np is None:
+            groups = {}
+            for row in range(len(self)):
+                status = self.status[row]
+                code = self.ip[row]
+                if 400 <= status < 600 and not skip_ip(self.ips.values[code]):
+                    counts = groups.setdefault(code, {})
+                    counts[status] = counts.get(status, 0) + 1
+            top = sorted(groups.items(), key=lambda item: sum(item[1].values()), reverse=True)[:limit]
+            return [(self.ips.values[code], sorted(counts.items())) for code, counts in top]
+
+        ip, status = self._columns('ip', 'status')
+        keep = (status >= 400) & (status < 600)
+        keep &= self._ip_mask(skip_ip)[ip]
+        rows = np.flatnonzero(keep)
+        if not len(rows):
+            return []
+        unique, first, counts, order = self._group(ip[rows])
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        result = []
+        for index in self._top(first, counts, limit).tolist():
+            group = rows[order[starts[index]:starts[index] + counts[index]]]
+            statuses, status_counts = np.unique(status[group], return_counts=True)
+            result.append((self.ips.values[unique[index]], list(zip(statuses.tolist(), status_counts.tolist()))))
+        return result
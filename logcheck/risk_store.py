@@ -0,0 +1,129 @@
+"""
+高风险IP存储（SQLite，WAL 模式）
+取代只增不减的 severe_risk_ips.log：每个IP一行，以IP为主键，记录首次/最近出现时间、
+严重程度、来源分析器、命中次数和到期时间。写入用 INSERT ... ON CONFLICT 一条语句完成
+（按主键索引查找），到期清理返回需要解封的IP，交给封禁后端批量解封。
+logcheck.py、web_log_monitor.py 和 ban_severe_risk_ips.py 共用同一个数据库。
+"""
+
+import os
+import sqlite3
+import time
+
+RISK_DB = '/root/logcheck/risk_ips.db'
+# 旧版的高风险IP日志，首次创建数据库时导入
+LEGACY_SEVERE_RISK_LOG = '/root/logcheck/severe_risk_ips.log'
+
+# 最近一次出现之后保留封禁的时长（秒）
+RISK_TTL = 7 * 24 * 3600
+
+# 严重程度从低到高，同一IP多次记录时保留最高的一个
+SEVERITY_LEVELS = ['可疑', '严重']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS risky_ips (
+    ip TEXT PRIMARY KEY,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    severity INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 1,
+    expires_at INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS risky_ips_expires_at ON risky_ips (expires_at);
+"""
+
+UPSERT = """
+INSERT INTO risky_ips (ip, first_seen, last_seen, severity, source, expires_at)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (ip) DO UPDATE SET
+    first_seen = min(first_seen, excluded.first_seen),
+    last_seen = max(last_seen, excluded.last_seen),
+    severity = max(severity, excluded.severity),
+    source = excluded.source,
+    hits = hits + 1,
+    expires_at = max(expires_at, excluded.expires_at)
+"""
+
+class RiskStore:
+    def __init__(self, path=RISK_DB, ttl=RISK_TTL):
+        self.path = path
+        self.ttl = ttl
+        created = not os.path.exists(path)
+        # 守护模式在后台线程写入（同一时间只有一个线程使用连接）
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+        self.imported = 0
+        if created and os.path.exists(LEGACY_SEVERE_RISK_LOG):
+            self.imported = self.import_legacy(LEGACY_SEVERE_RISK_LOG)
+
+    def import_legacy(self, log_path):
+        with open(log_path, 'r') as f:
+            ips = [line.strip() for line in f if line.strip()]
+        # 旧日志没有时间信息，按导入时间计算到期，避免升级后立即全部解封
+        return len(self.record_many(ips, '严重', 'severe_risk_ips.log'))
+
+    def __contains__(self, ip):
+        row = self.conn.execute('SELECT expires_at FROM risky_ips WHERE ip = ?', (ip,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def get(self, ip):
+        """返回IP的记录字典，不存在时返回 None"""
+        row = self.conn.execute(
+            'SELECT ip, first_seen, last_seen, severity, source, hits, expires_at FROM risky_ips WHERE ip = ?',
+            (ip,)).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(('ip', 'first_seen', 'last_seen', 'severity', 'source', 'hits', 'expires_at'), row))
+        record['severity'] = SEVERITY_LEVELS[record['severity']]
+        return record
+
+    def record(self, ip, severity, source, seen=None):
+        return bool(self.record_many([ip], severity, source, seen))
+
+    def record_many(self, ips, severity, source, seen=None):
+        """记录（或刷新）一批IP，seen 为出现时间（默认当前时间），返回其中原本不在库中（或已过期）的IP列表"""
+        seen = seen if seen is not None else time.time()
+        return self.record_times(dict.fromkeys(ips, seen), severity, source)
+
+    def record_times(self, times, severity, source):
+        """
+        times 为 {ip: 出现时间}，每个IP的到期时间为出现时间 + ttl。
+        在一个事务中完成，返回其中原本不在库中（或已过期）的IP列表。
+        """
+        level = SEVERITY_LEVELS.index(severity)
+        new_ips = []
+        with self.conn:
+            for ip, seen in times.items():
+                seen = int(seen)
+                if ip not in self:
+                    new_ips.append(ip)
+                self.conn.execute(UPSERT, (ip, seen, seen, level, source, seen + self.ttl))
+        return new_ips
+
+    def active_ips(self, now=None):
+        """未过期的IP，按首次出现时间排序"""
+        now = int(now if now is not None else time.time())
+        return [ip for ip, in self.conn.execute(
+            'SELECT ip FROM risky_ips WHERE expires_at > ? ORDER BY first_seen, ip', (now,))]
+
+    def sweep(self, now=None, batch_size=1000):
+        """
+        到期清理：按批产出已过期的IP，调用方解封成功后用 remove() 删除这些记录；
+        解封失败的IP留在库中，下次清理时重试。
+        """
+        now = int(now if now is not None else time.time())
+        expired = [ip for ip, in self.conn.execute(
+            'SELECT ip FROM risky_ips WHERE expires_at <= ? ORDER BY expires_at', (now,))]
+        for start in range(0, len(expired), batch_size):
+            yield expired[start:start + batch_size]
+
+    def remove(self, ips):
+        with self.conn:
+            self.conn.executemany('DELETE FROM risky_ips WHERE ip = ?', ((ip,) for ip in ips))
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,110 @@
+"""
+URL 路由归一化
+同一个页面的不同参数（/video/123.html、/video/456.html?from=1）按原始 URL 统计会分散成大量键，
+报表中的 Top 表被同一路由的不同编号占满，按 URL 驻留的字符串也随访问量不断增长。
+这里把 URL 映射为路由模板（/video/{id}.html）：
+
+1. 去掉查询串和锚点；
+2. 从路径开头按路由规则匹配（route_rules）：WHITELISTED_PATHS 中 maccms 的常用路由按正则还原成模板，
+   调用方给出的路径前缀（如 log_analysis.py 的 RESOURCE_TYPES）保持原样，规则之后余下的部分继续第 3 步；
+3. 逐段识别：纯数字及 5-1-3、1-----2--- 这样的编号记为 {id}，UUID 记为 {uuid}，
+   长的十六进制串记为 {hash}，字母数字混合的长串记为 {token}；
+   子目录中按条目上传的图片、视频分片（PER_ITEM_EXTENSIONS）只保留扩展名（{file}.jpg），站点根目录的文件（/favicon.ico）除外。
+
+同一路径的结果缓存在内存中，缓存满后清空重来。
+"""
+
+import re
+
+# 白名单路径（预编译正则表达式）：maccms 的常用路由，logcheck.py 按它们放行正常请求，这里按它们归并路由
+WHITELISTED_PATHS = [
+    re.compile(r'/index\.php/ajax/hits'),
+    re.compile(r'/index\.php/user/ajax_ulog'),
+    re.compile(r'/video/\d+\.html'),
+    re.compile(r'/play/\d+-\d+-\d+\.html'),
+    re.compile(r'/show/')
+]
+
+# 按条目上传的图片、视频分片的扩展名：每个文件对应一个条目（封面、截图、分片），文件名不参与统计
+PER_ITEM_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp', 'ico', 'svg',
+                       'm3u8', 'ts', 'mp4', 'flv', 'm4s', 'mp3'}
+
+# 路径段（去掉扩展名后按 . 拆开的每一部分）的自动识别规则，按顺序匹配
+SEGMENT_PATTERNS = [
+    (re.compile(r'(?=[-_]*\d)[\d_-]+'), '{id}'),
+    (re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'), '{uuid}'),
+    (re.compile(r'(?=[a-fA-F]*\d)[0-9a-fA-F]{8,}'), '{hash}'),
+    (re.compile(r'(?=[\w-]*\d)(?=[\w-]*[A-Za-z])[\w-]{20,}'), '{token}'),
+]
+
+# 扩展名：1 到 5 个字母数字
+EXTENSION_PATTERN = re.compile(r'(?P<stem>.+)\.(?P<extension>[A-Za-z0-9]{1,5})')
+
+# 路径 -> 路由模板缓存的条目上限
+ROUTE_CACHE_SIZE = 65536
+
+def pattern_template(pattern):
+    """把只含字面量和 \\d+ 的路径正则还原成模板：/video/\\d+\\.html -> /video/{id}.html"""
+    return re.sub(r'\\(.)', r'\1', pattern.pattern.replace(r'\d+', '{id}'))
+
+def route_rules(prefixes=(), patterns=WHITELISTED_PATHS):
+    """
+    生成路由规则 (从路径开头匹配的正则, 匹配部分的模板)：先按 patterns 中的正则，
+    再按 prefixes 中的路径前缀（长的优先），前缀本身不做识别
+    """
+    rules = [(pattern, pattern_template(pattern)) for pattern in patterns]
+    rules += [(re.compile(re.escape(prefix)), prefix) for prefix in sorted(prefixes, key=len, reverse=True)]
+    return rules
+
+ROUTE_RULES = route_rules()
+
+def template_part(part):
+    for pattern, placeholder in SEGMENT_PATTERNS:
+        if pattern.fullmatch(part):
+            return placeholder
+    return part
+
+def template_segment(segment, last, nested):
+    """一个路径段的模板；last 为 True 表示是最后一段（文件名），扩展名保留原样；nested 表示不在站点根目录"""
+    m = EXTENSION_PATTERN.fullmatch(segment) if last else None
+    if m is None:
+        return '.'.join(map(template_part, segment.split('.')))
+    extension = m.group('extension')
+    if nested and extension.lower() in PER_ITEM_EXTENSIONS:
+        return '{file}.' + extension
+    return '.'.join(map(template_part, m.group('stem').split('.'))) + '.' + extension
+
+class RouteNormalizer:
+    def __init__(self, rules=ROUTE_RULES, cache_size=ROUTE_CACHE_SIZE):
+        self.rules = rules
+        self.cache_size = cache_size
+        self.cache = {}
+
+    def template(self, url):
+        """/video/123.html?from=1 -> /video/{id}.html"""
+        path = url.split('?', 1)[0].split('#', 1)[0]
+        route = self.cache.get(path)
+        if route is None:
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            route = self.cache[path] = self.match(path)
+        return route
+
+    def match(self, path):
+        nested = path.count('/') > 1
+        prefix = ''
+        for pattern, template in self.rules:
+            m = pattern.match(path)
+            if m:
+                prefix, path = template, path[m.end():]
+                break
+        segments = path.split('/')
+        last = len(segments) - 1
+        return prefix + '/'.join(template_segment(segment, index == last, nested) if segment else segment
+                                 for index, segment in enumerate(segments)) or '/'
+
+_default_normalizer = RouteNormalizer()
+
+def route_template(url):
+    """用默认规则归一化 URL"""
+    return _default_normalizer.template(url)
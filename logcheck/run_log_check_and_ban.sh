@@ -6,11 +6,8 @@ echo "Script started at $(date)" >> /root/logcheck/cron_run.log
 # 设置工作目录
 cd /root/logcheck
 
-# 运行 logcheck.py
-/usr/bin/python3 logcheck.py
-
-# 运行 web_log_monitor.py
-/usr/bin/python3 web_log_monitor.py
+# 运行 log_pipeline.py（单次读取日志，完成 logcheck.py、web_log_monitor.py、log_analysis.py 的分析）
+/usr/bin/python3 log_pipeline.py --incremental
 
 # 运行 ban_severe_risk_ips.py
 /usr/bin/python3 ban_severe_risk_ips.py
@@ -1,36 +1,234 @@
+import argparse
+import asyncio
+import json
 import re
+import signal
 import subprocess
 import os
-from collections import defaultdict, Counter
-from datetime import datetime, timedelta, timezone
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from importlib import metadata
 from ua_parser import user_agent_parser
 
+from ban_backend import add_ban_arguments, ban_backend_from_args, get_ban_backend
+from bot_verifier import add_bot_verifier_arguments, bot_verifier_from_args, claimed_bot, verify_claims
+from ip_matcher import load_whitelist_matcher
+from latency import LatencyAnalyzer, latency_report
+from log_discovery import log_paths_from_args, site_name
+from log_engine import LogEngine, add_engine_arguments, engine_from_args, parse_line
+from log_tail import TailStats, follow
+from rate_detector import RateDetector, RateRule
+from record_store import RecordStore
+from routes import route_template
+from risk_store import RiskStore
+
+# 增量模式的断点文件
+CHECKPOINT_FILE = '/root/logcheck/web_log_monitor.checkpoint'
+
+# 频率检测规则：同一IP在窗口（秒）内的请求数达到阈值即触发，不统计爬虫和白名单IP
+HIGH_FREQUENCY_RULE = RateRule('high_frequency', 60, 31)  # 每分钟超过30次，列入高频率报表
+BAN_RULE = RateRule('ban', 60, 71)                         # 每分钟超过70次，立即封禁
+SUSPICIOUS_RULE = RateRule('suspicious', 300, 70)          # 5分钟内达到70次，列为可疑IP
+
+# 守护模式的状态文件，每个统计区间覆盖写入一次运行计数（JSON）
+STATUS_FILE = '/root/logcheck/web_log_monitor.status.json'
+
+# UA 解析结果的内存缓存条目上限，以及跨运行保留的预热缓存文件
+UA_CACHE_SIZE = 20000
+UA_CACHE_FILE = '/root/logcheck/ua_cache.json'
+UA_CACHE_VERSION = 1
+
+def ua_parser_version():
+    try:
+        return metadata.version('ua-parser')
+    except metadata.PackageNotFoundError:
+        return None
+
+def simplify_user_agent(user_agent):
+    parsed_ua = user_agent_parser.Parse(user_agent)
+    ua_family = parsed_ua['user_agent']['family']
+    os_family = parsed_ua['os']['family']
+    device_family = parsed_ua['device']['family']
+
+    if 'bot' in ua_family.lower() or 'crawler' in ua_family.lower() or 'spider' in ua_family.lower():
+        return ua_family, True
+    elif os_family:
+        return os_family, False
+    elif device_family:
+        return device_family, False
+    else:
+        return 'Unknown', False
+
+class UAStats:
+    """UA 缓存的命中统计，并行解析时各工作进程分别统计，合并后汇总"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.parse_seconds = 0.0
+
+    def add(self, other):
+        self.hits += other.hits
+        self.misses += other.misses
+        self.parse_seconds += other.parse_seconds
+
+    def average_parse_seconds(self, default=0.0):
+        return self.parse_seconds / self.misses if self.misses else default
+
+    def summary(self, average_parse_seconds):
+        total = self.hits + self.misses
+        if not total:
+            return "UA缓存：本次没有需要识别的用户代理。"
+        saved = self.hits * average_parse_seconds
+        return (f"UA缓存：查询 {total} 次，命中率 {self.hits / total * 100:.1f}%，"
+                f"实际解析 {self.misses} 次耗时 {self.parse_seconds:.2f} 秒，估计节省 {saved:.2f} 秒。")
+
+class UACache:
+    """simplify_user_agent 结果的有界 LRU 缓存，同一次运行中所有日志文件共用"""
+
+    def __init__(self, maxsize=UA_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        # 单次 UA 解析的平均耗时，全部命中预热缓存时用上次运行保存的值估算节省的时间
+        self.average_parse_seconds = 0.0
+
+    def classify(self, user_agent, stats, learned=None):
+        """learned 不为 None 时把新解析的结果也记入其中（并行工作进程用它把结果带回主进程）"""
+        result = self.entries.get(user_agent)
+        if result is not None:
+            self.entries.move_to_end(user_agent)
+            stats.hits += 1
+            return result
+        start = time.perf_counter()
+        result = simplify_user_agent(user_agent)
+        stats.parse_seconds += time.perf_counter() - start
+        stats.misses += 1
+        if learned is not None:
+            learned[user_agent] = result
+        self.put(user_agent, result)
+        return result
+
+    def put(self, user_agent, result):
+        self.entries[user_agent] = result
+        self.entries.move_to_end(user_agent)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def load(self, path):
+        """读取预热缓存，ua-parser 版本变化时识别结果可能不同，直接丢弃。返回载入的条目数"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (ValueError, OSError) as e:
+            print(f"警告: UA缓存文件 {path} 无法读取，将重新解析: {e}")
+            return 0
+        if data.get('version') != UA_CACHE_VERSION or data.get('parser_version') != ua_parser_version():
+            return 0
+        # 按最近使用的先后保存，越靠后越新
+        self.average_parse_seconds = data.get('average_parse_seconds', 0.0)
+        entries = data.get('entries', [])[-self.maxsize:]
+        for user_agent, simplified_ua, is_crawler in entries:
+            self.put(user_agent, (simplified_ua, is_crawler))
+        return len(entries)
+
+    def save(self, path):
+        data = {
+            'version': UA_CACHE_VERSION,
+            'parser_version': ua_parser_version(),
+            'average_parse_seconds': self.average_parse_seconds,
+            'entries': [[user_agent, simplified_ua, is_crawler]
+                        for user_agent, (simplified_ua, is_crawler) in self.entries.items()],
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+ua_cache = UACache()
+
+def add_ua_cache_arguments(parser):
+    parser.add_argument('--ua-cache', default=UA_CACHE_FILE,
+                        help=f'UA识别结果的预热缓存文件，跨运行复用（默认 {UA_CACHE_FILE}）')
+    parser.add_argument('--no-ua-cache', action='store_true', help='不读取也不保存UA预热缓存文件')
+
+def ua_cache_path(args):
+    if args is None or getattr(args, 'no_ua_cache', True):
+        return None
+    return args.ua_cache
+
+def add_record(store, record, ua_stats, learned=None, site=''):
+    """返回 (简化后的用户代理, 是否爬虫)"""
+    simplified_ua, is_crawler = ua_cache.classify(record.user_agent, ua_stats, learned)
+    store.append(record.ip, record.epoch, record.method, route_template(record.url), record.status, record.size,
+                 simplified_ua, is_crawler, site)
+    return simplified_ua, is_crawler
+
+class RecordBatch:
+    """并行解析时在工作进程内收集记录，由 LogAnalyzer.merge 按日志顺序合并"""
+
+    def __init__(self):
+        self.records = RecordStore()
+        self.ua_stats = UAStats()
+        self.learned_uas = {}
+        self.unmatched = []
+        self.latency = LatencyAnalyzer()
+        self.site = ''
+
+    def begin_file(self, log_path):
+        self.site = site_name(log_path)
+        self.latency.begin_file(log_path)
+
+    def feed(self, record):
+        add_record(self.records, record, self.ua_stats, self.learned_uas, self.site)
+        self.latency.feed(record)
+
+    def on_unmatched(self, line):
+        self.unmatched.append(line.strip())
+
 class LogAnalyzer:
     def __init__(self):
         self.log_files = [
             '/www/wwwlogs/123.log',
             # 在这里添加更多日志文件路径
         ]
-        self.pattern = re.compile(
-            r'(?P<ip>\S+)\s+-\s+-\s+'
-            r'\[(?P<time>[^\]]+)\]\s+'
-            r'"(?P<method>\S+)\s+(?P<url>\S+)\s+(?P<protocol>[^"]+)"\s+'
-            r'(?P<status>\d+)\s+'
-            r'(?P<response_size>\d+)\s+'
-            r'"(?P<referrer>[^"]*)"\s+'
-            r'"(?P<user_agent>[^"]+)"'
-        )
-        self.records = []
-        self.url_counter = Counter()
+        self.records = RecordStore()
+        self.ua_stats = UAStats()
+        # 当前正在解析的日志所属站点，记入每条记录
+        self.site = ''
+        # 日志格式包含 $request_time 等耗时字段时，按路由、上游统计耗时分布
+        self.latency = LatencyAnalyzer()
+        # 随记录到达实时更新的频率检测，达到封禁阈值时立即封禁
+        self.rate_detector = RateDetector([HIGH_FREQUENCY_RULE, BAN_RULE, SUSPICIOUS_RULE], self.on_rate_trigger)
+        self.banned_ips = []
+        # 触发封禁但尚未提交的IP，解析结束（守护模式下每批日志行之后）一次性提交
+        self.pending_bans = []
+        self.ban_backend = get_ban_backend()
         self.ip_pattern = re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$')
         self.output_file = open('analyze_logs.txt', 'w', encoding='utf-8')
+        # 守护模式下封禁在后台线程执行，日志输出需要加锁
+        self.log_lock = threading.Lock()
         self.whitelist = self.load_whitelist()
-        self.severe_risk_log = 'severe_risk_ips.log'
-        self.ensure_log_file_exists()
+        self.risk_store = self.open_risk_store()
+        # 启用爬虫验证时，自称爬虫但缓存中没有结论的IP：{ip: 自称的爬虫}，以及暂缓计入频率检测的 (ip, 时间)
+        self.bot_verifier = None
+        self.bot_claims = {}
+        self.bot_events = []
 
     def log(self, message: str):
-        print(message)
-        self.output_file.write(message + '\n')
+        with self.log_lock:
+            print(message)
+            self.output_file.write(message + '\n')
+
+    def truncate_output(self):
+        """清空输出文件；守护模式每个状态区间调用一次，文件只保留最近一个区间的输出"""
+        with self.log_lock:
+            self.output_file.seek(0)
+            self.output_file.truncate()
 
     def load_whitelist(self):
         whitelist_file = '/root/logcheck/ip_whitelist.txt'
@@ -41,95 +239,164 @@ class LogAnalyzer:
         else:
             self.log(f"白名单文件 {whitelist_file} 已存在，跳过创建。")
 
-        whitelist = set()
-        with open(whitelist_file, 'r') as f:
-            for line in f:
-                ip = line.strip()
-                if self.ip_pattern.match(ip):
-                    whitelist.add(ip)
-        return whitelist
-
-    def ensure_log_file_exists(self):
-        if not os.path.exists(self.severe_risk_log):
-            with open(self.severe_risk_log, 'w') as f:
-                pass
-            self.log(f"创建了新的高风险IP日志文件：{self.severe_risk_log}")
-        else:
-            self.log(f"高风险IP日志文件 {self.severe_risk_log} 已存在，跳过创建。")
-
-    def simplify_user_agent(self, user_agent):
-        parsed_ua = user_agent_parser.Parse(user_agent)
-        ua_family = parsed_ua['user_agent']['family']
-        os_family = parsed_ua['os']['family']
-        device_family = parsed_ua['device']['family']
-
-        if 'bot' in ua_family.lower() or 'crawler' in ua_family.lower() or 'spider' in ua_family.lower():
-            return ua_family, True
-        elif os_family:
-            return os_family, False
-        elif device_family:
-            return device_family, False
-        else:
-            return 'Unknown', False
+        # 每行一个IP或网段
+        return load_whitelist_matcher(whitelist_file)
+
+    def open_risk_store(self):
+        risk_store = RiskStore()
+        if risk_store.imported:
+            self.log(f"已从旧的高风险IP日志文件导入 {risk_store.imported} 个IP到 {risk_store.path}")
+        self.log(f"高风险IP数据库 {risk_store.path}：{len(risk_store.active_ips())} 个未过期IP。")
+        return risk_store
 
-    def parse_logs(self):
+    def parse_logs(self, args=None):
+        """args 为命令行参数时按其选择增量模式、并行进程数和解析后端"""
         self.log("开始解析日志文件...")
-        for log_file in self.log_files:
-            self.log(f"正在处理日志文件: {log_file}")
+        cache_path = ua_cache_path(args)
+        self.warm_ua_cache(cache_path)
+        engine = engine_from_args([self], args) if args else LogEngine([self])
+        log_files = log_paths_from_args(self.log_files, args)
+        if engine.checkpoint:
+            self.log("增量模式：只处理上次运行后新追加的日志。")
+            engine.run(log_files)
+        elif engine.ordered and len(log_files) > 1:
+            self.log(f"正在按时间归并处理 {len(log_files)} 个日志文件。")
+            engine.run(log_files)
+        elif engine.jobs > 1 and len(log_files) > 1:
+            self.log(f"正在以 {engine.jobs} 个进程并发处理 {len(log_files)} 个日志文件。")
+            engine.run(log_files)
+        else:
+            for log_file in log_files:
+                self.log(f"正在处理日志文件: {log_file}")
+                try:
+                    engine.process_file(log_file)
+                except Exception as e:
+                    self.log(f"无法读取日志文件 {log_file}: {e}")
+        self.log(f"日志解析完成。共解析 {self.record_count()} 条记录。")
+        if self.bot_verifier:
+            verify_claims(self.bot_verifier, [self], self.log)
+        self.flush_bans()
+        self.finish_ua_cache(cache_path)
+
+    def warm_ua_cache(self, cache_path):
+        if cache_path:
+            loaded = ua_cache.load(cache_path)
+            if loaded:
+                self.log(f"已从 {cache_path} 预热 {loaded} 条UA识别结果。")
+
+    def finish_ua_cache(self, cache_path):
+        ua_cache.average_parse_seconds = self.ua_stats.average_parse_seconds(ua_cache.average_parse_seconds)
+        self.log(self.ua_stats.summary(ua_cache.average_parse_seconds) + "\n")
+        if cache_path:
             try:
-                with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
-                    for line in f:
-                        match = self.pattern.match(line)
-                        if match:
-                            data = match.groupdict()
-                            simplified_ua, is_crawler = self.simplify_user_agent(data['user_agent'])
-                            self.records.append({
-                                'IP地址': data['ip'],
-                                '时间': data['time'],
-                                '请求类型': data['method'],
-                                '请求URL': data['url'],
-                                '状态码': data['status'],
-                                '用户代理': simplified_ua,
-                                '响应大小': data['response_size'],
-                                '是爬虫': is_crawler
-                            })
-                            self.url_counter[data['url']] += 1
-                        else:
-                            self.log(f"无法匹配的日志行: {line.strip()}")
-            except Exception as e:
-                self.log(f"无法读取日志文件 {log_file}: {e}")
-        self.log(f"日志解析完成。共解析 {len(self.records)} 条记录。\n")
+                ua_cache.save(cache_path)
+            except OSError as e:
+                self.log(f"保存UA缓存文件 {cache_path} 时出错: {e}")
+
+    def record_count(self):
+        return len(self.records)
+
+    def get_state(self):
+        # 保留频率检测窗口内的请求时间，使跨越两次运行的频率窗口也能被检测到
+        return {'rate_detector': self.rate_detector.get_state()}
+
+    def set_state(self, state):
+        self.rate_detector.set_state(state['rate_detector'])
+
+    def begin_file(self, log_path):
+        self.site = site_name(log_path)
+        self.latency.begin_file(log_path)
+
+    def feed(self, record):
+        simplified_ua, is_crawler = add_record(self.records, record, self.ua_stats, site=self.site)
+        self.latency.feed(record)
+        self.track_rate(record.ip, record.epoch, is_crawler, simplified_ua)
+
+    def track_rate(self, ip, epoch, is_crawler, simplified_ua=''):
+        if ip in self.whitelist:
+            return
+        if is_crawler and self.bot_verifier is not None:
+            # 频率检测按IP独立计数，待验证IP的请求暂存，验证为冒充后按原顺序补做，结果与当场计入一致
+            bot = claimed_bot(simplified_ua)
+            if bot is not None:
+                verified = self.bot_verifier.status(ip, bot)
+                if verified is None:
+                    self.bot_claims[ip] = bot
+                    self.bot_events.append((ip, epoch))
+                    return
+                is_crawler = verified
+        if not is_crawler:
+            self.rate_detector.add(ip, epoch)
+
+    def apply_bot_results(self, results):
+        """results 为 {ip: True/False/None}：冒充者（False）暂存的请求补做频率检测，其余按爬虫不计"""
+        events, self.bot_events = self.bot_events, []
+        for ip, epoch in events:
+            if ip not in results:
+                self.bot_events.append((ip, epoch))
+            elif results[ip] is False:
+                self.rate_detector.add(ip, epoch)
+        for ip in results:
+            self.bot_claims.pop(ip, None)
+
+    def on_rate_trigger(self, rule, ip, epoch, count):
+        if rule is BAN_RULE:
+            self.banned_ips.append(ip)
+            self.pending_bans.append(ip)
+
+    def take_pending_bans(self):
+        ips, self.pending_bans = self.pending_bans, []
+        return ips
+
+    def flush_bans(self):
+        """把解析过程中触发封禁的IP合并为一批封禁，并记录到高风险IP数据库"""
+        self.apply_bans(self.take_pending_bans())
+
+    def apply_bans(self, ips):
+        if ips:
+            self.ban_ips(ips)
+            self.record_severe_risk_ips(ips)
+
+    def on_unmatched(self, line):
+        self.log(f"无法匹配的日志行: {line.strip()}")
+
+    def new_partial(self):
+        return RecordBatch()
+
+    def merge(self, batch):
+        for line in batch.unmatched:
+            self.log(f"无法匹配的日志行: {line}")
+        # 频率检测需要按时间顺序逐条更新，在主进程按日志顺序补做
+        records = batch.records
+        for row in range(len(records)):
+            simplified_ua, is_crawler = records.uas.values[records.ua[row]]
+            self.track_rate(records.ips.values[records.ip[row]], records.epoch[row], is_crawler, simplified_ua)
+        self.records.extend(records)
+        self.latency.merge(batch.latency)
+        self.ua_stats.add(batch.ua_stats)
+        for user_agent, result in batch.learned_uas.items():
+            ua_cache.put(user_agent, result)
+
+    def ip_site_names(self, ips):
+        """{ip: "站点1, 站点2"}，按该IP在各站点的请求次数从多到少"""
+        return {ip: ', '.join(sites) for ip, sites in self.records.ip_sites(ips).items()}
+
+    def display_site_summary(self):
+        """跨站点视图：各站点的请求数、独立IP、错误数和流量，下面各表为全部站点合并后的结果"""
+        self.log("\n## 各站点访问汇总\n")
+        self.log("| 站点 | 请求次数 | 独立IP数 | 4xx/5xx次数 | 响应大小合计 |")
+        self.log("|------|----------|----------|-------------|--------------|")
+        for site, requests, unique_ips, errors, size_sum in self.records.site_summary():
+            self.log(f"| {site or '-'} | {requests} | {unique_ips} | {errors} | {size_sum} |")
 
     def display_summary_table(self):
-        if not self.records:
+        if not self.record_count():
             self.log("没有找到匹配的记录。")
             return
 
-        normal_ip_data = defaultdict(lambda: {
-            'count': 0, 
-            'user_agents': set(),
-            'request_types': set(),
-            'status_codes': set(),
-            'response_sizes': []
-        })
-        crawler_ip_data = defaultdict(lambda: {
-            'count': 0, 
-            'user_agents': set(),
-            'request_types': set(),
-            'status_codes': set(),
-            'response_sizes': []
-        })
-
-        for record in self.records:
-            ip = record['IP地址']
-            if ip in self.whitelist:
-                continue  # 排除白名单中的IP
-            data = crawler_ip_data[ip] if record['是爬虫'] else normal_ip_data[ip]
-            data['count'] += 1
-            data['user_agents'].add(record['用户代理'])
-            data['request_types'].add(record['请求类型'])
-            data['status_codes'].add(record['状态码'])
-            data['response_sizes'].append(int(record['响应大小']))
+        # 排除白名单中的IP
+        normal_ip_data = self.records.ip_summary(self.whitelist.__contains__, False, 20)
+        crawler_ip_data = self.records.ip_summary(self.whitelist.__contains__, True, 20)
 
         self.log("\n## 普通IP访问汇总（前20个IP）\n")
         self._display_ip_table(normal_ip_data)
@@ -138,163 +405,268 @@ class LogAnalyzer:
         self._display_ip_table(crawler_ip_data)
 
     def _display_ip_table(self, ip_data):
-        self.log("| IP地址 | 访问次数 | 用户代理 | 请求类型 | 状态码 | 平均响应大小 |")
-        self.log("|--------|----------|----------|----------|--------|--------------|")
-        for ip, data in sorted(ip_data.items(), key=lambda x: x[1]['count'], reverse=True)[:20]:
-            user_agents = ', '.join(data['user_agents'])
-            request_types = ', '.join(data['request_types'])
-            status_codes = ', '.join(data['status_codes'])
-            avg_response_size = sum(data['response_sizes']) / len(data['response_sizes'])
-            
-            self.log(f"| {ip} | {data['count']} | {user_agents} | {request_types} | {status_codes} | {avg_response_size:.0f} |")
+        sites = self.ip_site_names(ip for ip, *_ in ip_data)
+        self.log("| IP地址 | 站点 | 访问次数 | 用户代理 | 请求类型 | 状态码 | 平均响应大小 |")
+        self.log("|--------|------|----------|----------|----------|--------|--------------|")
+        for ip, count, user_agents, request_types, status_codes, avg_response_size in ip_data:
+            user_agents = ', '.join(user_agents)
+            request_types = ', '.join(request_types)
+            status_codes = ', '.join(status_codes)
+
+            self.log(f"| {ip} | {sites.get(ip, '')} | {count} | {user_agents} | {request_types} | {status_codes} | {avg_response_size:.0f} |")
 
     def display_top_urls(self):
-        self.log("\n## 访问次数最多的前20个URL\n")
-        self.log("| URL | 访问次数 |")
-        self.log("|-----|----------|")
-        for url, count in self.url_counter.most_common(20):
-            self.log(f"| {url} | {count} |")
+        # 按路由模板统计（/video/{id}.html），同一页面的不同编号、查询参数合并为一行
+        self.log("\n## 访问次数最多的前20个路由\n")
+        self.log("| 站点 | 路由 | 访问次数 | 响应大小合计 | 4xx/5xx次数 |")
+        self.log("|------|------|----------|--------------|-------------|")
+        for site, route, count, size_sum, errors in self.records.route_summary(20):
+            self.log(f"| {site or '-'} | {route} | {count} | {size_sum} | {errors} |")
+        self.log("\n" + "="*50 + "\n")  # 添加分隔符
+
+    def display_latency(self):
+        if not self.latency.routes:
+            return
+        self.log("")
+        for line in latency_report(self.latency):
+            self.log(line)
         self.log("\n" + "="*50 + "\n")  # 添加分隔符
 
     def analyze_high_frequency_ips(self):
-        ip_time_requests = defaultdict(lambda: defaultdict(int))
-        ip_is_crawler = {}
-        for record in self.records:
-            ip = record['IP地址']
-            ip_is_crawler[ip] = record['是爬虫']
-            try:
-                record_time = datetime.strptime(record['时间'], '%d/%b/%Y:%H:%M:%S %z')
-            except ValueError:
-                record_time = datetime.strptime(record['时间'], '%d/%b/%Y:%H:%M:%S')
-                record_time = record_time.replace(tzinfo=timezone.utc)
-            minute_key = record_time.strftime('%Y-%m-%d %H:%M')
-            ip_time_requests[ip][minute_key] += 1
-
-        high_frequency_ips = []
-        banned_ips = []
-        for ip, time_requests in ip_time_requests.items():
-            max_requests = max(time_requests.values())
-            if max_requests > 30 and ip not in self.whitelist and not ip_is_crawler[ip]:
-                high_frequency_ips.append((ip, max_requests, ip_is_crawler[ip]))
-                if max_requests > 70:
-                    banned_ips.append(ip)
-                    self.ban_ip(ip)
-                    self.record_severe_risk_ip(ip)
+        banned_ips = self.banned_ips
+        high_frequency_ips = list(self.rate_detector.triggered(HIGH_FREQUENCY_RULE.name).items())
+        sites = self.ip_site_names(banned_ips + [ip for ip, _ in high_frequency_ips])
 
         if banned_ips:
             self.log("\n## 自动封禁的高频率访问IP（每分钟请求超过70次）\n")
             self.log(f"共封禁 {len(banned_ips)} 个IP地址：")
             for ip in banned_ips:
-                self.log(f"- {ip}")
+                self.log(f"- {ip}（站点: {sites.get(ip, '-')}）")
             self.log("\n" + "="*50 + "\n")  # 添加分隔符
 
         if high_frequency_ips:
             self.log("\n## 高频率访问IP汇总（每分钟请求次数超过30次）\n")
-            self.log("| IP地址 | 最高每分钟请求次数 |")
-            self.log("|--------|---------------------|")
-            for ip, max_requests, is_crawler in sorted(high_frequency_ips, key=lambda x: x[1], reverse=True):
-                ip_display = f"{ip} (爬虫)" if is_crawler else ip
-                self.log(f"| {ip_display} | {max_requests} |")
+            self.log("| IP地址 | 站点 | 最高每分钟请求次数 |")
+            self.log("|--------|------|---------------------|")
+            for ip, max_requests in sorted(high_frequency_ips, key=lambda x: x[1], reverse=True):
+                self.log(f"| {ip} | {sites.get(ip, '')} | {max_requests} |")
         else:
             self.log("\n暂时没有超过每分钟请求次数阈值的IP。")
 
-    def ban_ip(self, ip):
+    def ban_ips(self, ips):
         try:
-            subprocess.run(
-                ["sudo", "fail2ban-client", "set", "fail2ban-nginx-cc", "banip", ip],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
+            new_ips = self.ban_backend.ban(ips)
         except subprocess.CalledProcessError as e:
-            self.log(f"封禁IP {ip} 时出错: {e}")
+            self.log(f"封禁IP时出错（{self.ban_backend.name}）: {e}\n{e.stderr.strip() if e.stderr else ''}")
         except Exception as e:
-            self.log(f"执行封禁IP {ip} 时出现未预料的错误: {e}")
-
-    def record_severe_risk_ip(self, ip):
-        existing_ips = set()
-        try:
-            with open(self.severe_risk_log, 'r') as f:
-                existing_ips = set(line.strip() for line in f)
-        except FileNotFoundError:
-            pass
-
-        if ip not in existing_ips:
-            with open(self.severe_risk_log, 'a') as f:
-                f.write(f"{ip}\n")
-            self.log(f"已将IP {ip} 记录到高风险IP日志文件。")
+            self.log(f"执行封禁时出现未预料的错误（{self.ban_backend.name}）: {e}")
         else:
-            self.log(f"IP {ip} 已存在于高风险IP日志文件中，跳过记录。")
+            self.log(f"已通过 {self.ban_backend.name} 封禁 {len(new_ips)} 个IP，"
+                     f"{len(ips) - len(new_ips)} 个已在封禁列表中。")
+
+    def record_severe_risk_ips(self, ips):
+        new_ips = set(self.risk_store.record_many(ips, '严重', 'web_log_monitor'))
+        for ip in ips:
+            if ip in new_ips:
+                self.log(f"已将IP {ip} 记录到高风险IP数据库。")
+            else:
+                self.log(f"IP {ip} 已存在于高风险IP数据库中，更新最近出现时间。")
 
     def analyze_suspicious_ips(self):
-        ip_time_requests = defaultdict(list)
-        for record in self.records:
-            ip = record['IP地址']
-            if not self.ip_pattern.match(ip) or record['是爬虫'] or ip in self.whitelist:
-                continue
-            try:
-                record_time = datetime.strptime(record['时间'], '%d/%b/%Y:%H:%M:%S %z')
-            except ValueError:
-                record_time = datetime.strptime(record['时间'], '%d/%b/%Y:%H:%M:%S')
-                record_time = record_time.replace(tzinfo=timezone.utc)
-            ip_time_requests[ip].append(record_time)
-
-        suspicious_ips = []
-        for ip, times in ip_time_requests.items():
-            times.sort()
-            for i in range(len(times) - 70):
-                if times[i+69] - times[i] <= timedelta(minutes=5):
-                    suspicious_ips.append(ip)
-                    break
+        suspicious_ips = [ip for ip in self.rate_detector.triggered(SUSPICIOUS_RULE.name) if self.ip_pattern.match(ip)]
 
         if suspicious_ips:
+            sites = self.ip_site_names(suspicious_ips)
             self.log("\n## 可疑IP列表（5分钟内访问次数超过70次，不包括爬虫和白名单IP）\n")
             self.log(f"共发现 {len(suspicious_ips)} 个可疑IP地址：")
             for ip in suspicious_ips:
-                self.log(f"- {ip}")
+                self.log(f"- {ip}（站点: {sites.get(ip, '-')}）")
             self.log("\n" + "="*50 + "\n")  # 添加分隔符
         else:
             self.log("\n暂时没有发现可疑IP。")
 
     def display_error_status_ips(self):
-        error_ip_data = defaultdict(lambda: defaultdict(int))
-        
-        for record in self.records:
-            status_code = int(record['状态码'])
-            ip = record['IP地址']
-            
-            if 400 <= status_code < 600 and ip not in self.whitelist:
-                error_ip_data[ip][status_code] += 1
-
-        ip_total_errors = {
-            ip: sum(status_counts.values()) 
-            for ip, status_counts in error_ip_data.items()
-        }
-        
-        top_15_ips = sorted(ip_total_errors.items(), key=lambda x: x[1], reverse=True)[:15]
-        
+        top_15_ips = self.records.error_status_counts(self.whitelist.__contains__, 15)
+        sites = self.ip_site_names(ip for ip, _ in top_15_ips)
+
         self.log("\n## 状态码为4xx或5xx的IP汇总（前15个）\n")
-        self.log("| IP地址 | 状态码 | 次数 |")
-        self.log("|--------|--------|------|")
-        
-        for ip, _ in top_15_ips:
-            status_counts = error_ip_data[ip]
-            for status, count in sorted(status_counts.items()):
-                self.log(f"| {ip} | {status} | {count} |")
+        self.log("| IP地址 | 站点 | 状态码 | 次数 |")
+        self.log("|--------|------|--------|------|")
+
+        for ip, status_counts in top_15_ips:
+            for status, count in status_counts:
+                self.log(f"| {ip} | {sites.get(ip, '')} | {status} | {count} |")
+
+    def run_reports(self):
+        self.display_site_summary()
+        self.display_summary_table()
+        self.display_top_urls()
+        self.display_latency()
+        self.analyze_high_frequency_ips()
+        self.analyze_suspicious_ips()
+        self.display_error_status_ips()
 
     def close(self):
+        self.risk_store.close()
         self.output_file.close()
 
+class LogDaemon:
+    """
+    守护模式：像 tail -F 一样持续跟踪日志，每条记录到达时更新频率检测，
+    达到封禁阈值后几秒内就封禁，而不必等下一次 cron 运行。
+    """
+
+    def __init__(self, analyzer, log_files, poll_interval=0.5, status_interval=60, status_file=None):
+        self.analyzer = analyzer
+        self.log_files = log_files
+        self.poll_interval = poll_interval
+        self.status_interval = status_interval
+        self.status_file = status_file
+        self.stats = TailStats()
+        self.banned = 0
+        self.loop = None
+        self.verify_task = None
+        # 封禁命令较慢，放到单独的线程按顺序执行，不阻塞日志跟踪
+        self.ban_executor = ThreadPoolExecutor(max_workers=1)
+        # 长期运行只保留窗口内的状态，IP 离开窗口后再次超限会重新触发
+        analyzer.rate_detector = RateDetector([HIGH_FREQUENCY_RULE, BAN_RULE, SUSPICIOUS_RULE],
+                                              self.on_rate_trigger, forget_expired=True)
+
+    def on_rate_trigger(self, rule, ip, epoch, count):
+        lag = max(time.time() - epoch, 0.0)
+        when = datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S')
+        if rule is BAN_RULE:
+            self.banned += 1
+            self.analyzer.log(f"[{when}] 封禁IP {ip}：{rule.window}秒内 {count} 次请求，延迟 {lag:.1f} 秒")
+            self.analyzer.pending_bans.append(ip)
+        elif rule is HIGH_FREQUENCY_RULE:
+            self.analyzer.log(f"[{when}] 高频率访问IP {ip}：{rule.window}秒内 {count} 次请求")
+        elif self.analyzer.ip_pattern.match(ip):
+            self.analyzer.log(f"[{when}] 可疑IP {ip}：{rule.window}秒内 {count} 次请求")
+
+    async def follow_file(self, path):
+        self.analyzer.log(f"开始跟踪日志文件: {path}")
+        async for lines in follow(path, self.poll_interval):
+            for line in lines:
+                record = parse_line(line)
+                if record is None:
+                    self.stats.observe(1)
+                    continue
+                try:
+                    epoch = record.epoch
+                except ValueError:
+                    # 格式匹配但时间无法解析，按无法匹配的行处理，不中断跟踪
+                    self.analyzer.on_unmatched(line)
+                    self.stats.observe(1)
+                    continue
+                simplified_ua, is_crawler = ua_cache.classify(record.user_agent, self.analyzer.ua_stats)
+                self.analyzer.track_rate(record.ip, epoch, is_crawler, simplified_ua)
+                self.stats.observe(1, epoch)
+            self.submit_bans()
+            if self.analyzer.bot_claims and (self.verify_task is None or self.verify_task.done()):
+                self.verify_task = asyncio.create_task(self.verify_bots())
+
+    def submit_bans(self):
+        # 本批日志行触发的封禁合并为一次提交
+        ips = self.analyzer.take_pending_bans()
+        if ips:
+            future = self.loop.run_in_executor(self.ban_executor, self.analyzer.apply_bans, ips)
+            future.add_done_callback(self.on_bans_done)
+
+    def on_bans_done(self, future):
+        # 后台线程中的异常（例如高风险IP数据库被锁）不会自动抛出，需要主动取出并记录
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self.analyzer.log(f"提交封禁时出错: {error!r}")
+
+    async def verify_bots(self):
+        """在后台验证自称爬虫的IP，同一时间只有一批在验证；验证期间新出现的IP留到下一批"""
+        verifier = self.analyzer.bot_verifier
+        results = await verifier.verify_async(dict(self.analyzer.bot_claims))
+        self.analyzer.apply_bot_results(results)
+        for ip in results:
+            if results[ip] is False:
+                bot, host = verifier.spoofed.get(ip, ('', ''))
+                self.analyzer.log(f"冒充爬虫的IP {ip}：自称 {bot}，反向解析 {host or '无'}")
+        self.submit_bans()
+
+    async def report_status(self):
+        while True:
+            await asyncio.sleep(self.status_interval)
+            status = self.stats.snapshot()
+            status['active_ips'] = self.analyzer.rate_detector.active_ips()
+            status['banned'] = self.banned
+            # 长期运行时 analyze_logs.txt 会无限增长，每个区间从状态行开始重写（完整输出仍在标准输出）
+            self.analyzer.truncate_output()
+            self.analyzer.log(
+                f"[状态] 已处理 {status['lines']} 行，{status['lines_per_sec']} 行/秒，"
+                f"延迟 {status['lag']} 秒（区间最大 {status['max_lag']} 秒），"
+                f"活跃IP {status['active_ips']} 个，已封禁 {status['banned']} 个")
+            self.analyzer.output_file.flush()
+            if self.status_file:
+                self.write_status(status)
+
+    def write_status(self, status):
+        tmp_path = self.status_file + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(status, f)
+            os.replace(tmp_path, self.status_file)
+        except OSError as e:
+            self.analyzer.log(f"写入状态文件 {self.status_file} 时出错: {e}")
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        tasks = [asyncio.create_task(self.follow_file(path)) for path in self.log_files]
+        tasks.append(asyncio.create_task(self.report_status()))
+        main_task = asyncio.current_task()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(sig, main_task.cancel)
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            self.analyzer.log("守护模式已停止。")
+        finally:
+            if self.analyzer.bot_verifier:
+                self.analyzer.bot_verifier.save()
+            self.ban_executor.shutdown(wait=True)
+
 def main():
+    parser = argparse.ArgumentParser(description="Web访问日志监控")
+    add_engine_arguments(parser, CHECKPOINT_FILE)
+    add_ua_cache_arguments(parser)
+    add_ban_arguments(parser)
+    add_bot_verifier_arguments(parser)
+    parser.add_argument('--daemon', action='store_true', help='守护模式：持续跟踪日志并实时封禁，不生成报表')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='守护模式下检查日志新内容的间隔（秒）')
+    parser.add_argument('--status-interval', type=float, default=60, help='守护模式下输出运行状态的间隔（秒）')
+    parser.add_argument('--status-file', default=STATUS_FILE, help=f'守护模式的状态文件（默认 {STATUS_FILE}）')
+    args = parser.parse_args()
+
     analyzer = LogAnalyzer()
+    analyzer.ban_backend = ban_backend_from_args(args)
+    analyzer.bot_verifier = bot_verifier_from_args(args)
+    if args.daemon:
+        cache_path = ua_cache_path(args)
+        try:
+            analyzer.warm_ua_cache(cache_path)
+            # 守护模式只跟踪正在写入的日志，轮转后的旧文件不会再增长
+            args.include_rotated = False
+            daemon = LogDaemon(analyzer, log_paths_from_args(analyzer.log_files, args), args.poll_interval,
+                               args.status_interval, args.status_file)
+            asyncio.run(daemon.run())
+        finally:
+            analyzer.finish_ua_cache(cache_path)
+            analyzer.close()
+        return
+
     try:
-        analyzer.parse_logs()
-        analyzer.display_summary_table()
-        analyzer.display_top_urls()
-        analyzer.analyze_high_frequency_ips()
-        analyzer.analyze_suspicious_ips()
-        analyzer.display_error_status_ips()
+        analyzer.parse_logs(args)
+        analyzer.run_reports()
     except Exception as e:
         analyzer.log(f"发生错误：{str(e)}")
     finally:
@@ -86,7 +86,7 @@ install_dependencies() {
     
     # 安装 Python 依赖库
     echo "正在检查并安装 Python 依赖库..."
-    pip3 install --upgrade ua-parser geoip2 requests
+    pip3 install --upgrade ua-parser geoip2 requests numpy
     
     # 创建必要的目录和文件
     echo "正在检查并创建必要的目录和文件..."
@@ -106,6 +106,25 @@ install_dependencies() {
         "web_log_monitor.py"
         "logcheck.py"
         "ban_severe_risk_ips.py"
+        "log_engine.py"
+        "checkpoint.py"
+        "log_pipeline.py"
+        "record_store.py"
+        "rate_detector.py"
+        "log_tail.py"
+        "ban_backend.py"
+        "risk_store.py"
+        "ip_matcher.py"
+        "geoip_cache.py"
+        "aggregate_store.py"
+        "parse_cache.py"
+        "hyperloglog.py"
+        "fleet.py"
+        "log_discovery.py"
+        "bot_verifier.py"
+        "routes.py"
+        "latency.py"
+        "log_merge.py"
         "run_log_check_and_ban.sh"
     )
     
@@ -176,7 +195,7 @@ set_cron_job() {
     # 检查是否已存在相同的定时任务
     if crontab -l | grep -q 'run_log_check_and_ban.sh'; then
         echo "定时任务已存在。每天的 10:00、14:00 和 17:00 执行"
-        echo "风险IP保存在 /root/logcheck/severe_risk_ips.log"
+        echo "风险IP保存在 /root/logcheck/risk_ips.db（默认7天未再出现自动解封）"
         echo "按 Enter 键继续..."
         read
         return
@@ -202,7 +221,7 @@ set_cron_job() {
     if (crontab -l ; echo "0 10,14,17 * * * /root/logcheck/run_log_check_and_ban.sh >> /root/logcheck/cron_run.log 2>&1") | crontab -; then
         echo "定时任务已设置。每天的 10:00、14:00 和 17:00 执行"
         echo "任务将执行 run_log_check_and_ban.sh 脚本"
-        echo "风险IP将保存在 /root/logcheck/severe_risk_ips.log"
+        echo "风险IP将保存在 /root/logcheck/risk_ips.db（默认7天未再出现自动解封）"
     else
         echo "设置定时任务失败，请检查您的crontab权限。"
     fi
@@ -264,6 +283,17 @@ update_python_scripts() {
     else
         echo "警告：$REPORT_PATH/logcheck.py 文件不存在。"
     fi
+
+    # 更新 log_pipeline.py
+    if [ -f "$REPORT_PATH/log_pipeline.py" ]; then
+        local pipeline_paths_string=""
+        for path in "${LOG_PATHS[@]}"; do
+            pipeline_paths_string+="    \"$path\",\n"
+        done
+        sed -i "/LOG_PATHS = \[/,/\]/c\LOG_PATHS = [\n$pipeline_paths_string    # 在这里添加更多日志文件路径\n]" "$REPORT_PATH/log_pipeline.py"
+    else
+        echo "警告：$REPORT_PATH/log_pipeline.py 文件不存在。"
+    fi
 }
 
 # 添加或更改日志路径
@@ -7,6 +7,12 @@ echo "=== 高峰期需求估算 ==="
 CURRENT_MAX=$(netstat -tn | grep -v 15.24.6.161 | awk '{print $5}' | cut -d: -f1 | sort | uniq -c | sort -nr | head -1 | awk '{print $1}')
 echo "当前最高连接数: $CURRENT_MAX"
 
+# 近7天每分钟请求峰值，直接读取 log_pipeline.py 增量模式写入的聚合统计，不重新扫描访问日志
+if [ -f /root/logcheck/log_aggregates.db ] && [ -f /root/logcheck/aggregate_store.py ]; then
+    PEAK_RPM=$(python3 /root/logcheck/aggregate_store.py --peak --days 7 2>/dev/null)
+    echo "近7天每分钟请求峰值: ${PEAK_RPM:-未知}"
+fi
+
 # 估算高峰期可能的连接数
 ESTIMATED_PEAK_2X=$((CURRENT_MAX * 2))
 ESTIMATED_PEAK_3X=$((CURRENT_MAX * 3))